@@ -0,0 +1,46 @@
+from django.db import migrations
+
+# (name, table, expression) for the prefix search keys in app.authapp.search
+# and the case-insensitive email lookup of bulk invites
+POSTGRES_INDEXES = [
+    ("authapp_user_username_prefix", "authapp_user", '(lower("username") COLLATE "C")'),
+    ("authapp_profile_display_prefix", "authapp_userprofile", '(lower("display_name") COLLATE "C")'),
+    ("authapp_user_email_lower", "authapp_user", '(lower("email"))'),
+]
+SQLITE_INDEXES = [
+    ("authapp_user_username_prefix", "authapp_user", '(lower("username"))'),
+    ("authapp_profile_display_prefix", "authapp_userprofile", '(lower("display_name"))'),
+    ("authapp_user_email_lower", "authapp_user", '(lower("email"))'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        # CONCURRENTLY: no write lock on the user table while it builds
+        for name, table, expression in POSTGRES_INDEXES:
+            schema_editor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "{table}" ({expression})')
+    elif vendor == "sqlite":
+        for name, table, expression in SQLITE_INDEXES:
+            schema_editor.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({expression})')
+
+
+def drop_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    concurrently = " CONCURRENTLY" if vendor == "postgresql" else ""
+    if vendor in ("postgresql", "sqlite"):
+        for name, _, _ in POSTGRES_INDEXES:
+            schema_editor.execute(f'DROP INDEX{concurrently} IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('authapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,64 @@
+"""
+Username / display name prefix search for the invite autocomplete.
+
+A prefix is matched as a range on an expression index, key >= q and
+key < successor(q), and read back in key order, so each lookup is a short
+index range scan that stops after `limit` rows whatever the table size.
+The key is lower(column), in the "C" collation on Postgres so that
+byte order, the range bounds and ORDER BY all agree (and the index is
+used even when the database collation is not C). Migration 0002 creates
+the matching indexes.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import F
+from django.db.models.functions import Collate, Lower
+from .models import UserProfile
+
+User = get_user_model()
+
+# the slim user payload (app.squads.slim.user_payload)
+PAYLOAD_FIELDS = ("id", "username", "display_name", "total_points")
+
+def prefix_successor(prefix):
+    # the smallest string greater than every string starting with prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def prefix_key(field, using):
+    key = Lower(field)
+    if connections[using].vendor == "postgresql":
+        key = Collate(key, "C")
+    return key
+
+def _matches(queryset, field, prefix, limit, **fields):
+    return list(
+        queryset.annotate(key=prefix_key(field, queryset.db))
+        .filter(key__gte=prefix, key__lt=prefix_successor(prefix))
+        .order_by("key")
+        .values("key", **fields)[:limit]
+    )
+
+def search_users(query, limit):
+    """
+    Up to `limit` active users whose username or display name starts with
+    query (case-insensitive), in key order. Two index range scans; the
+    display name one starts from the profile table so it can walk its index.
+    """
+    prefix = query.strip().lower()
+    if not prefix:
+        return []
+    rows = _matches(
+        User.objects.filter(is_active=True), "username", prefix, limit,
+        uid=F("pk"), name=F("username"),
+        display=F("profile__display_name"), points=F("profile__total_points"),
+    ) + _matches(
+        UserProfile.objects.filter(user__is_active=True), "display_name", prefix, limit,
+        uid=F("user_id"), name=F("user__username"),
+        display=F("display_name"), points=F("total_points"),
+    )
+    seen, results = set(), []
+    for row in sorted(rows, key=lambda r: (r["key"], r["uid"])):
+        if row["uid"] not in seen:
+            seen.add(row["uid"])
+            results.append(dict(zip(PAYLOAD_FIELDS, (row["uid"], row["name"], row["display"], row["points"]))))
+    return results[:limit]
@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from app.common import throttling
+from .models import UserProfile
+
+User = get_user_model()
+
+
+@override_settings(THROTTLE_ENABLED=False)
+class UserSearchTests(TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(username="me", password="x")
+        for name in ("alice", "Alicia", "bob", "carol"):
+            User.objects.create_user(username=name, password="x")
+        UserProfile.objects.filter(user__username="bob").update(display_name="Al Bundy")
+        User.objects.create_user(username="alina", password="x", is_active=False)
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def search(self, **params):
+        resp = self.client.get("/api/auth/users/search/", params)
+        self.assertEqual(resp.status_code, 200)
+        return [row["username"] for row in resp.json()["results"]]
+
+    def test_prefix_of_username_or_display_name(self):
+        # "al bundy" < "alice" < "alicia"; inactive users never match
+        self.assertEqual(self.search(q="AL"), ["bob", "alice", "Alicia"])
+        self.assertEqual(self.search(q="alic"), ["alice", "Alicia"])
+        self.assertEqual(self.search(q="lice"), [])
+        self.assertEqual(self.search(q="  "), [])
+        self.assertEqual(self.search(), [])
+
+    def test_payload(self):
+        resp = self.client.get("/api/auth/users/search/", {"q": "bob"})
+        [row] = resp.json()["results"]
+        self.assertEqual(set(row), {"id", "username", "display_name", "total_points"})
+        self.assertEqual(row["display_name"], "Al Bundy")
+
+    @override_settings(USER_SEARCH_MAX_RESULTS=20)
+    def test_limit(self):
+        User.objects.bulk_create([User(username=f"runner{i:02}") for i in range(25)])
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, display_name=user.username) for user in User.objects.filter(username__startswith="runner")
+        ])
+        self.assertEqual(self.search(q="runner", limit=5), [f"runner{i:02}" for i in range(5)])
+        self.assertEqual(len(self.search(q="runner", limit=100)), 20)
+        self.assertEqual(len(self.search(q="runner", limit="many")), 10)
+        self.assertEqual(len(self.search(q="runner", limit=0)), 1)
+
+
+@override_settings(THROTTLE_BUCKETS={"user": (0.001, 100), "autocomplete": (0.001, 2)})
+class UserSearchThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttling._local_buckets.clear()
+
+    def test_autocomplete_scope(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="me", password="x"))
+        codes = [client.get("/api/auth/users/search/", {"q": "a"}).status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+        # its own bucket: the rest of the API still answers
+        self.assertEqual(client.get("/api/runs/weekly/").status_code, 200)
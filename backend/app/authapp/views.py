@@ -1,7 +1,9 @@
-from rest_framework import generics, permissions
+from django.conf import settings
+from rest_framework import generics, permissions, response
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
+from .search import search_users
 from .serializers import RegisterSerializer, UserProfileSerializer
 
 User = get_user_model()
@@ -38,3 +40,19 @@ class MeProfileView(generics.RetrieveAPIView):
 
     def get_object(self):
         return self.request.user.profile
+
+class UserSearchView(generics.GenericAPIView):
+    """
+    Autocomplete for invites: ?q=<prefix>&limit=<n>, matched against
+    usernames and display names.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = "autocomplete"
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            limit = 10
+        limit = max(1, min(limit, settings.USER_SEARCH_MAX_RESULTS))
+        return response.Response({"results": search_users(request.query_params.get("q", ""), limit)})
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import OperationalError, connections, transaction
+from django.utils.functional import cached_property
+
+# below this many rows an exact COUNT(*) is cheap enough
+EXACT_COUNT_BELOW = 100_000
+
+def estimated_row_count(model, using):
+    """
+    Planner estimate of a table's row count (pg_class.reltuples), or None
+    off Postgres / before the table has been analyzed.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if not row or row[0] < 0:
+        return None
+    return row[0]
+
+def timed_count(queryset, fallback):
+    """
+    Exact count, abandoned after ADMIN_COUNT_TIMEOUT_MS on Postgres in
+    favour of fallback.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql" or fallback is None:
+        return queryset.count()
+    try:
+        with transaction.atomic(using=queryset.db):
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", [settings.ADMIN_COUNT_TIMEOUT_MS])
+            return queryset.count()
+    except OperationalError:
+        return fallback
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Changelist paginator for tables with tens of millions of rows. The
+    unfiltered list uses the planner's estimate instead of COUNT(*); a
+    filtered one counts exactly unless that takes too long.
+    """
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        estimate = estimated_row_count(qs.model, qs.db)
+        if estimate is not None and estimate >= EXACT_COUNT_BELOW and not qs.query.where:
+            return estimate
+        return timed_count(qs, estimate)
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base for admins over big, append-heavy tables: estimated counts, no
+    second "show all" count, and ordering by the primary key index.
+    Subclasses should still set list_select_related and raw_id/autocomplete
+    fields so rows never trigger per-row FK lookups or giant <select>s.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    ordering = ['-id']
@@ -0,0 +1,121 @@
+"""
+Helpers for async (non-DRF) views served on the ASGI stack.
+
+DRF's APIView is sync only, so the hot read endpoints have plain Django
+async view counterparts that authenticate with the same JWTs and answer
+with the same payloads. They reach the database through the async ORM,
+except where a payload comes from the response cache or a single-flight
+cache (squad goal, global leaderboard): a miss there waits on a lock, so
+those views run the sync code in a worker thread via sync_to_async.
+"""
+import functools
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, Http404
+from rest_framework import exceptions, status
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .renderers import negotiate
+from .throttling import caller_scopes, check_buckets
+
+User = get_user_model()
+
+_jwt = JWTAuthentication()
+def render_response(request, data, status=status.HTTP_200_OK, headers=None):
+    """
+    data as JSON or MessagePack, per the request's Accept header (see
+    app.common.renderers.negotiate).
+    """
+    renderer, media_type = negotiate(request)
+    return HttpResponse(
+        renderer.render(data, media_type),
+        status=status,
+        content_type=media_type,
+        headers=headers,
+    )
+
+async def aauthenticate(request):
+    """
+    Async JWTAuthentication.authenticate: token validation is pure CPU,
+    only the user lookup touches the database. Returns None when no token
+    was sent, raises AuthenticationFailed for bad tokens or users.
+    """
+    header = _jwt.get_header(request)
+    if header is None:
+        return None
+    raw_token = _jwt.get_raw_token(header)
+    if raw_token is None:
+        return None
+    token = _jwt.get_validated_token(raw_token)
+    try:
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise exceptions.AuthenticationFailed("Token contained no recognizable user identification")
+
+    user = await User.objects.select_related("profile").filter(
+        **{jwt_settings.USER_ID_FIELD: user_id}
+    ).afirst()
+    if user is None:
+        raise exceptions.AuthenticationFailed("User not found", code="user_not_found")
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed("User is inactive", code="user_inactive")
+    return user
+
+def _error_response(request, exc):
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else {"detail": exc.detail}
+    headers = None
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        headers = {"WWW-Authenticate": _jwt.authenticate_header(None)}
+    if getattr(exc, "wait", None) is not None:
+        headers = {"Retry-After": str(int(exc.wait + 0.999))}
+    return render_response(request, data, status=exc.status_code, headers=headers)
+
+def async_api_view(view=None, *, throttle_scope=None):
+    """
+    Restrict an async view to reads, authenticate and throttle it like
+    IsAuthenticated DRF views (TokenBucketThrottle) and turn Http404 /
+    APIException into the same error bodies. Use bare or as
+    @async_api_view(throttle_scope="...").
+    """
+    if view is None:
+        return functools.partial(async_api_view, throttle_scope=throttle_scope)
+
+    @functools.wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        try:
+            if request.method not in ("GET", "HEAD"):
+                raise exceptions.MethodNotAllowed(request.method)
+            user = await aauthenticate(request)
+            if user is None:
+                raise exceptions.NotAuthenticated()
+            request.user = user
+            wait = await sync_to_async(check_buckets)(caller_scopes(throttle_scope), f"u{user.pk}")
+            if wait is not None:
+                raise exceptions.Throttled(wait)
+            return await view(request, *args, **kwargs)
+        except Http404 as exc:
+            return render_response(request, {"detail": str(exc) or "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        except exceptions.APIException as exc:
+            return _error_response(request, exc)
+    return wrapped
+
+async def aget_object_or_404(queryset, **kwargs):
+    obj = await queryset.filter(**kwargs).afirst()
+    if obj is None:
+        raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+    return obj
+
+def async_reads(async_get, sync_view):
+    """
+    Serve GET from async_get and every other method from the existing DRF
+    view, so a route can go async for reads without touching its writes.
+    """
+    sync_view_async = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        if request.method == "GET":
+            return await async_get(request, *args, **kwargs)
+        return await sync_view_async(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
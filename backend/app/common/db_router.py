@@ -0,0 +1,168 @@
+import contextlib
+import contextvars
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = "replica"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# alias reads should go to for the current request / task; None means primary
+_read_alias = contextvars.ContextVar("read_alias", default=None)
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+@contextlib.contextmanager
+def use_replica():
+    token = _read_alias.set(REPLICA_DB_ALIAS)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+@contextlib.contextmanager
+def use_primary():
+    """
+    Force every read inside the block onto the primary. Use for code that
+    reads then writes based on what it read (closeout, purchases).
+    """
+    token = _read_alias.set(DEFAULT_DB_ALIAS)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+class PrimaryReplicaRouter:
+    """
+    Writes always go to the primary. Reads go to the replica only inside
+    use_replica() (set per request by ReplicaRoutingMiddleware) and never
+    while a transaction is open on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _read_alias.get() != REPLICA_DB_ALIAS or not replica_configured():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # both aliases hold the same data
+        return True
+
+def _token_user_id(raw):
+    # simplejwt's token classes load only when a replica is configured
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+    try:
+        return AccessToken(raw).get(api_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+def _bearer_user_id(request):
+    scheme, _, raw = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+    return _token_user_id(raw.strip()) if raw else None
+
+def _issued_user_id(response):
+    """
+    Login and token refresh answer with a new access token: pin its user,
+    whose next request is the first one to carry it.
+    """
+    data = getattr(response, "data", None)
+    if isinstance(data, dict) and isinstance(data.get("access"), str):
+        return _token_user_id(data["access"])
+    return None
+
+def pin_key(user_id):
+    """
+    Pins are per user, not per credential, so a refreshed token or a new
+    login still lands on the primary after that user's last write.
+    """
+    return f"db-pin:{user_id}"
+
+def request_user_id(request):
+    """
+    Who is calling: the user in a valid bearer token for API clients, the
+    session user for the admin (the views have authenticated by the time
+    a response exists, and DRF and login() both set request.user).
+    Anonymous requests are never pinned.
+    """
+    user_id = _bearer_user_id(request)
+    if user_id is None:
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            user_id = user.pk
+    return user_id
+
+async def arequest_user_id(request):
+    user_id = _bearer_user_id(request)
+    if user_id is None and hasattr(request, "auser"):
+        user = await request.auser()
+        if user.is_authenticated:
+            user_id = user.pk
+    return user_id
+
+def written_user_ids(user_id, response):
+    return {user_id, _issued_user_id(response)} - {None}
+
+class ReplicaRoutingMiddleware:
+    """
+    Send safe requests to the read replica, except for users who wrote
+    within the last REPLICA_PIN_SECONDS: those stay on the primary so they
+    always see their own new runs, messages and goals. Signing in counts
+    as a write. Pins live in the default cache, which settings requires to
+    be the shared one (Redis) whenever a replica is configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica_configured():
+            return self.get_response(request)
+
+        if request.method in SAFE_METHODS:
+            user_id = request_user_id(request)
+            if user_id is not None and cache.get(pin_key(user_id)):
+                return self.get_response(request)
+            with use_replica():
+                return self.get_response(request)
+
+        response = self.get_response(request)
+        if response.status_code < 400:
+            cache.set_many(
+                {pin_key(u): 1 for u in written_user_ids(request_user_id(request), response)},
+                settings.REPLICA_PIN_SECONDS,
+            )
+        return response
+
+    async def __acall__(self, request):
+        if not replica_configured():
+            return await self.get_response(request)
+
+        if request.method in SAFE_METHODS:
+            user_id = await arequest_user_id(request)
+            if user_id is not None and await cache.aget(pin_key(user_id)):
+                return await self.get_response(request)
+            with use_replica():
+                return await self.get_response(request)
+
+        response = await self.get_response(request)
+        if response.status_code < 400:
+            await cache.aset_many(
+                {pin_key(u): 1 for u in written_user_ids(await arequest_user_id(request), response)},
+                settings.REPLICA_PIN_SECONDS,
+            )
+        return response
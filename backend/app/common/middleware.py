@@ -0,0 +1,99 @@
+import gzip
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_sequence
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+re_accepts = _lazy_re_compile(r"\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*")
+
+def accepted_encodings(header):
+    encodings = set()
+    for part in header.split(","):
+        m = re_accepts.fullmatch(part)
+        if not m:
+            continue
+        q = m.group(2)
+        try:
+            if q is not None and float(q) <= 0:
+                continue
+        except ValueError:
+            continue
+        encodings.add(m.group(1).lower())
+    return encodings
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Negotiated brotli/gzip compression for API responses.
+
+    Unlike django.middleware.gzip.GZipMiddleware this prefers brotli when
+    the client accepts it and only compresses bodies of at least
+    RESPONSE_COMPRESSION_MIN_BYTES, where the CPU cost actually pays off.
+    Responses that already carry a Content-Encoding (WhiteNoise static
+    files) or are compressed files themselves (gzipped exports) are left
+    alone.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header("Content-Encoding"):
+            return response
+        if response.get("Content-Type", "").startswith("application/gzip"):
+            return response
+        # the body is JSON or MessagePack depending on Accept, compressed
+        # or not; shared caches must key on both, however small the body
+        patch_vary_headers(response, ("Accept",))
+        if response.streaming and getattr(response, "is_async", False):
+            return response
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        accepted = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            return response
+
+        if response.streaming:
+            if encoding == "br":
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers["Content-Length"]
+        else:
+            if encoding == "br":
+                compressed = brotli.compress(
+                    response.content, quality=settings.RESPONSE_COMPRESSION_BROTLI_QUALITY
+                )
+            else:
+                compressed = gzip.compress(
+                    response.content, compresslevel=settings.RESPONSE_COMPRESSION_GZIP_LEVEL, mtime=0
+                )
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(response.content))
+
+        # an ETag names the uncompressed representation
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,139 @@
+import msgpack
+import orjson
+from django.utils.http import parse_header_parameters
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.mediatypes import _MediaType, media_type_matches, order_by_precedence
+
+# datetimes, decimals, lazy strings etc. fall back to DRF's encoder, so
+# they render as rest_framework.renderers.JSONRenderer renders them
+_drf_encoder = JSONEncoder()
+
+# marks a list of dicts sent as {"$columns": {field: [values...]}}
+COLUMNS_KEY = "$columns"
+
+def to_columns(data):
+    """
+    The columnar ("array of fields") layout: every list of two or more
+    dicts with the same keys in the same order becomes one dict of value
+    arrays, recursively, so repeated keys are sent once per list instead
+    of once per row. Anything else is left as it is.
+    """
+    if isinstance(data, dict):
+        return {k: to_columns(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        if len(data) > 1 and isinstance(data[0], dict) and data[0]:
+            keys = tuple(data[0])
+            if all(isinstance(row, dict) and tuple(row) == keys for row in data):
+                return {COLUMNS_KEY: {k: to_columns([row[k] for row in data]) for k in keys}}
+        return [to_columns(v) for v in data]
+    return data
+
+def from_columns(data):
+    """
+    Inverse of to_columns, for clients and tests.
+    """
+    if isinstance(data, dict):
+        if len(data) == 1 and COLUMNS_KEY in data:
+            columns = {k: from_columns(v) for k, v in data[COLUMNS_KEY].items()}
+            return [dict(zip(columns, values)) for values in zip(*columns.values())]
+        return {k: from_columns(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [from_columns(v) for v in data]
+    return data
+
+def wants_columns(accepted_media_type):
+    """
+    Clients opt in per request, e.g. Accept: application/msgpack; layout=columns
+    """
+    if not accepted_media_type:
+        return False
+    _, params = parse_header_parameters(accepted_media_type)
+    return params.get("layout") == "columns"
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Drop-in replacement for DRF's JSONRenderer backed by orjson. The bytes
+    are the same except for floats: ones that need an exponent are spelled
+    1e16 rather than 1e+16 (the same number to any JSON parser), and NaN
+    and infinities render as null, where DRF's strict JSON fails the request.
+    """
+    media_type = "application/json"
+    format = "json"
+    charset = None
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if wants_columns(accepted_media_type):
+            data = to_columns(data)
+        ret = orjson.dumps(data, default=_drf_encoder.default, option=self.options)
+        # escaped like DRF does, for JSON embedded in <script>
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    The same payloads as ORJSONRenderer, as MessagePack: smaller integers
+    and floats, no quoting or escaping. Values JSON has no type for go
+    through the same DRF encoder, so both formats decode to equal data.
+    """
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if wants_columns(accepted_media_type):
+            data = to_columns(data)
+        return msgpack.packb(data, default=_drf_encoder.default, use_bin_type=True)
+
+class ORJSONParser(BaseParser):
+    media_type = "application/json"
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+
+class MessagePackParser(BaseParser):
+    media_type = "application/msgpack"
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f"MessagePack parse error - {str(exc) or type(exc).__name__}")
+
+RENDERERS = (ORJSONRenderer(), MessagePackRenderer())
+
+def negotiate(request):
+    """
+    (renderer, accepted media type) for a plain Django request, picked from
+    RENDERERS the way DRF's DefaultContentNegotiation would (?format=
+    first, then Accept by precedence). Falls back to JSON instead of 406.
+    """
+    fmt = request.GET.get("format")
+    if fmt:
+        for renderer in RENDERERS:
+            if renderer.format == fmt:
+                return renderer, renderer.media_type
+        return RENDERERS[0], RENDERERS[0].media_type
+    accepts = [token.strip() for token in request.META.get("HTTP_ACCEPT", "*/*").split(",")]
+    for media_type_set in order_by_precedence(accepts):
+        for renderer in RENDERERS:
+            for media_type in media_type_set:
+                if media_type_matches(renderer.media_type, media_type):
+                    if _MediaType(media_type).precedence > _MediaType(renderer.media_type).precedence:
+                        return renderer, media_type
+                    return renderer, renderer.media_type
+    return RENDERERS[0], RENDERERS[0].media_type
@@ -0,0 +1,202 @@
+"""
+Tag-invalidated response cache for composite read views.
+
+A cached payload is stored under a key built from the view, its key parts
+(squad, week, viewer visibility) and the current version of every tag it
+depends on. invalidate_tags() bumps those versions once the writing
+transaction commits, so later reads compute a new key and never see the
+old entry; it simply expires. Nothing has to enumerate or delete entries.
+
+Lookups go through a small per-process LRU first, then the shared cache
+(Redis), then compute() under single-flight. Tag versions are memoised
+per process for RESPONSE_CACHE_LOCAL_SECONDS: invalidations made by this
+process apply immediately, those made by other processes are noticed
+within that window. That lag is what the "stale" metrics measure.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .singleflight import coalesce
+
+TAG_PREFIX = "resp-tag:"
+METRICS_PREFIX = "resp-metrics:"
+METRICS = ("local_hits", "shared_hits", "misses", "invalidations", "stale", "stale_lag_ms")
+
+class LRU:
+    """
+    Thread-safe bounded mapping of key -> (value, expires_at monotonic).
+    """
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, now):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None or item[1] <= now:
+                return None
+            self.data.move_to_end(key)
+            return item
+
+    def peek(self, key):
+        # expired or not
+        with self.lock:
+            return self.data.get(key)
+
+    def set(self, key, value, expires_at):
+        with self.lock:
+            self.data[key] = (value, expires_at)
+            self.data.move_to_end(key)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+_entries = LRU(settings.RESPONSE_CACHE_LOCAL_SIZE)
+_versions = LRU(settings.RESPONSE_CACHE_LOCAL_SIZE)
+_counts = dict.fromkeys(METRICS, 0)
+_counts_lock = threading.Lock()
+_lookups = [0]
+
+def _new_version():
+    # wall-clock nanoseconds: unique enough, and it dates the invalidation
+    return time.time_ns()
+
+def _count(**deltas):
+    flush = False
+    with _counts_lock:
+        for name, n in deltas.items():
+            _counts[name] += n
+        if "local_hits" in deltas or "shared_hits" in deltas or "misses" in deltas:
+            _lookups[0] += 1
+            flush = _lookups[0] % settings.RESPONSE_CACHE_METRICS_EVERY == 0
+    if flush:
+        flush_metrics()
+
+def tag_versions(tags):
+    """
+    Current version of each tag: memoised ones as they are, the rest in
+    one get_many. A tag never seen before is created at the current time,
+    so a version evicted from the shared cache cannot come back as an
+    older value and revive entries keyed on it.
+    """
+    now = time.monotonic()
+    versions, missing = {}, []
+    for tag in tags:
+        item = _versions.get(tag, now)
+        if item is None:
+            missing.append(tag)
+        else:
+            versions[tag] = item[0]
+    if missing:
+        fetched = cache.get_many([TAG_PREFIX + t for t in missing])
+        expires = now + settings.RESPONSE_CACHE_LOCAL_SECONDS
+        for tag in missing:
+            version = fetched.get(TAG_PREFIX + tag)
+            if version is None:
+                version = _new_version()
+                if not cache.add(TAG_PREFIX + tag, version, timeout=None):
+                    version = cache.get(TAG_PREFIX + tag, version)
+            _note_version(tag, version, now)
+            _versions.set(tag, version, expires)
+            versions[tag] = version
+    return versions
+
+def _note_version(tag, version, now):
+    # a memoised version that moved under us: we were up to lag_ms behind
+    previous = _versions.peek(tag)
+    if previous is not None and previous[0] != version:
+        _count(stale=1, stale_lag_ms=max(0, (time.time_ns() - version) // 1_000_000))
+
+def cache_key(view, parts, tags):
+    versions = tag_versions(tags)
+    digest = hashlib.blake2b(
+        "|".join(f"{t}={versions[t]}" for t in sorted(tags)).encode(), digest_size=8,
+    ).hexdigest()
+    return f"resp:{view}:{':'.join(str(p) for p in parts)}:{digest}"
+
+def cached(view, parts, tags, compute, ttl=None):
+    """
+    The payload for (view, parts), recomputed after any of `tags` is
+    invalidated. compute() must return something picklable.
+    """
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return compute()
+    ttl = ttl or settings.RESPONSE_CACHE_SECONDS
+    key = cache_key(view, parts, tags)
+    now = time.monotonic()
+    item = _entries.get(key, now)
+    if item is not None:
+        _count(local_hits=1)
+        return item[0]
+
+    computed = []
+
+    def compute_and_note():
+        computed.append(True)
+        return compute()
+
+    value = coalesce(key, compute_and_note, ttl)
+    _count(**{"misses" if computed else "shared_hits": 1})
+    _entries.set(key, value, now + ttl)
+    return value
+
+def invalidate_tags(*tags):
+    """
+    Bump the versions of `tags` once the current transaction commits
+    (immediately outside one), so no reader can re-cache pre-commit data
+    under the new versions.
+    """
+    tags = [t for t in tags if t]
+    if tags:
+        transaction.on_commit(lambda: _bump(tags))
+
+def _bump(tags):
+    version = _new_version()
+    cache.set_many({TAG_PREFIX + t: version for t in tags}, timeout=None)
+    expires = time.monotonic() + settings.RESPONSE_CACHE_LOCAL_SECONDS
+    for tag in tags:
+        _versions.set(tag, version, expires)
+    _count(invalidations=len(tags))
+
+def local_metrics():
+    with _counts_lock:
+        return dict(_counts)
+
+def flush_metrics():
+    """
+    Add this process's counters to the shared totals and start over.
+    """
+    with _counts_lock:
+        counts = {name: n for name, n in _counts.items() if n}
+        for name in _counts:
+            _counts[name] = 0
+    for name, n in counts.items():
+        key = METRICS_PREFIX + name
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key, n)
+        except ValueError:
+            # evicted between add and incr
+            cache.set(key, n, timeout=None)
+
+def shared_metrics():
+    values = cache.get_many([METRICS_PREFIX + name for name in METRICS])
+    return {name: values.get(METRICS_PREFIX + name, 0) for name in METRICS}
+
+def reset_metrics():
+    cache.delete_many([METRICS_PREFIX + name for name in METRICS])
+    with _counts_lock:
+        for name in _counts:
+            _counts[name] = 0
+
+def clear_local():
+    _entries.clear()
+    _versions.clear()
@@ -0,0 +1,77 @@
+"""
+Single-flight caching for expensive identical reads.
+
+coalesce(key, compute, ttl) returns the cached value for key, or computes
+it exactly once while every concurrent caller waits for that result:
+threads of the same process wait on an in-process event, other processes
+wait on a short cache lock (SET NX on Redis) and poll for the value.
+A cache expiry under load therefore costs one query, not one per caller.
+"""
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+_MISSING = object()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+        self.value = None
+
+def coalesce(key, compute, ttl):
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _Call()
+
+    if not leader:
+        call.done.wait(settings.SINGLE_FLIGHT_WAIT_SECONDS)
+        # leader failed or is stuck: answer this caller ourselves
+        return call.value if call.ok else compute()
+
+    try:
+        call.value = _compute_once(key, compute, ttl)
+        call.ok = True
+        return call.value
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        call.done.set()
+
+def _compute_once(key, compute, ttl):
+    lock_key = f"{key}:lock"
+    wait = settings.SINGLE_FLIGHT_WAIT_SECONDS
+    if cache.add(lock_key, 1, timeout=wait):
+        try:
+            # another process may have filled it between our get and add
+            value = cache.get(key, _MISSING)
+            if value is _MISSING:
+                value = compute()
+                cache.set(key, value, ttl)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + wait
+    delay = 0.005
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if cache.get(lock_key) is None:
+            break
+    return compute()
+
+def invalidate(key):
+    cache.delete(key)
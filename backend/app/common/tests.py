@@ -0,0 +1,349 @@
+import gzip
+import json
+import threading
+import time
+from io import BytesIO
+from unittest import skipUnless
+import brotli
+import msgpack
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from app.runs.models import RunLog
+from app.squads.membership import add_member
+from app.squads.models import Squad, SquadMessage
+from app.sync.changes import stamp_until_empty
+from app.sync.views import make_token
+from .db_router import REPLICA_DB_ALIAS, PrimaryReplicaRouter, replica_configured, use_primary, use_replica
+from . import throttling
+from .middleware import CompressionMiddleware
+from .singleflight import coalesce
+from .renderers import MessagePackParser, MessagePackRenderer, ORJSONRenderer, from_columns, negotiate, to_columns
+
+User = get_user_model()
+
+needs_replica = skipUnless(replica_configured(), "no replica alias: run with --settings=backend.test_settings")
+# the runner checks every alias a test class names, skipped or not
+ALIASES = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS} & set(settings.DATABASES)
+
+
+@needs_replica
+class PrimaryReplicaRouterTests(TransactionTestCase):
+    """
+    backend.test_settings adds "replica" as a TEST MIRROR of default: a
+    second connection to the same database, so what it reads shows routing only.
+    """
+    databases = ALIASES
+
+    def test_reads_follow_the_context(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(RunLog), DEFAULT_DB_ALIAS)
+        with use_replica():
+            self.assertEqual(router.db_for_read(RunLog), REPLICA_DB_ALIAS)
+            self.assertEqual(router.db_for_write(RunLog), DEFAULT_DB_ALIAS)
+            with use_primary():
+                self.assertEqual(router.db_for_read(RunLog), DEFAULT_DB_ALIAS)
+            # reads inside a transaction see its own writes
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(RunLog), DEFAULT_DB_ALIAS)
+
+    def test_replica_reads_use_the_replica_connection(self):
+        user = User.objects.create_user(username="runner", password="x")
+        with use_replica(), CaptureQueriesContext(connections[REPLICA_DB_ALIAS]) as replica:
+            self.assertEqual(User.objects.get(id=user.id).username, "runner")
+        self.assertEqual(len(replica), 1)
+
+
+@needs_replica
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False, SYNC_STAMP_ON_COMMIT=False, REPLICA_PIN_SECONDS=60)
+class ReplicaPinningTests(TransactionTestCase):
+    databases = ALIASES
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="runner", password="secret1")
+
+    def client_for(self, access):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        return client
+
+    def replica_queries(self, client):
+        with CaptureQueriesContext(connections[REPLICA_DB_ALIAS]) as replica:
+            self.assertEqual(client.get("/api/runs/weekly/").status_code, 200)
+        return len(replica)
+
+    def test_reads_go_to_the_replica_until_the_user_writes(self):
+        client = self.client_for(RefreshToken.for_user(self.user).access_token)
+        self.assertGreater(self.replica_queries(client), 0)
+        resp = client.post("/api/runs/", {"distance": 5, "duration_minutes": 30}, format="json")
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(self.replica_queries(client), 0)
+        # the pin belongs to the user, not to the token that wrote
+        self.assertEqual(self.replica_queries(self.client_for(RefreshToken.for_user(self.user).access_token)), 0)
+        other = User.objects.create_user(username="other", password="x")
+        self.assertGreater(self.replica_queries(self.client_for(RefreshToken.for_user(other).access_token)), 0)
+
+    def test_login_pins_the_user(self):
+        resp = APIClient().post("/api/auth/login/", {"username": "runner", "password": "secret1"}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.replica_queries(self.client_for(resp.json()["access"])), 0)
+
+    def test_token_refresh_pins_the_user(self):
+        refresh = RefreshToken.for_user(self.user)
+        resp = APIClient().post("/api/auth/token/refresh/", {"refresh": str(refresh)}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.replica_queries(self.client_for(resp.json()["access"])), 0)
+
+    def test_failed_writes_do_not_pin(self):
+        resp = APIClient().post("/api/auth/login/", {"username": "runner", "password": "wrong"}, format="json")
+        self.assertEqual(resp.status_code, 401)
+        self.assertGreater(self.replica_queries(self.client_for(RefreshToken.for_user(self.user).access_token)), 0)
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False, SYNC_STAMP_ON_COMMIT=False)
+class ORJSONRendererTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="runner", password="x")
+        self.squad = Squad.objects.create(name="Zoë\u2028squad", owner=self.user)
+        add_member(self.squad, self.user.id)
+        SquadMessage.objects.create(squad=self.squad, sender=self.user, text='quote " and \\ ünïcode 🏃')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for distance, minutes in ((5.123, 31), (0.1, 1), (21.0975, 118), (1 / 3, 2)):
+            resp = self.client.post("/api/runs/", {"distance": distance, "duration_minutes": minutes}, format="json")
+            self.assertEqual(resp.status_code, 201)
+        self.client.patch(f"/api/runs/{resp.json()['id']}/", {"distance": 4.2}, format="json")
+
+    def test_api_payloads_render_like_drf(self):
+        stamp_until_empty()
+        paths = ("/api/runs/weekly/", "/api/runs/edits/", "/api/squads/", f"/api/squads/{self.squad.id}/", f"/api/sync/?since={make_token(0)}")
+        for path in paths:
+            resp = self.client.get(path, HTTP_ACCEPT="application/json")
+            self.assertEqual(resp.status_code, 200, path)
+            self.assertTrue(resp.data, path)
+            self.assertEqual(ORJSONRenderer().render(resp.data), JSONRenderer().render(resp.data), path)
+
+    def test_float_differences_from_drf(self):
+        data = {"big": 1e16, "small": 1e-7, "usual": 0.30000000000000004}
+        self.assertEqual(ORJSONRenderer().render(data), b'{"big":1e16,"small":1e-7,"usual":0.30000000000000004}')
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+        # DRF's strict JSON refuses non-finite floats
+        self.assertEqual(ORJSONRenderer().render({"pace": float("nan")}), b'{"pace":null}')
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({"pace": float("nan")})
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False, SYNC_STAMP_ON_COMMIT=False)
+class MessagePackTests(TestCase):
+    rows = [
+        {"id": 1, "distance_km": 5.123, "tags": ["easy"], "split": {"km": 1, "s": 301}},
+        {"id": 2, "distance_km": 0.1, "tags": [], "split": {"km": 1, "s": 299}},
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="runner", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for distance in (5.123, 1 / 3):
+            self.client.post("/api/runs/", {"distance": distance, "duration_minutes": 30}, format="json")
+
+    def test_msgpack_round_trip(self):
+        data = {"runs": self.rows, "empty": [], "note": "ünïcode 🏃", "none": None}
+        body = MessagePackRenderer().render(data)
+        self.assertEqual(MessagePackParser().parse(BytesIO(body)), data)
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(BytesIO(b"\xc1"))
+
+    def test_columns_round_trip(self):
+        packed = to_columns({"runs": self.rows})
+        self.assertEqual(packed["runs"]["$columns"]["id"], [1, 2])
+        self.assertEqual(packed["runs"]["$columns"]["split"], {"$columns": {"km": [1, 1], "s": [301, 299]}})
+        self.assertEqual(from_columns(packed), {"runs": self.rows})
+        # nothing to share: left as rows
+        ragged = [{"id": 1, "note": "x"}, {"id": 2}]
+        for data in ([], [{}], [{"id": 1}], ragged, {"runs": [], "rows": ragged}):
+            self.assertEqual(to_columns(data), data)
+            self.assertEqual(from_columns(to_columns(data)), data)
+
+    def test_api_answers_in_msgpack(self):
+        plain = self.client.get("/api/runs/weekly/", HTTP_ACCEPT="application/json").json()
+        resp = self.client.get("/api/runs/weekly/", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(resp["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(resp.content), plain)
+        resp = self.client.get("/api/runs/weekly/", HTTP_ACCEPT="application/msgpack; layout=columns")
+        self.assertIn("$columns", msgpack.unpackb(resp.content)["runs"])
+        self.assertEqual(from_columns(msgpack.unpackb(resp.content)), plain)
+        resp = self.client.get("/api/runs/weekly/?format=msgpack")
+        self.assertEqual(msgpack.unpackb(resp.content), plain)
+
+    def test_msgpack_request_bodies(self):
+        resp = self.client.post(
+            "/api/runs/", msgpack.packb({"distance": 7.5, "duration_minutes": 40}),
+            content_type="application/msgpack", HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(RunLog.objects.get(id=msgpack.unpackb(resp.content)["id"]).distance_km, 7.5)
+
+    def test_negotiate(self):
+        factory = RequestFactory()
+        cases = [
+            ({}, "application/json"),
+            ({"HTTP_ACCEPT": "*/*"}, "application/json"),
+            ({"HTTP_ACCEPT": "application/msgpack"}, "application/msgpack"),
+            ({"HTTP_ACCEPT": "text/html, application/msgpack"}, "application/msgpack"),
+            ({"HTTP_ACCEPT": "application/*, application/msgpack"}, "application/msgpack"),
+            ({"HTTP_ACCEPT": "application/msgpack; layout=columns"}, "application/msgpack; layout=columns"),
+            # no 406: anything unknown gets JSON
+            ({"HTTP_ACCEPT": "text/html"}, "application/json"),
+        ]
+        for headers, media_type in cases:
+            renderer, accepted = negotiate(factory.get("/", **headers))
+            self.assertEqual(renderer.media_type, media_type.split(";")[0], headers)
+            self.assertEqual(accepted, media_type, headers)
+        self.assertEqual(negotiate(factory.get("/?format=msgpack", HTTP_ACCEPT="application/json"))[0].format, "msgpack")
+        self.assertEqual(negotiate(factory.get("/?format=xml"))[0].format, "json")
+
+
+@override_settings(RESPONSE_COMPRESSION_MIN_BYTES=100)
+class CompressionMiddlewareTests(TestCase):
+    body = b'{"runs":[' + b",".join(b'{"distance_km":5.0}' for _ in range(20)) + b"]}"
+
+    def respond(self, body=None, encoding="gzip, br", **headers):
+        response = HttpResponse(self.body if body is None else body, content_type="application/json", headers=headers)
+        request = RequestFactory().get("/api/runs/", HTTP_ACCEPT_ENCODING=encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def vary(self, response):
+        return {v.strip() for v in response["Vary"].split(",")}
+
+    def test_small_bodies_are_sent_as_is(self):
+        response = self.respond(self.body[:99])
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, self.body[:99])
+        self.assertEqual(self.vary(response), {"Accept"})
+
+    def test_brotli_is_preferred(self):
+        response = self.respond()
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), self.body)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertEqual(self.vary(response), {"Accept", "Accept-Encoding"})
+
+    def test_gzip(self):
+        response = self.respond(encoding="gzip", ETag='"abc"')
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(response["ETag"], 'W/"abc"')
+
+    def test_identity_still_varies_on_accept_encoding(self):
+        response = self.respond(encoding="")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, self.body)
+        self.assertEqual(self.vary(response), {"Accept", "Accept-Encoding"})
+
+    def test_encoded_responses_are_left_alone(self):
+        response = self.respond(**{"Content-Encoding": "gzip"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response.content, self.body)
+
+
+@override_settings(THROTTLE_BUCKETS={"user": (0.001, 3), "tight": (0.001, 1), "fast": (1000.0, 1)})
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttling._local_buckets.clear()
+
+    def allowed(self, scopes, ident, n=1):
+        return [throttling.check_buckets(scopes, ident) is None for _ in range(n)]
+
+    def test_burst_then_wait(self):
+        self.assertEqual(self.allowed(["user"], "u1", 4), [True, True, True, False])
+        self.assertAlmostEqual(throttling.check_buckets(["user"], "u1"), 1000, delta=1)
+        # buckets are per caller
+        self.assertEqual(self.allowed(["user"], "u2"), [True])
+
+    def test_refill(self):
+        self.assertEqual(self.allowed(["fast"], "u1", 2), [True, False])
+        time.sleep(0.01)
+        self.assertEqual(self.allowed(["fast"], "u1"), [True])
+
+    def test_a_denied_request_spends_nothing(self):
+        self.assertEqual(self.allowed(["user", "tight"], "u1", 6), [True] + [False] * 5)
+        # the rejected requests left the global budget alone
+        self.assertEqual(self.allowed(["user"], "u1", 3), [True, True, False])
+
+    @override_settings(THROTTLE_LOCAL_BUCKETS=2)
+    def test_local_buckets_are_an_lru(self):
+        for ident in ("u1", "u2", "u1", "u3"):
+            self.allowed(["user"], ident)
+        self.assertEqual(list(throttling._local_buckets), ["tb:user:{u1}", "tb:user:{u3}"])
+        # an evicted caller starts from a full bucket
+        self.assertEqual(self.allowed(["user"], "u2", 4), [True, True, True, False])
+
+    @override_settings(THROTTLE_BUCKETS={"user": (0.001, 2)})
+    def test_api_answers_429(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="runner", password="x"))
+        self.assertEqual([client.get("/api/runs/weekly/").status_code for _ in range(3)], [200, 200, 429])
+        self.assertEqual(client.get("/api/runs/weekly/")["Retry-After"], "1000")
+
+
+@override_settings(SINGLE_FLIGHT_WAIT_SECONDS=2)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value="fresh", delay=0.0):
+        self.calls += 1
+        time.sleep(delay)
+        return value
+
+    def test_concurrent_callers_compute_once(self):
+        results = []
+        barrier = threading.Barrier(8)
+
+        def caller():
+            barrier.wait()
+            results.append(coalesce("sf:board", lambda: self.compute(delay=0.1), ttl=60))
+
+        threads = [threading.Thread(target=caller) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ["fresh"] * 8)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(coalesce("sf:board", self.compute, ttl=60), "fresh")
+        self.assertEqual(self.calls, 1)
+
+    def test_a_failed_compute_releases_the_key(self):
+        def boom():
+            raise RuntimeError("db down")
+
+        with self.assertRaises(RuntimeError):
+            coalesce("sf:board", boom, ttl=60)
+        self.assertIsNone(cache.get("sf:board:lock"))
+        self.assertEqual(coalesce("sf:board", self.compute, ttl=60), "fresh")
+
+    def test_waits_for_another_process(self):
+        # another process holds the lock and stores its result shortly
+        cache.add("sf:board:lock", 1)
+        threading.Timer(0.05, lambda: cache.set("sf:board", "theirs", 60)).start()
+        self.assertEqual(coalesce("sf:board", self.compute, ttl=60), "theirs")
+        self.assertEqual(self.calls, 0)
+
+    def test_computes_when_the_other_process_gives_up(self):
+        cache.add("sf:board:lock", 1)
+        threading.Timer(0.05, lambda: cache.delete("sf:board:lock")).start()
+        self.assertEqual(coalesce("sf:board", self.compute, ttl=60), "fresh")
+        self.assertEqual(self.calls, 1)
@@ -0,0 +1,126 @@
+"""
+Token-bucket rate limiting.
+
+Each (scope, caller) pair owns a bucket of THROTTLE_BUCKETS[scope] =
+(refill per second, burst capacity) tokens. A request spends one token
+from every bucket it is checked against, or from none: a request one
+bucket denies leaves the others untouched. With the Redis cache backend
+the buckets live in Redis and are checked by one Lua script, so every web
+worker shares them and the check is a single round trip. Without Redis
+(local dev) buckets are kept per process, in an LRU of
+THROTTLE_LOCAL_BUCKETS entries: a caller idle long enough to be evicted
+has usually refilled to capacity anyway.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django_redis import get_redis_connection
+from django_redis.cache import RedisCache
+from rest_framework.throttling import BaseThrottle
+
+# KEYS bucket hashes; ARGV rate/s, capacity for each key in turn.
+# Returns {allowed, retry_after}; tokens are only spent when all allow.
+TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local tokens = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local capacity = tonumber(ARGV[2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'stamp')
+    local stamp = tonumber(state[2]) or now
+    tokens[i] = math.min(capacity, (tonumber(state[1]) or capacity) + math.max(0, now - stamp) * rate)
+    if tokens[i] < 1 then
+        wait = math.max(wait, (1 - tokens[i]) / rate)
+    end
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local capacity = tonumber(ARGV[2 * i])
+    if wait == 0 then
+        tokens[i] = tokens[i] - 1
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens[i]), 'stamp', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000) + 1000)
+end
+if wait == 0 then
+    return {1, '0'}
+end
+return {0, tostring(wait)}
+"""
+
+_script = None
+_local_buckets = OrderedDict()
+_local_lock = threading.Lock()
+
+def _redis_script():
+    global _script
+    if _script is None:
+        _script = get_redis_connection("default").register_script(TOKEN_BUCKET_LUA)
+    return _script
+
+def _take_local(buckets):
+    now = time.monotonic()
+    with _local_lock:
+        tokens = {}
+        wait = 0.0
+        for key, (rate, capacity) in buckets.items():
+            left, stamp = _local_buckets.get(key, (capacity, now))
+            tokens[key] = min(capacity, left + (now - stamp) * rate)
+            if tokens[key] < 1:
+                wait = max(wait, (1 - tokens[key]) / rate)
+        for key, left in tokens.items():
+            _local_buckets[key] = (left if wait else left - 1, now)
+            _local_buckets.move_to_end(key)
+        while len(_local_buckets) > settings.THROTTLE_LOCAL_BUCKETS:
+            _local_buckets.popitem(last=False)
+    return not wait, wait
+
+def take_tokens(scopes, ident):
+    """
+    Spend one token from each (scope, ident) bucket if every one of them
+    has a token. Returns (allowed, seconds until they all do).
+    """
+    # the hash tag keeps a caller's buckets in one cluster slot
+    buckets = {f"tb:{scope}:{{{ident}}}": settings.THROTTLE_BUCKETS[scope] for scope in scopes}
+    backend = caches["default"]
+    if isinstance(backend, RedisCache):
+        args = [value for bucket in buckets.values() for value in bucket]
+        allowed, retry_after = _redis_script()(keys=[backend.make_key(key) for key in buckets], args=args)
+        return bool(allowed), float(retry_after)
+    return _take_local(buckets)
+
+def caller_scopes(scope):
+    # every request spends from the caller's overall bucket, plus the
+    # endpoint's own bucket when it declares one
+    return ["user", scope] if scope else ["user"]
+
+def check_buckets(scopes, ident):
+    """
+    Returns seconds to wait, or None when every bucket had a token.
+    """
+    if not settings.THROTTLE_ENABLED:
+        return None
+    allowed, retry_after = take_tokens(scopes, ident)
+    return None if allowed else retry_after
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle over THROTTLE_BUCKETS. Views opt into a per-endpoint bucket
+    with throttle_scope = "<scope>"; authenticated callers are keyed by user
+    id, anonymous ones by client IP.
+    """
+
+    def allow_request(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f"u{request.user.pk}"
+        else:
+            ident = f"ip{self.get_ident(request)}"
+        self.retry_after = check_buckets(caller_scopes(getattr(view, "throttle_scope", None)), ident)
+        return self.retry_after is None
+
+    def wait(self):
+        return self.retry_after
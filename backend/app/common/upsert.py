@@ -0,0 +1,72 @@
+"""
+Single-statement INSERT ... ON CONFLICT upserts.
+
+get_or_create / update_or_create take two or three round trips and, when
+two requests race on a unique key, one of them hits an IntegrityError and
+retries inside a savepoint. upsert() is one statement on both PostgreSQL
+and SQLite (3.35+, for RETURNING): the database resolves the race and
+hands back the row.
+"""
+from django.db import connections, router
+
+def upsert(model, values, conflict, update=None):
+    """
+    Insert a model row built from values; on a conflict over the unique
+    fields `conflict`, overwrite the `update` fields from values, or with
+    update=None leave the existing row alone.
+
+    Returns (instance, written): the row as stored, and False only when
+    update=None hit an existing row (instance is then None).
+    """
+    rows = upsert_many(model, [values], conflict, update)
+    return (rows[0], True) if rows else (None, False)
+
+def upsert_many(model, rows, conflict, update=None, batch_size=500):
+    """
+    upsert() for many rows, one statement per batch_size rows. Returns the
+    instances written; with update=None, rows that already existed are
+    left out, so the result is exactly what this call inserted.
+    """
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    columns = ", ".join(qn(f.column) for f in fields)
+    conflict_columns = ", ".join(qn(model._meta.get_field(name).column) for name in conflict)
+    if update:
+        update_columns = [model._meta.get_field(name).column for name in update]
+        action = "DO UPDATE SET " + ", ".join(f"{qn(c)} = EXCLUDED.{qn(c)}" for c in update_columns)
+    else:
+        action = "DO NOTHING"
+    returning = ", ".join(qn(f.column) for f in model._meta.concrete_fields)
+    placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+
+    written = []
+    rows = list(rows)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        params = []
+        for values in batch:
+            obj = model(**values)
+            params.extend(f.get_db_prep_save(f.pre_save(obj, True), connection) for f in fields)
+        sql = (
+            f"INSERT INTO {qn(model._meta.db_table)} ({columns}) "
+            f"VALUES {', '.join([placeholder] * len(batch))} "
+            f"ON CONFLICT ({conflict_columns}) {action} "
+            f"RETURNING {returning}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            written.extend(_from_db(model, using, connection, row) for row in cursor.fetchall())
+    return written
+
+def _from_db(model, using, connection, row):
+    # the same from-db conversions a SELECT of these columns would apply
+    values = []
+    for value, field in zip(row, model._meta.concrete_fields):
+        col = field.get_col(model._meta.db_table)
+        for func in connection.ops.get_db_converters(col) + col.get_db_converters(connection):
+            value = func(value, col, connection)
+        # SQLite's RETURNING skips column affinity (0 for a REAL column)
+        values.append(field.to_python(value))
+    return model.from_db(using, [f.attname for f in model._meta.concrete_fields], values)
@@ -1,20 +1,39 @@
 from datetime import datetime, timedelta, timezone, date
+from functools import lru_cache
+from zoneinfo import ZoneInfo, available_timezones
+from django.core.exceptions import ValidationError
 
-def get_current_week_start() -> date:
-    # Monday 00:00 UTC for current ISO week
-    now = datetime.now(timezone.utc)
+DEFAULT_TIMEZONE = "UTC"
+
+@lru_cache(maxsize=None)
+def get_zone(tz_name: str = DEFAULT_TIMEZONE) -> ZoneInfo:
+    return ZoneInfo(tz_name or DEFAULT_TIMEZONE)
+
+@lru_cache(maxsize=1)
+def valid_timezones() -> frozenset:
+    return frozenset(available_timezones())
+
+def validate_timezone(value):
+    # an unknown zone would make every week computation for the squad raise
+    if value not in valid_timezones():
+        raise ValidationError("Unknown timezone: %(value)s.", params={"value": value})
+
+def get_current_week_start(tz_name: str = DEFAULT_TIMEZONE, now: datetime = None) -> date:
+    # Monday 00:00 local time for the current ISO week
+    now = (now or datetime.now(timezone.utc)).astimezone(get_zone(tz_name))
     monday = now - timedelta(days=now.weekday())
-    monday_midnight = datetime(monday.year, monday.month, monday.day, tzinfo=timezone.utc)
-    return monday_midnight.date()
+    return monday.date()
 
-def get_previous_week_start() -> date:
-    current = get_current_week_start()
+def get_previous_week_start(tz_name: str = DEFAULT_TIMEZONE, now: datetime = None) -> date:
+    current = get_current_week_start(tz_name, now=now)
     prev = current - timedelta(days=7)
     return prev
 
-def week_range(week_start_date: date):
-    start_dt = datetime.combine(week_start_date, datetime.min.time(), tzinfo=timezone.utc)
-    end_dt = start_dt + timedelta(days=7)
+def week_range(week_start_date: date, tz_name: str = DEFAULT_TIMEZONE):
+    # local Monday 00:00 -> next local Monday 00:00 (167 or 169 hours across DST changes)
+    tz = get_zone(tz_name)
+    start_dt = datetime.combine(week_start_date, datetime.min.time(), tzinfo=tz)
+    end_dt = datetime.combine(week_start_date + timedelta(days=7), datetime.min.time(), tzinfo=tz)
     return start_dt, end_dt
 
 def miles_to_km(miles: float) -> float:
@@ -0,0 +1,9 @@
+from asgiref.sync import sync_to_async
+from app.common.async_views import async_api_view, render_response
+from .views import global_top_10
+
+@async_api_view(throttle_scope="leaderboard")
+async def global_leaderboard(request):
+    # coalescing waits on threads/locks, so it runs off the event loop
+    data = await sync_to_async(global_top_10)()
+    return render_response(request, {"global_top_10": data})
@@ -1,6 +1,13 @@
+from django.conf import settings
 from django.urls import path
 from .views import GlobalLeaderboardView
 
+if settings.ASYNC_READ_VIEWS:
+    from .async_views import global_leaderboard
+    leaderboard_view = global_leaderboard
+else:
+    leaderboard_view = GlobalLeaderboardView.as_view()
+
 urlpatterns = [
-    path("leaderboard/global/", GlobalLeaderboardView.as_view(), name="leaderboard_global"),
+    path("leaderboard/global/", leaderboard_view, name="leaderboard_global"),
 ]
@@ -1,25 +1,41 @@
 from rest_framework import generics, permissions, response
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from app.squads.models import Squad
 from app.squads.views import SquadLeaderboardView
 from django.db.models import F
+from app.common.singleflight import coalesce
 
 User = get_user_model()
 
+def top_users(limit=10):
+    # top users by total_points, sorted and cut in the database
+    return (
+        User.objects
+        .order_by(F("profile__total_points").desc(nulls_last=True), "id")
+        .values("username", "profile__display_name", "profile__total_points")[:limit]
+    )
+
+def leaderboard_row(r):
+    return {
+        "username": r["username"],
+        "display_name": r["profile__display_name"] if r["profile__display_name"] is not None else r["username"],
+        "total_points": r["profile__total_points"] or 0,
+    }
+
+GLOBAL_LEADERBOARD_KEY = "leaderboard:global:10"
+
+def global_top_10():
+    # one query per LEADERBOARD_CACHE_SECONDS however many clients poll
+    return coalesce(
+        GLOBAL_LEADERBOARD_KEY,
+        lambda: [leaderboard_row(r) for r in top_users(10)],
+        settings.LEADERBOARD_CACHE_SECONDS,
+    )
+
 class GlobalLeaderboardView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = "leaderboard"
 
     def get(self, request):
-        # top 10 users by total_points
-        qs = User.objects.select_related("profile").all()
-        data = []
-        for u in qs:
-            pts = u.profile.total_points if hasattr(u,"profile") else 0
-            data.append({
-                "username": u.username,
-                "display_name": u.profile.display_name if hasattr(u,"profile") else u.username,
-                "total_points": pts,
-            })
-        data.sort(key=lambda x: x["total_points"], reverse=True)
-        data = data[:10]
-        return response.Response({"global_top_10": data})
+        return response.Response({"global_top_10": global_top_10()})
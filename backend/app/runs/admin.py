@@ -1,3 +1,66 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin import DateFieldListFilter
+from app.common.admin_utils import LargeTableAdmin
+from .models import RunLog, RunLogEdit, RunTrack
 
-# Register your models here.
+
+class FlaggedFilter(admin.SimpleListFilter):
+    """
+    Runs scored at or above RUN_ANOMALY_Z that still count (see
+    app.runs.anomaly): unusual for the runner, worth a look.
+    """
+    title = 'flagged'
+    parameter_name = 'flagged'
+
+    def lookups(self, request, model_admin):
+        return [('1', 'Yes'), ('0', 'No')]
+
+    def queryset(self, request, queryset):
+        flagged = {'anomaly_score__gte': settings.RUN_ANOMALY_Z, 'excluded': False}
+        if self.value() == '1':
+            return queryset.filter(**flagged)
+        if self.value() == '0':
+            return queryset.exclude(**flagged)
+        return queryset
+
+
+@admin.register(RunLog)
+class RunLogAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'timestamp', 'distance_km', 'duration_minutes', 'anomaly_score', 'flagged', 'excluded']
+    list_select_related = ['user']
+    # range filters on the indexed timestamp; Django's date_hierarchy would
+    # run SELECT DISTINCT over the whole table for its year list
+    list_filter = ['excluded', FlaggedFilter, ('timestamp', DateFieldListFilter)]
+    search_fields = ['=user__username']
+    raw_id_fields = ['user']
+    # runs change only through the API (app.runs.serializers), which audits
+    # the edit and sends the deltas to squad rollups, sync and snapshots
+    readonly_fields = ['user', 'distance_km', 'duration_minutes', 'timestamp', 'anomaly_score', 'excluded']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.display(boolean=True, description='flagged')
+    def flagged(self, run):
+        return run.flagged
+
+
+@admin.register(RunLogEdit)
+class RunLogEditAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'run_id', 'action', 'created_at']
+    list_select_related = ['user']
+    list_filter = ['action']
+    search_fields = ['=user__username', '=run_id']
+    raw_id_fields = ['user']
+
+
+@admin.register(RunTrack)
+class RunTrackAdmin(LargeTableAdmin):
+    list_display = ['run', 'point_count', 'distance_km', 'moving_seconds', 'updated_at']
+    list_select_related = ['run', 'run__user']
+    raw_id_fields = ['run']
+    exclude = ['data']
@@ -0,0 +1,136 @@
+"""
+Batch plausibility scoring for runs.
+
+score_arrays works on plain numpy arrays so a whole batch (or years of
+history) is scored in one vectorized pass:
+
+- hard limits: non-positive duration, speed above RUN_MAX_SPEED_KMH or
+  distance above RUN_MAX_DISTANCE_KM. These runs are excluded from every
+  squad aggregate.
+- per-user deviation: modified z-score (median/MAD, in log space) of speed
+  and distance against the runner's own history. Runs at or above
+  RUN_ANOMALY_Z are only flagged (anomaly_score), never excluded, since a
+  first marathon is unusual but real.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from app.sync.changes import RUN, record_many
+from .models import RunLog
+
+# MAD floor in log space (~5%) so very consistent runners aren't flagged for noise
+MIN_LOG_MAD = 0.05
+# stored score for runs over a hard limit
+HARD_LIMIT_SCORE = 99.0
+
+def group_median(groups, values, starts, sizes):
+    """
+    Median of values per group. groups must be sorted; starts/sizes
+    describe each group's slice.
+    """
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    lo = ordered[starts + (sizes - 1) // 2]
+    hi = ordered[starts + sizes // 2]
+    return (lo + hi) / 2
+
+def score_arrays(user_ids, distance_km, duration_minutes):
+    """
+    Returns (score, excluded) arrays aligned with the inputs. score is the
+    larger of the speed/distance modified z-scores (0 without enough
+    history), and HARD_LIMIT_SCORE for runs over a hard limit.
+    """
+    user_ids = np.asarray(user_ids)
+    distance_km = np.asarray(distance_km, dtype=np.float64)
+    duration_minutes = np.asarray(duration_minutes, dtype=np.float64)
+    n = user_ids.size
+    score = np.zeros(n)
+    if n == 0:
+        return score, np.zeros(0, dtype=bool)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed_kmh = distance_km / (duration_minutes / 60)
+    excluded = (
+        (duration_minutes <= 0)
+        | (distance_km <= 0)
+        | (speed_kmh > settings.RUN_MAX_SPEED_KMH)
+        | (distance_km > settings.RUN_MAX_DISTANCE_KM)
+    )
+
+    # group by user without a Python loop: sort once, then slice by runs
+    order = np.argsort(user_ids, kind="stable")
+    users = user_ids[order]
+    uniq, starts, sizes = np.unique(users, return_index=True, return_counts=True)
+    group = np.repeat(np.arange(uniq.size), sizes)
+    sane = ~excluded[order]
+
+    # hard-limit runs don't get to shift the user's baseline; they sort
+    # last in their group (inf) and the median only looks at the sane prefix
+    counts = np.add.reduceat(sane.astype(np.int64), starts)
+    usable = np.maximum(counts, 1)
+    thin = counts[group] < settings.RUN_ANOMALY_MIN_HISTORY
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for feature in (speed_kmh, distance_km):
+            x = np.where(sane, np.log(feature[order]), np.inf)
+            med = group_median(group, x, starts, usable)
+            dev = np.where(sane, np.abs(x - med[group]), np.inf)
+            mad = np.maximum(group_median(group, dev, starts, usable), MIN_LOG_MAD)
+            z = np.where(sane & ~thin, 0.6745 * dev / mad[group], 0.0)
+            score[order] = np.maximum(score[order], z)
+
+    score[excluded] = HARD_LIMIT_SCORE
+    return score, excluded
+
+def score_runs(run_ids=None, since=None):
+    """
+    Score runs by id and/or logged since a datetime, against each runner's
+    full history, and save the scores. Returns the newly excluded runs as
+    (id, user_id, timestamp, distance_km) so the caller can take them out
+    of the squad rollups.
+    """
+    candidates = RunLog.objects.filter(excluded=False)
+    if run_ids is not None:
+        candidates = candidates.filter(id__in=run_ids)
+    if since is not None:
+        candidates = candidates.filter(timestamp__gte=since)
+    candidate_ids = set(candidates.values_list("id", flat=True))
+    if not candidate_ids:
+        return []
+
+    rows = list(
+        RunLog.objects.filter(user_id__in=candidates.values("user_id"))
+        .values_list("id", "user_id", "distance_km", "duration_minutes")
+    )
+    ids, user_ids, distance, duration = (np.array(col) for col in zip(*rows))
+    score, excluded = score_arrays(user_ids, distance, duration)
+
+    mask = np.isin(ids, list(candidate_ids))
+    scores = {int(i): round(float(s), 3) for i, s in zip(ids[mask], score[mask])}
+    newly_excluded = set(ids[mask & excluded].tolist())
+
+    with transaction.atomic():
+        runs = list(RunLog.objects.select_for_update().filter(id__in=scores, excluded=False))
+        changed = []
+        for run in runs:
+            if run.anomaly_score != scores[run.id] or run.id in newly_excluded:
+                changed.append(run)
+            run.anomaly_score = scores[run.id]
+            run.excluded = run.id in newly_excluded
+        RunLog.objects.bulk_update(changed, ["anomaly_score", "excluded"], batch_size=1000)
+        record_many((RUN, r.id, r.user_id, None, False) for r in changed)
+    return [(r.id, r.user_id, r.timestamp, r.distance_km) for r in runs if r.excluded]
+
+def exclude_anomalous_runs(run_ids=None, since=None):
+    """
+    score_runs, then emit outbox events removing each newly excluded run's
+    contribution from the squads it counted toward. Both commit together:
+    a run excluded without its event would keep its km in the rollups for
+    good, since later passes only look at runs not yet excluded.
+    """
+    from app.tasks.outbox import emit_run_deltas
+
+    with transaction.atomic():
+        excluded = score_runs(run_ids=run_ids, since=since)
+        for run_id, user_id, ts, km in excluded:
+            emit_run_deltas("run.excluded", user_id, run_id, [(ts, -km, -1)])
+    return len(excluded)
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-19 16:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('runs', '0002_run_log_edit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunTrack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('point_count', models.IntegerField()),
+                ('distance_km', models.FloatField()),
+                ('moving_seconds', models.FloatField(blank=True, null=True)),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('run', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='track', to='runs.runlog')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-19 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('runs', '0003_run_track'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='runlog',
+            name='anomaly_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='runlog',
+            name='excluded',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -2,11 +2,56 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 
+def is_flagged(anomaly_score, excluded):
+    # unusual for this runner but plausible: still counts, shown for review
+    return not excluded and anomaly_score is not None and anomaly_score >= settings.RUN_ANOMALY_Z
+
 class RunLog(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="runs")
     distance_km = models.FloatField()
     duration_minutes = models.FloatField()
     timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+    # set by app.runs.anomaly; None until scored
+    anomaly_score = models.FloatField(null=True, blank=True)
+    # physically implausible: kept for the runner, left out of squad aggregates
+    excluded = models.BooleanField(default=False)
+
+    @property
+    def flagged(self):
+        return is_flagged(self.anomaly_score, self.excluded)
 
     def __str__(self):
         return f"{self.user.username} {self.distance_km} km @ {self.timestamp}"
+
+class RunLogEdit(models.Model):
+    """
+    Audit trail for run edits and deletes. before/after hold the run's
+    distance_km, duration_minutes and timestamp; after is null on delete.
+    """
+    ACTION_CHOICES = [("update", "update"), ("delete", "delete")]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="run_edits")
+    # kept after the run itself is deleted
+    run_id = models.BigIntegerField(db_index=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    before = models.JSONField()
+    after = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-created_at"], name="runs_edit_user_ts_idx"),
+        ]
+
+class RunTrack(models.Model):
+    """
+    GPS route of a run. Points live in one packed blob (see
+    app.runs.tracks.pack_track), not a row per point.
+    """
+    run = models.OneToOneField(RunLog, on_delete=models.CASCADE, related_name="track")
+    point_count = models.IntegerField()
+    distance_km = models.FloatField()
+    # None when the upload had no timestamps
+    moving_seconds = models.FloatField(null=True, blank=True)
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
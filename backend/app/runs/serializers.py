@@ -1,7 +1,11 @@
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from .models import RunLog
+from .models import RunLog, RunLogEdit, RunTrack
 from app.common.utils import miles_to_km, get_current_week_start, week_range
+from app.tasks.outbox import emit_run_deltas
+from app.sync.changes import RUN, record
 
 class RunLogCreateSerializer(serializers.ModelSerializer):
     distance = serializers.FloatField(write_only=True)
@@ -15,6 +19,7 @@ class RunLogCreateSerializer(serializers.ModelSerializer):
             'timestamp': {'required': False}
         }
 
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context["request"].user
         distance = validated_data.pop("distance")
@@ -22,17 +27,172 @@ class RunLogCreateSerializer(serializers.ModelSerializer):
         distance_km = distance if unit == "km" else miles_to_km(distance)
         ts = validated_data.get("timestamp", timezone.now())
 
-        return RunLog.objects.create(
+        run = RunLog.objects.create(
             user=user,
             distance_km=distance_km,
             duration_minutes=validated_data["duration_minutes"],
             timestamp=ts,
         )
+        # squad rollups are updated asynchronously from the outbox
+        emit_run_deltas("run.created", user.id, run.id, [(run.timestamp, run.distance_km, 1)])
+        record(RUN, run.id, user_id=user.id)
+        return run
+
+def run_snapshot(run):
+    return {
+        "distance_km": run.distance_km,
+        "duration_minutes": run.duration_minutes,
+        "timestamp": run.timestamp.isoformat(),
+    }
+
+def lock_run(run):
+    """
+    Re-read a run with a row lock before an edit or delete, so its deltas
+    come from the row as it is now rather than from a copy a concurrent
+    delete, edit or anomaly pass has since changed. Raises NotFound when
+    the run is gone.
+    """
+    locked = RunLog.objects.select_for_update().filter(pk=run.pk).first()
+    if locked is None:
+        raise exceptions.NotFound()
+    return locked
+
+def reset_run_score(run):
+    """
+    Put a changed run back into the aggregates until the consumer re-scores
+    it. Returns whether it had been excluded (its old contribution is 0).
+    """
+    was_excluded = run.excluded
+    run.excluded = False
+    run.anomaly_score = None
+    return was_excluded
+
+def emit_run_change(run, old_ts, old_km, was_excluded=False):
+    # take the old contribution out and put the new one in; same-week
+    # edits net out to a distance-only delta in the consumer
+    changes = [] if was_excluded else [(old_ts, -old_km, -1)]
+    changes.append((run.timestamp, run.distance_km, 1))
+    emit_run_deltas("run.updated", run.user_id, run.id, changes)
+    record(RUN, run.id, user_id=run.user_id)
+
+class RunLogUpdateSerializer(serializers.ModelSerializer):
+    distance = serializers.FloatField(write_only=True, required=False)
+    unit = serializers.ChoiceField(choices=[("km","km"),("mi","mi")], default="km", write_only=True)
+
+    class Meta:
+        model = RunLog
+        fields = ["id", "distance", "unit", "duration_minutes", "timestamp", "distance_km"]
+        read_only_fields = ["id", "distance_km"]
+        extra_kwargs = {
+            'duration_minutes': {'required': False},
+            'timestamp': {'required': False},
+        }
+
+    @transaction.atomic
+    def update(self, run, validated_data):
+        run = lock_run(run)
+        before = run_snapshot(run)
+        old_ts, old_km = run.timestamp, run.distance_km
+
+        unit = validated_data.pop("unit", "km")
+        if "distance" in validated_data:
+            distance = validated_data.pop("distance")
+            run.distance_km = distance if unit == "km" else miles_to_km(distance)
+        for field in ("duration_minutes", "timestamp"):
+            if field in validated_data:
+                setattr(run, field, validated_data[field])
+        was_excluded = reset_run_score(run)
+        run.save(update_fields=["distance_km", "duration_minutes", "timestamp", "excluded", "anomaly_score"])
+
+        RunLogEdit.objects.create(
+            user=run.user, run_id=run.id, action="update", before=before, after=run_snapshot(run),
+        )
+        emit_run_change(run, old_ts, old_km, was_excluded)
+        return run
+
+class RunTrackUploadSerializer(serializers.Serializer):
+    """
+    Either a GPX document or a Google encoded polyline. A polyline can carry
+    per-point timestamps as seconds since the start of the run.
+    """
+    gpx = serializers.CharField(required=False, trim_whitespace=False)
+    polyline = serializers.CharField(required=False, trim_whitespace=False)
+    precision = serializers.IntegerField(default=5, min_value=5, max_value=6)
+    timestamps = serializers.ListField(child=serializers.FloatField(min_value=0), required=False)
+
+    def validate(self, attrs):
+        # numpy (via tracks) loads on the first upload, not at cold start
+        import numpy as np
+        from . import tracks
+        if ("gpx" in attrs) == ("polyline" in attrs):
+            raise serializers.ValidationError("Send exactly one of gpx or polyline.")
+        try:
+            if "gpx" in attrs:
+                lat, lon, t = tracks.parse_gpx(attrs["gpx"])
+            else:
+                lat, lon = tracks.decode_polyline(attrs["polyline"], attrs["precision"])
+                t = None
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+        if "timestamps" in attrs:
+            if len(attrs["timestamps"]) != lat.size:
+                raise serializers.ValidationError({"timestamps": "Must have one entry per point."})
+            run_start_ms = int(self.context["run"].timestamp.timestamp() * 1000)
+            t = run_start_ms + np.round(np.asarray(attrs["timestamps"]) * 1000).astype(np.int64)
+        if lat.size < 2:
+            raise serializers.ValidationError("A track needs at least 2 points.")
+        if lat.size > settings.TRACK_MAX_POINTS:
+            raise serializers.ValidationError(f"A track can have at most {settings.TRACK_MAX_POINTS} points.")
+        if np.abs(lat).max() > 90 or np.abs(lon).max() > 180:
+            raise serializers.ValidationError("Coordinates out of range.")
+        if t is not None and (np.diff(t) < 0).any():
+            raise serializers.ValidationError("Track timestamps must not go backwards.")
+        attrs["points"] = (lat, lon, t)
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        from . import tracks
+        run = lock_run(self.context["run"])
+        lat, lon, t = validated_data["points"]
+        distance_km, moving_seconds = tracks.track_stats(lat, lon, t)
+        track, _ = RunTrack.objects.update_or_create(run=run, defaults={
+            "point_count": lat.size,
+            "distance_km": distance_km,
+            "moving_seconds": moving_seconds,
+            "data": tracks.pack_track(lat, lon, t),
+        })
+
+        # the track is the source of truth for distance (and duration when timed),
+        # so applying it is an edit like any other: audited and rate limited
+        before = run_snapshot(run)
+        old_ts, old_km = run.timestamp, run.distance_km
+        run.distance_km = round(distance_km, 3)
+        if moving_seconds:
+            run.duration_minutes = round(moving_seconds / 60, 2)
+        was_excluded = reset_run_score(run)
+        run.save(update_fields=["distance_km", "duration_minutes", "excluded", "anomaly_score"])
+        RunLogEdit.objects.create(
+            user=run.user, run_id=run.id, action="update", before=before, after=run_snapshot(run),
+        )
+        emit_run_change(run, old_ts, old_km, was_excluded)
+        return track
+
+class RunTrackSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RunTrack
+        fields = ["run", "point_count", "distance_km", "moving_seconds", "updated_at"]
+
+class RunLogEditSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RunLogEdit
+        fields = ["id", "run_id", "action", "before", "after", "created_at"]
 
 class RunLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = RunLog
-        fields = ["id","distance_km","duration_minutes","timestamp"]
+        fields = ["id","distance_km","duration_minutes","timestamp","anomaly_score","excluded","flagged"]
 
 class WeeklyRunsSerializer(serializers.Serializer):
     runs = RunLogSerializer(many=True)
@@ -1,3 +1,322 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework.exceptions import NotFound
+from app.squads.membership import add_member
+from app.squads.models import Squad, SquadWeeklyTotal
+from app.tasks.models import OutboxEvent
+from app.tasks.outbox import drain_until_empty
+from . import tracks
+from .anomaly import exclude_anomalous_runs
+from .models import RunLog, RunLogEdit
+from .serializers import RunLogUpdateSerializer
+from .views import RunLogDetailView
 
-# Create your tests here.
+User = get_user_model()
+
+# due north along 4°E, 0.001° (about 111 m) a step, with a one-minute
+# stop at the third point: (lat, seconds since start)
+TRACK = [(52.000, 0), (52.001, 30), (52.002, 60), (52.002, 120), (52.003, 150), (52.004, 180)]
+TRACK_START = datetime(2026, 1, 5, 7, 0, tzinfo=dt_timezone.utc)
+
+def gpx_fixture(tz=dt_timezone.utc, timed=True):
+    points = []
+    for lat, seconds in TRACK:
+        stamp = (TRACK_START + timedelta(seconds=seconds)).astimezone(tz).isoformat().replace("+00:00", "Z")
+        time = f"<time>{stamp}</time>" if timed else ""
+        points.append(f'<trkpt lat="{lat}" lon="4.0"><ele>3</ele>{time}</trkpt>')
+    return (
+        '<?xml version="1.0"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+        "<trk><trkseg>{}</trkseg></trk></gpx>".format("".join(points))
+    )
+
+def haversine_km(points):
+    """
+    Reference distance, point by point with math.
+    """
+    total = 0.0
+    for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]):
+        a = (
+            math.sin(math.radians(lat2 - lat1) / 2) ** 2
+            + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+        )
+        total += 2 * tracks.EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+    return total
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False)
+class RunEditDeltaTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="runner", password="x")
+        self.squad = Squad.objects.create(name="deltas", owner=self.user)
+        add_member(self.squad, self.user.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        resp = self.client.post("/api/runs/", {"distance": 5, "duration_minutes": 30}, format="json")
+        self.run = RunLog.objects.get(id=resp.json()["id"])
+        self.week = OutboxEvent.objects.get(topic="run.created").payload["deltas"][0][0]
+        drain_until_empty()
+
+    def deltas(self, topic):
+        return [e.payload["deltas"] for e in OutboxEvent.objects.filter(topic=topic)]
+
+    def week_total(self):
+        total = SquadWeeklyTotal.objects.get(squad=self.squad)
+        return total.total_distance_km, total.run_count
+
+    def test_edit_swaps_old_contribution_for_new(self):
+        resp = self.client.patch(f"/api/runs/{self.run.id}/", {"distance": 8}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.deltas("run.updated"), [[[self.week, -5.0, -1], [self.week, 8.0, 1]]])
+        drain_until_empty()
+        self.assertEqual(self.week_total(), (8.0, 1))
+
+    def test_delete_takes_the_run_out(self):
+        self.assertEqual(self.client.delete(f"/api/runs/{self.run.id}/").status_code, 204)
+        self.assertEqual(self.deltas("run.deleted"), [[[self.week, -5.0, -1]]])
+        drain_until_empty()
+        self.assertEqual(self.week_total(), (0.0, 0))
+
+    def test_edit_of_a_stale_copy_uses_the_current_row(self):
+        stale = RunLog.objects.get(id=self.run.id)
+        # the anomaly pass excluded it (and emitted its -5 km) meanwhile
+        RunLog.objects.filter(id=self.run.id).update(excluded=True)
+        ser = RunLogUpdateSerializer(stale, data={"distance": 8}, partial=True)
+        ser.is_valid(raise_exception=True)
+        ser.save()
+        self.assertEqual(self.deltas("run.updated"), [[[self.week, 8.0, 1]]])
+
+    def test_delete_of_a_stale_copy_emits_nothing(self):
+        stale = RunLog.objects.get(id=self.run.id)
+        # a concurrent DELETE got there first
+        self.assertEqual(self.client.delete(f"/api/runs/{self.run.id}/").status_code, 204)
+        with self.assertRaises(NotFound):
+            RunLogDetailView().perform_destroy(stale)
+        self.assertEqual(len(self.deltas("run.deleted")), 1)
+        self.assertEqual(RunLogEdit.objects.filter(action="delete").count(), 1)
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False)
+class RunTrackUploadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="runner", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.run = RunLog.objects.create(user=self.user, distance_km=5.0, duration_minutes=30)
+        # about 1.1 km due north
+        lat = np.linspace(52.0, 52.01, 20)
+        self.polyline = tracks.encode_polyline(lat, np.full(lat.size, 4.0))
+
+    def upload(self):
+        return self.client.post(f"/api/runs/{self.run.id}/track/", {"polyline": self.polyline}, format="json")
+
+    def test_upload_is_audited(self):
+        self.assertEqual(self.upload().status_code, 201)
+        edit = RunLogEdit.objects.get(run_id=self.run.id)
+        self.assertEqual(edit.action, "update")
+        self.assertEqual(edit.before["distance_km"], 5.0)
+        self.assertAlmostEqual(edit.after["distance_km"], 1.11, places=2)
+
+    @override_settings(RUN_EDITS_PER_WEEK=2)
+    def test_uploads_count_against_edit_limit(self):
+        self.assertEqual(self.upload().status_code, 201)
+        self.assertEqual(self.upload().status_code, 201)
+        self.assertEqual(self.upload().status_code, 429)
+        self.assertEqual(RunLogEdit.objects.filter(run_id=self.run.id).count(), 2)
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False)
+class AnomalyExclusionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="runner", password="x")
+        add_member(Squad.objects.create(name="anomaly", owner=self.user), self.user.id)
+        # 60 km/h: over RUN_MAX_SPEED_KMH
+        self.run = RunLog.objects.create(user=self.user, distance_km=30, duration_minutes=30, timestamp=timezone.now())
+
+    def test_exclusion_and_its_event_commit_together(self):
+        with mock.patch("app.tasks.outbox.emit_run_deltas", side_effect=RuntimeError("outbox down")):
+            with self.assertRaises(RuntimeError):
+                exclude_anomalous_runs(run_ids=[self.run.id])
+        self.run.refresh_from_db()
+        self.assertFalse(self.run.excluded)
+        # so the next pass still finds it
+        self.assertEqual(exclude_anomalous_runs(run_ids=[self.run.id]), 1)
+        self.run.refresh_from_db()
+        self.assertTrue(self.run.excluded)
+        self.assertEqual(OutboxEvent.objects.filter(topic="run.excluded", user_id=self.user.id).count(), 1)
+
+
+@override_settings(THROTTLE_ENABLED=False, RUN_ANOMALY_Z=3.5)
+class FlaggedRunTests(TestCase):
+    def test_flagged_follows_threshold(self):
+        user = User.objects.create_user(username="runner", password="x")
+        now = timezone.now()
+        for score, excluded in ((4.0, False), (2.0, False), (99.0, True), (None, False)):
+            RunLog.objects.create(
+                user=user, distance_km=5, duration_minutes=30, timestamp=now,
+                anomaly_score=score, excluded=excluded,
+            )
+        client = APIClient()
+        client.force_authenticate(user)
+        runs = client.get("/api/runs/weekly/").json()["runs"]
+        flagged = {(r["anomaly_score"], r["excluded"]): r["flagged"] for r in runs}
+        self.assertEqual(flagged, {(4.0, False): True, (2.0, False): False, (99.0, True): False, (None, False): False})
+
+
+class RunLogAdminTests(TestCase):
+    def test_runs_are_read_only_in_admin(self):
+        staff = User.objects.create_superuser(username="ops", password="x")
+        run = RunLog.objects.create(user=staff, distance_km=5.0, duration_minutes=30, timestamp=timezone.now())
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(f"/admin/runs/runlog/{run.id}/delete/").status_code, 403)
+        self.client.post(f"/admin/runs/runlog/{run.id}/change/", {"distance_km": 50.0})
+        run.refresh_from_db()
+        self.assertEqual(run.distance_km, 5.0)
+        self.assertEqual(self.client.get("/admin/runs/runlog/add/").status_code, 403)
+
+
+@override_settings(THROTTLE_ENABLED=False)
+class RunExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="runner", password="x")
+        other = User.objects.create_user(username="other", password="x")
+        RunLog.objects.create(user=other, distance_km=9.0, duration_minutes=50)
+        self.runs = [
+            RunLog.objects.create(
+                user=self.user, distance_km=distance, duration_minutes=30, anomaly_score=score,
+                timestamp=datetime(2026, 1, day, hour, tzinfo=dt_timezone.utc),
+            )
+            for day, hour, distance, score in ((4, 23, 4.5, None), (5, 0, 5.0, 1.5), (6, 23, 6.25, None), (7, 0, 7.0, None))
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, **params):
+        resp = self.client.get("/api/runs/export/", params)
+        self.assertEqual(resp.status_code, 200)
+        return resp, b"".join(resp.streaming_content)
+
+    def test_csv(self):
+        resp, body = self.export()
+        self.assertEqual(resp["Content-Type"], "text/csv")
+        self.assertEqual(resp["Content-Disposition"], 'attachment; filename="runs-runner.csv"')
+        rows = list(csv.reader(io.StringIO(body.decode("utf-8"))))
+        self.assertEqual(rows[0], ["id", "timestamp", "distance_km", "duration_minutes", "anomaly_score", "excluded"])
+        self.assertEqual(rows[1], [str(self.runs[0].id), "2026-01-04T23:00:00+00:00", "4.5", "30.0", "", "False"])
+        self.assertEqual([r[0] for r in rows[1:]], [str(run.id) for run in self.runs])
+
+    def test_ndjson(self):
+        resp, body = self.export(fmt="ndjson")
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+        self.assertEqual(lines[1], {
+            "id": self.runs[1].id, "timestamp": "2026-01-05T00:00:00+00:00", "distance_km": 5.0,
+            "duration_minutes": 30, "anomaly_score": 1.5, "excluded": False,
+        })
+        self.assertEqual([line["id"] for line in lines], [run.id for run in self.runs])
+
+    def test_gzip_body(self):
+        # small buffers, so the body is gzipped across several flushes
+        with mock.patch("app.common.export.EXPORT_BUFFER_BYTES", 64):
+            resp, body = self.export(fmt="ndjson", gzip="1")
+            _, plain = self.export(fmt="ndjson")
+        self.assertEqual(resp["Content-Type"], "application/gzip")
+        self.assertEqual(resp["Content-Disposition"], 'attachment; filename="runs-runner.ndjson.gz"')
+        self.assertFalse(resp.has_header("Content-Encoding"))
+        self.assertEqual(gzip.decompress(body), plain)
+
+    def test_end_date_is_inclusive(self):
+        _, body = self.export(fmt="ndjson", start="2026-01-05", end="2026-01-06")
+        ids = [json.loads(line)["id"] for line in body.splitlines()]
+        self.assertEqual(ids, [self.runs[1].id, self.runs[2].id])
+
+    def test_bad_options_are_rejected(self):
+        for params in ({"fmt": "xml"}, {"start": "yesterday"}, {"start": "2026-02-30"}, {"end": "2026/01/05"}):
+            resp = self.client.get("/api/runs/export/", params)
+            self.assertEqual(resp.status_code, 400, params)
+            self.assertIn("error", resp.json())
+
+
+class TrackParsingTests(TestCase):
+    def test_gpx_distance_and_moving_time(self):
+        expected_km = haversine_km([(lat, 4.0) for lat, _ in TRACK])
+        self.assertAlmostEqual(expected_km, 0.4448, places=4)
+        for tz in (dt_timezone.utc, dt_timezone(timedelta(hours=2))):
+            lat, lon, t = tracks.parse_gpx(gpx_fixture(tz))
+            self.assertEqual(list(t - t[0]), [seconds * 1000 for _, seconds in TRACK])
+            distance_km, moving_seconds = tracks.track_stats(lat, lon, t)
+            self.assertAlmostEqual(distance_km, expected_km, places=9)
+            # the minute standing still is not moving time
+            self.assertEqual(moving_seconds, 120.0)
+
+    def test_untimed_gpx(self):
+        lat, lon, t = tracks.parse_gpx(gpx_fixture(timed=False))
+        self.assertIsNone(t)
+        self.assertEqual(tracks.track_stats(lat, lon, t)[1], None)
+        with self.assertRaises(ValueError):
+            tracks.parse_gpx("<gpx><trk>")
+
+    def test_polyline(self):
+        # the example from Google's polyline format documentation
+        lat, lon = tracks.decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        np.testing.assert_allclose(np.column_stack([lat, lon]), points)
+        self.assertEqual(tracks.encode_polyline(lat, lon), "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+        self.assertAlmostEqual(tracks.track_stats(lat, lon)[0], haversine_km(points), places=9)
+
+    def test_packed_track_round_trip(self):
+        lat, lon, t = tracks.parse_gpx(gpx_fixture())
+        lat2, lon2, t2 = tracks.unpack_track(tracks.pack_track(lat, lon, t))
+        np.testing.assert_allclose(lat2, lat)
+        np.testing.assert_allclose(lon2, lon)
+        np.testing.assert_array_equal(t2, t)
+
+    def test_simplify_keeps_endpoints_within_tolerance(self):
+        rng = np.random.default_rng(34)
+        lat = 52.0 + np.cumsum(rng.normal(0, 0.0002, 2000))
+        lon = 4.0 + np.cumsum(rng.normal(0, 0.0003, 2000))
+        y = np.radians(lat) * tracks.EARTH_RADIUS_KM * 1000
+        x = np.radians(lon) * tracks.EARTH_RADIUS_KM * 1000 * np.cos(np.radians(lat.mean()))
+        for tolerance in tracks.ZOOM_TOLERANCES_M.values():
+            keep = tracks.simplify(lat, lon, tolerance)
+            self.assertEqual((keep[0], keep[-1]), (0, lat.size - 1))
+            self.assertTrue((np.diff(keep) > 0).all())
+            self.assertLess(keep.size, lat.size)
+            # every dropped point is within tolerance of the kept segment around it
+            for a, b in zip(keep, keep[1:]):
+                ax, ay, bx, by = x[a], y[a], x[b], y[b]
+                px, py = x[a + 1:b], y[a + 1:b]
+                length2 = (bx - ax) ** 2 + (by - ay) ** 2
+                u = np.clip(((px - ax) * (bx - ax) + (py - ay) * (by - ay)) / length2, 0, 1) if length2 else 0
+                dist = np.hypot(px - (ax + u * (bx - ax)), py - (ay + u * (by - ay)))
+                self.assertTrue((dist <= tolerance + 1e-6).all(), (tolerance, a, b, dist.max(initial=0)))
+
+    def test_simplify_straight_line_and_short_tracks(self):
+        lat = np.linspace(52.0, 52.01, 50)
+        self.assertEqual(list(tracks.simplify(lat, np.full(50, 4.0), 2.5)), [0, 49])
+        self.assertEqual(list(tracks.simplify(lat[:2], np.full(2, 4.0), 2.5)), [0, 1])
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False)
+class GpxUploadTests(TestCase):
+    def test_upload_recomputes_distance_and_duration(self):
+        user = User.objects.create_user(username="runner", password="x")
+        run = RunLog.objects.create(user=user, distance_km=5.0, duration_minutes=30)
+        client = APIClient()
+        client.force_authenticate(user)
+        resp = client.post(f"/api/runs/{run.id}/track/", {"gpx": gpx_fixture()}, format="json")
+        self.assertEqual(resp.status_code, 201)
+        run.refresh_from_db()
+        self.assertEqual(run.distance_km, round(haversine_km([(lat, 4.0) for lat, _ in TRACK]), 3))
+        self.assertEqual(run.duration_minutes, 2.0)
+        resp = client.get(f"/api/runs/{run.id}/track/", {"zoom": 16})
+        self.assertEqual(resp.status_code, 200)
@@ -1,7 +1,11 @@
 from django.urls import path
-from .views import RunLogCreateView, WeeklyRunsView
+from .views import RunLogCreateView, RunLogDetailView, RunLogEditListView, RunTrackView, RunExportView, WeeklyRunsView
 
 urlpatterns = [
     path("", RunLogCreateView.as_view(), name="create_run"),
     path("weekly/", WeeklyRunsView.as_view(), name="weekly_runs"),
+    path("edits/", RunLogEditListView.as_view(), name="run_edits"),
+    path("export/", RunExportView.as_view(), name="run_export"),
+    path("<int:pk>/", RunLogDetailView.as_view(), name="run_detail"),
+    path("<int:pk>/track/", RunTrackView.as_view(), name="run_track"),
 ]
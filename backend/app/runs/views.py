@@ -1,8 +1,26 @@
-from rest_framework import generics, permissions, response
+from datetime import timedelta
+from rest_framework import generics, permissions, response, serializers, status
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from .models import RunLog
-from .serializers import RunLogCreateSerializer, WeeklyRunsSerializer, RunLogSerializer
-from app.common.utils import get_current_week_start, week_range
+from .models import RunLog, RunLogEdit, RunTrack
+from .serializers import (
+    RunLogCreateSerializer,
+    RunLogUpdateSerializer,
+    RunLogEditSerializer,
+    RunTrackUploadSerializer,
+    RunTrackSerializer,
+    WeeklyRunsSerializer,
+    RunLogSerializer,
+    lock_run,
+    run_snapshot,
+)
+from app.common.export import ExportError, export_options, export_response
+from app.tasks.outbox import emit_run_deltas
+from app.sync.changes import RUN, record
+from app.common.utils import get_current_week_start, week_range, valid_timezones
 
 class RunLogCreateView(generics.CreateAPIView):
     serializer_class = RunLogCreateSerializer
@@ -17,14 +35,18 @@ class WeeklyRunsView(generics.GenericAPIView):
 
     def get(self, request):
         user = request.user
-        week_start = get_current_week_start()
-        start_dt, end_dt = week_range(week_start)
+        # optional ?tz= so the week matches the runner's local Monday
+        tz_name = request.query_params.get("tz", "UTC")
+        if tz_name not in valid_timezones():
+            raise serializers.ValidationError({"tz": "Unknown timezone."})
+        week_start = get_current_week_start(tz_name)
+        start_dt, end_dt = week_range(week_start, tz_name)
         qs = RunLog.objects.filter(
             user=user,
             timestamp__gte=start_dt,
             timestamp__lt=end_dt
         ).order_by("-timestamp")
-        total = sum(r.distance_km for r in qs)
+        total = sum(r.distance_km for r in qs if not r.excluded)
         data = {
             "runs": RunLogSerializer(qs, many=True).data,
             "total_distance_km": total,
@@ -33,3 +55,138 @@ class WeeklyRunsView(generics.GenericAPIView):
         }
         ser = WeeklyRunsSerializer(data)
         return response.Response(ser.data)
+
+def edit_limit_reached(user):
+    since = timezone.now() - timedelta(days=7)
+    return RunLogEdit.objects.filter(user=user, created_at__gte=since).count() >= settings.RUN_EDITS_PER_WEEK
+
+class RunLogDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """
+    GET/PATCH/PUT/DELETE one of your own runs. Edits and deletes are
+    audited and limited to RUN_EDITS_PER_WEEK in any rolling 7 days.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return RunLog.objects.filter(user=self.request.user)
+
+    def get_serializer_class(self):
+        if self.request.method in ("PUT", "PATCH"):
+            return RunLogUpdateSerializer
+        return RunLogSerializer
+
+    def update(self, request, *args, **kwargs):
+        if edit_limit_reached(request.user):
+            return response.Response(
+                {"error": "Run edit limit reached for this week."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        return super().update(request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        if edit_limit_reached(request.user):
+            return response.Response(
+                {"error": "Run edit limit reached for this week."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        return super().destroy(request, *args, **kwargs)
+
+    @transaction.atomic
+    def perform_destroy(self, run):
+        run = lock_run(run)
+        RunLogEdit.objects.create(
+            user=run.user, run_id=run.id, action="delete", before=run_snapshot(run),
+        )
+        # an excluded run was already taken out of the squad totals
+        if not run.excluded:
+            emit_run_deltas("run.deleted", run.user_id, run.id, [(run.timestamp, -run.distance_km, -1)])
+        record(RUN, run.id, user_id=run.user_id, deleted=True)
+        run.delete()
+
+class RunLogEditListView(generics.ListAPIView):
+    """
+    Your run edit/delete history, newest first.
+    """
+    serializer_class = RunLogEditSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return RunLogEdit.objects.filter(user=self.request.user).order_by("-created_at")
+
+class RunTrackView(generics.GenericAPIView):
+    """
+    POST a GPX file/string or encoded polyline for one of your runs; the run's
+    distance (and duration, for timed tracks) is recomputed from it. An
+    upload is a run edit: audited and counted against RUN_EDITS_PER_WEEK.
+    GET ?zoom= returns the route simplified for that map zoom as a polyline.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return RunLog.objects.filter(user=self.request.user)
+
+    def get(self, request, pk):
+        # numpy (via tracks) loads on the first track read, not at cold start
+        from . import tracks
+        run = self.get_object()
+        track = get_object_or_404(RunTrack.objects.defer("data"), run=run)
+        try:
+            zoom = int(request.query_params.get("zoom", 13))
+        except ValueError:
+            raise serializers.ValidationError({"zoom": "Must be an integer."})
+        level = tracks.zoom_level(zoom)
+
+        key = f"runs:track:{run.id}:{int(track.updated_at.timestamp() * 1000)}:{level}"
+        route = cache.get(key)
+        if route is None:
+            lat, lon, _ = tracks.unpack_track(RunTrack.objects.values_list("data", flat=True).get(pk=track.pk))
+            keep = tracks.simplify(lat, lon, tracks.ZOOM_TOLERANCES_M[level])
+            route = {
+                "zoom": level,
+                "point_count": int(keep.size),
+                "polyline": tracks.encode_polyline(lat[keep], lon[keep]),
+            }
+            cache.set(key, route, settings.TRACK_CACHE_SECONDS)
+        return response.Response({**RunTrackSerializer(track).data, **route})
+
+    def post(self, request, pk):
+        run = self.get_object()
+        if edit_limit_reached(request.user):
+            return response.Response(
+                {"error": "Run edit limit reached for this week."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        data = request.data
+        if "gpx" in request.FILES:
+            data = {"gpx": request.FILES["gpx"].read().decode("utf-8", "replace")}
+        ser = RunTrackUploadSerializer(data=data, context={"run": run})
+        ser.is_valid(raise_exception=True)
+        track = ser.save()
+        # the run as the upload left it (saved from a locked re-read)
+        run = track.run
+        return response.Response(
+            {**RunTrackSerializer(track).data, "run_distance_km": run.distance_km,
+             "run_duration_minutes": run.duration_minutes},
+            status=status.HTTP_201_CREATED
+        )
+
+RUN_EXPORT_COLUMNS = ["id", "timestamp", "distance_km", "duration_minutes", "anomaly_score", "excluded"]
+
+class RunExportView(generics.GenericAPIView):
+    """
+    Stream your full run history. ?fmt=csv|ndjson, ?gzip=1, ?start= / ?end=
+    (YYYY-MM-DD, inclusive).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            fmt, gzipped, date_filter = export_options(request.query_params)
+        except ExportError as e:
+            return response.Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        qs = (
+            RunLog.objects.filter(user=request.user, **date_filter)
+            .order_by("timestamp", "id")
+            .values_list(*RUN_EXPORT_COLUMNS)
+        )
+        return export_response(qs, RUN_EXPORT_COLUMNS, fmt, gzipped, f"runs-{request.user.username}")
@@ -4,7 +4,21 @@ from rest_framework.response import Response
 from django.db import transaction
 from .models import Badge, UserBadge
 from .serializers import BadgeSerializer, UserBadgeSerializer
+from app.squads.caching import invalidate_squad
 from app.squads.models import Squad
+from app.squads.points import lock_squad_balances, spend_squad_points
+from app.sync.changes import BADGE, SQUAD, record
+from app.common.db_router import use_primary
+
+
+def unequip_badges(user, exclude=None):
+    """
+    Unequip the user's equipped badges; returns their ids.
+    """
+    equipped = UserBadge.objects.filter(user=user, is_equipped=True).exclude(id=exclude)
+    ids = list(equipped.values_list("id", flat=True))
+    UserBadge.objects.filter(id__in=ids).update(is_equipped=False)
+    return ids
 
 
 class BadgeListView(generics.ListAPIView):
@@ -18,6 +32,7 @@ class PurchaseBadgeView(APIView):
     """Purchase a badge using squad points"""
     permission_classes = [permissions.IsAuthenticated]
 
+    @use_primary()
     def post(self, request, badge_id):
         user = request.user
 
@@ -36,35 +51,41 @@ class PurchaseBadgeView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Calculate total squad points user has across all squads
-        user_squads = Squad.objects.filter(members=user)
-        total_squad_points = sum(squad.total_points for squad in user_squads)
-
-        # Check if user can afford the badge
-        if total_squad_points < badge.price:
-            return Response(
-                {
-                    "error": f"Not enough points. You have {total_squad_points}, need {badge.price}",
-                    "current_points": total_squad_points,
-                    "required_points": badge.price
-                },
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        squad_ids = Squad.objects.filter(members=user).values_list("id", flat=True)
 
-        # Deduct points from squads (proportionally)
         with transaction.atomic():
+            # Lock the user's squads and read their balances, so two
+            # purchases cannot both spend the same points
+            balances = lock_squad_balances(squad_ids)
+            total_squad_points = sum(balances.values())
+
+            # Check if user can afford the badge
+            if total_squad_points < badge.price:
+                return Response(
+                    {
+                        "error": f"Not enough points. You have {total_squad_points}, need {badge.price}",
+                        "current_points": total_squad_points,
+                        "required_points": badge.price
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # Deduct points from squads (proportionally)
             remaining_cost = badge.price
-            for squad in user_squads:
+            for squad_id, points in balances.items():
                 if remaining_cost <= 0:
                     break
 
-                deduction = min(squad.total_points, remaining_cost)
-                squad.total_points -= deduction
-                squad.save()
+                deduction = min(max(points, 0), remaining_cost)
+                spend_squad_points(squad_id, deduction)
                 remaining_cost -= deduction
+                if deduction:
+                    record(SQUAD, squad_id, squad_id=squad_id)
+                    invalidate_squad(squad_id)
 
             # Create user badge
             user_badge = UserBadge.objects.create(user=user, badge=badge)
+            record(BADGE, user_badge.id, user_id=user.id)
 
         return Response(
             {
@@ -98,12 +119,14 @@ class EquipBadgeView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Unequip all other badges
-        UserBadge.objects.filter(user=request.user).update(is_equipped=False)
+        with transaction.atomic():
+            # Unequip all other badges
+            unequipped = unequip_badges(request.user, exclude=user_badge.id)
 
-        # Equip this badge
-        user_badge.is_equipped = True
-        user_badge.save()
+            # Equip this badge
+            user_badge.is_equipped = True
+            user_badge.save(update_fields=["is_equipped"])
+            record(BADGE, unequipped + [user_badge.id], user_id=request.user.id)
 
         return Response(
             {
@@ -119,7 +142,8 @@ class UnequipBadgeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        UserBadge.objects.filter(user=request.user).update(is_equipped=False)
+        with transaction.atomic():
+            record(BADGE, unequip_badges(request.user), user_id=request.user.id)
         return Response(
             {"message": "Badge unequipped"},
             status=status.HTTP_200_OK
@@ -1,3 +1,165 @@
 from django.contrib import admin
+from django.contrib.admin import DateFieldListFilter
+from django.db import transaction
+from app.common.admin_utils import LargeTableAdmin
+from app.squads.caching import invalidate_squad
+from app.squads.membership import Membership, add_members, remove_members
+from app.squads.points import compact_squad, with_points
+from app.tasks.closeout import closeout_week
+from app.tasks.corrections import apply_corrections
+from app.tasks.outbox import correct_squad_week, emit_memberships
+from .models import (
+    Squad,
+    SquadPointsShard,
+    SquadMessage,
+    SquadMessageArchive,
+    SquadWeeklyGoal,
+    SquadWeeklyTotal,
+    SquadMemberStats,
+    WeeklyResultLog,
+)
 
-# Register your models here.
+
+@admin.register(Squad)
+class SquadAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'owner', 'timezone', 'is_private', 'points', 'points_shards', 'created_at']
+    list_select_related = ['owner']
+    list_filter = ['is_private']
+    search_fields = ['name']
+    raw_id_fields = ['owner', 'members', 'admins']
+    # points only ever move through app.squads.points
+    readonly_fields = ['total_points']
+    actions = ['close_out_last_week']
+
+    def get_queryset(self, request):
+        return with_points(super().get_queryset(request))
+
+    @admin.display(description='points', ordering='points')
+    def points(self, obj):
+        return obj.points
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # only the edited columns, so a concurrent points update isn't overwritten
+        fields = [f for f in form.changed_data if f not in ('members', 'admins')]
+        if fields:
+            obj.save(update_fields=fields)
+        if 'points_shards' in fields:
+            compact_squad(obj.pk)
+        # after commit, so member edits saved by save_related are covered too
+        invalidate_squad(obj.pk)
+
+    def save_related(self, request, form, formsets, change):
+        # members go through the same path as invites and leaving (rollup
+        # deltas, sync entries, stats rows), not a bare M2M write
+        members = form.cleaned_data.pop('members', None)
+        super().save_related(request, form, formsets, change)
+        if members is not None:
+            self.sync_members(form.instance, {user.pk for user in members})
+
+    @transaction.atomic
+    def sync_members(self, squad, wanted):
+        current = set(Membership.objects.filter(squad_id=squad.pk).values_list('user_id', flat=True))
+        joined = add_members(squad, sorted(wanted - current))
+        if joined:
+            emit_memberships('member.joined', squad, joined, 1)
+        leaving = sorted(current - wanted)
+        if leaving:
+            emit_memberships('member.left', squad, leaving, -1)
+            remove_members(squad, leaving)
+
+    @admin.action(description='Close out last week for selected squads')
+    def close_out_last_week(self, request, queryset):
+        closeout_week(squads=queryset)
+        self.message_user(request, f'Closed out last week for {queryset.count()} squad(s).')
+
+
+@admin.register(SquadMessage)
+class SquadMessageAdmin(LargeTableAdmin):
+    list_display = ['id', 'squad', 'sender', 'timestamp', 'text']
+    list_select_related = ['squad', 'sender']
+    list_filter = [('timestamp', DateFieldListFilter)]
+    # exact match only: a LIKE over the whole message table would scan it
+    search_fields = ['=squad__name', '=sender__username']
+    autocomplete_fields = ['squad']
+    raw_id_fields = ['sender']
+
+
+@admin.register(SquadMessageArchive)
+class SquadMessageArchiveAdmin(LargeTableAdmin):
+    list_display = ['id', 'squad', 'first_timestamp', 'last_timestamp', 'message_count', 'created_at']
+    list_select_related = ['squad']
+    autocomplete_fields = ['squad']
+    exclude = ['payload']
+
+
+@admin.register(SquadWeeklyGoal)
+class SquadWeeklyGoalAdmin(admin.ModelAdmin):
+    list_display = [
+        'squad', 'week_start_date', 'target_distance_km', 'total_distance_km',
+        'achieved', 'points_awarded_each_member', 'closed_out',
+    ]
+    list_select_related = ['squad']
+    list_filter = ['closed_out', 'achieved']
+    date_hierarchy = 'week_start_date'
+    search_fields = ['=squad__name']
+    autocomplete_fields = ['squad']
+    ordering = ['-week_start_date', 'squad_id']
+    actions = ['recompute_squad_weeks']
+
+    @admin.action(description='Recompute selected squad-weeks from runs')
+    def recompute_squad_weeks(self, request, queryset):
+        # drift goes through the outbox as a delta of its own, so runs
+        # committing meanwhile and pending events are each counted once
+        closed = []
+        drifted = 0
+        for goal in queryset.select_related('squad'):
+            if any(correct_squad_week(goal.squad, goal.week_start_date)):
+                drifted += 1
+            if goal.closed_out:
+                closed.append((goal.squad_id, goal.week_start_date))
+        # closed weeks are re-scored as if their runs had arrived late
+        deltas = apply_corrections(closed) if closed else {}
+        self.message_user(
+            request,
+            f'Recomputed {queryset.count()} squad-week(s); {drifted} rollup(s) corrected, '
+            f'{sum(1 for d in deltas.values() if d)} closed week(s) changed points.',
+        )
+
+
+@admin.register(SquadWeeklyTotal)
+class SquadWeeklyTotalAdmin(admin.ModelAdmin):
+    list_display = ['squad', 'week_start_date', 'total_distance_km', 'run_count', 'updated_at']
+    list_select_related = ['squad']
+    date_hierarchy = 'week_start_date'
+    autocomplete_fields = ['squad']
+    ordering = ['-week_start_date', 'squad_id']
+
+
+@admin.register(SquadPointsShard)
+class SquadPointsShardAdmin(admin.ModelAdmin):
+    list_display = ['squad', 'shard', 'points']
+    list_select_related = ['squad']
+    autocomplete_fields = ['squad']
+    ordering = ['squad_id', 'shard']
+    readonly_fields = ['points']
+
+
+@admin.register(SquadMemberStats)
+class SquadMemberStatsAdmin(LargeTableAdmin):
+    list_display = ['squad', 'user', 'current_streak_weeks', 'longest_streak_weeks', 'last_week_achieved']
+    list_select_related = ['squad', 'user']
+    search_fields = ['=squad__name', '=user__username']
+    autocomplete_fields = ['squad']
+    raw_id_fields = ['user']
+
+
+@admin.register(WeeklyResultLog)
+class WeeklyResultLogAdmin(LargeTableAdmin):
+    list_display = ['squad', 'user', 'week_start_date', 'points_change']
+    list_select_related = ['squad', 'user']
+    list_filter = [('week_start_date', DateFieldListFilter)]
+    search_fields = ['=squad__name', '=user__username']
+    autocomplete_fields = ['squad']
+    raw_id_fields = ['user']
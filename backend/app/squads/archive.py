@@ -0,0 +1,85 @@
+import json
+import zlib
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Squad, SquadMessage, SquadMessageArchive
+from .search import optimize_search_index
+
+def pack_messages(rows) -> bytes:
+    payload = [
+        {
+            "id": r["id"],
+            "sender_id": r["sender_id"],
+            "text": r["text"],
+            "timestamp": r["timestamp"].isoformat(),
+        }
+        for r in rows
+    ]
+    return zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), 6)
+
+def unpack_messages(payload) -> list:
+    rows = json.loads(zlib.decompress(bytes(payload)).decode("utf-8"))
+    for r in rows:
+        r["timestamp"] = parse_datetime(r["timestamp"])
+    return rows
+
+def retention_cutoff(squad_retention_days, now=None):
+    """
+    Returns the timestamp before which messages get archived, or None when
+    the squad keeps its chat forever (retention of 0 days).
+    """
+    days = squad_retention_days
+    if days is None:
+        days = settings.SQUAD_MESSAGE_RETENTION_DAYS
+    if days <= 0:
+        return None
+    now = now or timezone.now()
+    return now - timedelta(days=days)
+
+def archive_squad_messages(squad_id, cutoff, batch_size=None) -> int:
+    """
+    Move messages older than cutoff into SquadMessageArchive chunks.
+    Each chunk is its own short transaction so we never hold locks on
+    the hot table for longer than one batch.
+    """
+    batch_size = batch_size or settings.SQUAD_MESSAGE_ARCHIVE_BATCH_SIZE
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                SquadMessage.objects.filter(squad_id=squad_id, timestamp__lt=cutoff)
+                .order_by("timestamp", "id")
+                .values("id", "sender_id", "text", "timestamp")[:batch_size]
+            )
+            if not rows:
+                break
+            SquadMessageArchive.objects.create(
+                squad_id=squad_id,
+                first_timestamp=rows[0]["timestamp"],
+                last_timestamp=rows[-1]["timestamp"],
+                message_count=len(rows),
+                payload=pack_messages(rows),
+            )
+            SquadMessage.objects.filter(id__in=[r["id"] for r in rows]).delete()
+        moved += len(rows)
+        if len(rows) < batch_size:
+            break
+    return moved
+
+def archive_expired_messages(batch_size=None) -> int:
+    """
+    Apply every squad's retention policy. Called nightly from celery.
+    """
+    now = timezone.now()
+    moved = 0
+    for squad_id, retention_days in Squad.objects.values_list("id", "message_retention_days"):
+        cutoff = retention_cutoff(retention_days, now=now)
+        if cutoff is None:
+            continue
+        moved += archive_squad_messages(squad_id, cutoff, batch_size=batch_size)
+    if moved:
+        optimize_search_index()
+    return moved
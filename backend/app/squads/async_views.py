@@ -0,0 +1,109 @@
+"""
+Async versions of the hot squad read endpoints. Payloads match the sync
+DRF views in views.py exactly; see app.common.async_views.
+
+The leaderboard, messages and weekly summary query through the async
+ORM. The goal payload comes from the response cache, whose misses
+wait on a single-flight lock, so that one view runs in a worker thread.
+"""
+import math
+from asgiref.sync import sync_to_async
+from rest_framework import exceptions
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from app.common.async_views import async_api_view, aget_object_or_404, render_response
+from app.common.response_cache import cached
+from app.common.utils import get_current_week_start, get_previous_week_start
+from .models import Squad, SquadMessage, SquadWeeklyGoal, SquadMemberStats, WeeklyResultLog
+from .rollups import asquad_week_distance
+from .slim import aleaderboard_rows, message_rows, MESSAGE_FIELDS
+from .caching import goal_tag
+from .views import SquadMessagePagination, current_goal_payload
+
+async def _member_squad(request, pk):
+    return await aget_object_or_404(Squad.objects, pk=pk, members=request.user)
+
+
+@async_api_view(throttle_scope="squad_goal")
+async def squad_goal(request, pk):
+    squad = await _member_squad(request, pk)
+    week_start = get_current_week_start(squad.timezone)
+    # same entry as the sync view; a miss blocks on single-flight, so off the event loop
+    data = await sync_to_async(cached)(
+        "squad-goal", (squad.id, week_start, "member"),
+        [goal_tag(squad.id, week_start)],
+        lambda: current_goal_payload(squad, week_start),
+    )
+    return render_response(request, data)
+
+@async_api_view(throttle_scope="leaderboard")
+async def squad_leaderboard(request, pk):
+    squad = await _member_squad(request, pk)
+    data = await aleaderboard_rows(squad.id)
+    return render_response(request, {"members": data})
+
+@async_api_view
+async def my_weekly_summary(request):
+    user = request.user
+    out = []
+    async for squad in user.squads.all():
+        current_week = get_current_week_start(squad.timezone)
+        prev_week = get_previous_week_start(squad.timezone)
+        goal = await SquadWeeklyGoal.objects.filter(squad=squad, week_start_date=current_week).afirst()
+        wr = await WeeklyResultLog.objects.filter(user=user, squad=squad, week_start_date=prev_week).afirst()
+
+        if goal:
+            progress_cur = await asquad_week_distance(squad.id, goal.week_start_date)
+            goal_cur = goal.target_distance_km
+            achieved = goal.achieved
+        else:
+            progress_cur = 0.0
+            goal_cur = 0.0
+            achieved = False
+
+        stats = await SquadMemberStats.objects.filter(squad=squad, user=user).afirst()
+        out.append({
+            "squad_id": squad.id,
+            "squad_name": squad.name,
+            "goal_cur": goal_cur,
+            "progress_cur": progress_cur,
+            "achieved": achieved,
+            "points_change_last_closeout": wr.points_change if wr else 0,
+            "current_streak_weeks": stats.current_streak_weeks if stats else 0,
+            "longest_streak_weeks": stats.longest_streak_weeks if stats else 0,
+        })
+    return render_response(request, {"summary": out})
+
+@async_api_view
+async def squad_messages(request, pk):
+    squad = await _member_squad(request, pk)
+    qs = SquadMessage.objects.filter(squad=squad).order_by("-timestamp")
+    page_size = SquadMessagePagination.page_size
+
+    # same contract as PageNumberPagination
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        raise exceptions.NotFound("Invalid page.")
+    count = await qs.acount()
+    num_pages = max(1, math.ceil(count / page_size))
+    if page < 1 or page > num_pages:
+        raise exceptions.NotFound("Invalid page.")
+
+    offset = (page - 1) * page_size
+    rows = [r async for r in qs.values(*MESSAGE_FIELDS)[offset:offset + page_size]]
+
+    url = request.build_absolute_uri()
+    next_url = replace_query_param(url, "page", page + 1) if page < num_pages else None
+    if page <= 1:
+        prev_url = None
+    elif page == 2:
+        prev_url = remove_query_param(url, "page")
+    else:
+        prev_url = replace_query_param(url, "page", page - 1)
+
+    return render_response(request, {
+        "count": count,
+        "next": next_url,
+        "previous": prev_url,
+        "results": message_rows(rows),
+    })
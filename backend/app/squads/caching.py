@@ -0,0 +1,21 @@
+"""
+Response cache tags for squad payloads (app.common.response_cache).
+
+squad:<id> covers the squad row, its membership, points and member
+streaks; squad-goal:<id>:<week> covers that week's goal and distance
+rollup. Write paths call invalidate_squad / invalidate_goal next to
+their change-log record() calls.
+"""
+from app.common.response_cache import invalidate_tags
+
+def squad_tag(squad_id):
+    return f"squad:{squad_id}"
+
+def goal_tag(squad_id, week_start):
+    return f"squad-goal:{squad_id}:{week_start.isoformat()}"
+
+def invalidate_squad(squad_id, *weeks):
+    invalidate_tags(squad_tag(squad_id), *(goal_tag(squad_id, week) for week in weeks))
+
+def invalidate_goal(squad_id, week_start):
+    invalidate_tags(goal_tag(squad_id, week_start))
@@ -0,0 +1,81 @@
+"""
+Membership reads and writes that stay one statement each, however big the
+squad: EXISTS on the membership table instead of loading squad.members,
+and ON CONFLICT inserts instead of check-then-add.
+"""
+from app.common.upsert import upsert, upsert_many
+from app.sync.changes import SQUAD, record, record_many
+from .caching import invalidate_squad
+from .models import Squad, SquadMemberStats, SquadReadCursor
+from .unread import latest_message_id
+
+Membership = Squad.members.through
+
+def is_member(squad_id, user_id):
+    return Membership.objects.filter(squad_id=squad_id, user_id=user_id).exists()
+
+def add_member(squad, user_id):
+    """
+    Add user_id to the squad and make sure they have a stats row.
+    Returns True if they were not already a member; concurrent calls for
+    the same user get True exactly once.
+    """
+    _, joined = upsert(Membership, {"squad_id": squad.id, "user_id": user_id}, conflict=["squad", "user"])
+    upsert(SquadMemberStats, {"squad_id": squad.id, "user_id": user_id}, conflict=["squad", "user"])
+    if joined:
+        start_read_cursors(squad, [user_id])
+        record(SQUAD, squad.id, squad_id=squad.id)
+        invalidate_squad(squad.id)
+    return joined
+
+def add_members(squad, user_ids):
+    """
+    add_member() for many users in a fixed number of statements. Returns
+    the ids that were not already members, exactly once under races.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return []
+    joined = upsert_many(
+        Membership, [{"squad_id": squad.id, "user_id": u} for u in user_ids], conflict=["squad", "user"],
+    )
+    SquadMemberStats.objects.bulk_create(
+        [SquadMemberStats(squad_id=squad.id, user_id=u) for u in user_ids], ignore_conflicts=True,
+    )
+    joined_ids = [m.user_id for m in joined]
+    if joined_ids:
+        start_read_cursors(squad, joined_ids)
+        record(SQUAD, squad.id, squad_id=squad.id)
+        invalidate_squad(squad.id)
+    return joined_ids
+
+def start_read_cursors(squad, user_ids):
+    # new members start with the history read, not "99+" unread
+    latest = latest_message_id(squad.id)
+    upsert_many(
+        SquadReadCursor,
+        [{"squad_id": squad.id, "user_id": u, "last_read_message_id": latest} for u in user_ids],
+        conflict=["squad", "user"], update=["last_read_message_id"],
+    )
+
+def remove_members(squad, user_ids):
+    """
+    Take users out of the squad (and its admins) and drop their read
+    cursors. Returns the ids that were members; each of them gets a
+    squad delete in their sync feed.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    removed = list(
+        Membership.objects.filter(squad_id=squad.id, user_id__in=user_ids).values_list("user_id", flat=True)
+    )
+    if not removed:
+        return []
+    Membership.objects.filter(squad_id=squad.id, user_id__in=removed).delete()
+    squad.admins.remove(*removed)
+    SquadReadCursor.objects.filter(squad_id=squad.id, user_id__in=removed).delete()
+    record_many([
+        (SQUAD, squad.id, None, squad.id, False),
+        *((SQUAD, squad.id, user_id, None, True) for user_id in removed),
+    ])
+    invalidate_squad(squad.id)
+    return removed
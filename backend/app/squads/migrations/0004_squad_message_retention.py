@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('squads', '0003_alter_squad_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SquadMessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('message_count', models.IntegerField()),
+                ('payload', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='squadmessage',
+            options={},
+        ),
+        migrations.AddField(
+            model_name='squad',
+            name='message_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='squadmessage',
+            index=models.Index(fields=['squad', '-timestamp'], name='squads_msg_squad_ts_idx'),
+        ),
+        migrations.AddField(
+            model_name='squadmessagearchive',
+            name='squad',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_archives', to='squads.squad'),
+        ),
+        migrations.AddIndex(
+            model_name='squadmessagearchive',
+            index=models.Index(fields=['squad', '-id'], name='squads_arch_squad_id_idx'),
+        ),
+    ]
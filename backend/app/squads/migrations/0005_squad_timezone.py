@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:56
+
+import app.common.utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('squads', '0004_squad_message_retention'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='squad',
+            name='timezone',
+            field=models.CharField(default='UTC', max_length=64, validators=[app.common.utils.validate_timezone]),
+        ),
+    ]
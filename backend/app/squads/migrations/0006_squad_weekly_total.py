@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('squads', '0005_squad_timezone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SquadWeeklyTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start_date', models.DateField()),
+                ('total_distance_km', models.FloatField(default=0)),
+                ('run_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('squad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_totals', to='squads.squad')),
+            ],
+            options={
+                'unique_together': {('squad', 'week_start_date')},
+            },
+        ),
+    ]
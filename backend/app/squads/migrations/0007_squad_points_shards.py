@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-19 16:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('squads', '0006_squad_weekly_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='squad',
+            name='points_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='SquadPointsShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('points', models.IntegerField(default=0)),
+                ('squad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='point_shards', to='squads.squad')),
+            ],
+            options={
+                'unique_together': {('squad', 'shard')},
+            },
+        ),
+    ]
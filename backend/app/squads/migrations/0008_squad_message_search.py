@@ -0,0 +1,101 @@
+from django.db import migrations
+
+# app.squads.search.SEARCH_CONFIG
+CONFIG = "pg_catalog.english"
+BACKFILL_BATCH = 10000
+
+POSTGRES_FORWARD = [
+    # no default, no rewrite: adding the column is instant on a big table
+    "ALTER TABLE squads_squadmessage ADD COLUMN IF NOT EXISTS search tsvector",
+    "DROP TRIGGER IF EXISTS squads_message_search_update ON squads_squadmessage",
+    f"""CREATE TRIGGER squads_message_search_update
+        BEFORE INSERT OR UPDATE OF text ON squads_squadmessage
+        FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search, '{CONFIG}', text)""",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX CONCURRENTLY IF EXISTS squads_msg_search_idx",
+    "DROP TRIGGER IF EXISTS squads_message_search_update ON squads_squadmessage",
+    "ALTER TABLE squads_squadmessage DROP COLUMN IF EXISTS search",
+]
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS squads_squadmessage_fts USING fts5(
+        text, squad_id, content='squads_squadmessage', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS squads_message_fts_insert AFTER INSERT ON squads_squadmessage BEGIN
+        INSERT INTO squads_squadmessage_fts(rowid, text, squad_id) VALUES (new.id, new.text, new.squad_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS squads_message_fts_delete AFTER DELETE ON squads_squadmessage BEGIN
+        INSERT INTO squads_squadmessage_fts(squads_squadmessage_fts, rowid, text, squad_id)
+        VALUES ('delete', old.id, old.text, old.squad_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS squads_message_fts_update AFTER UPDATE ON squads_squadmessage BEGIN
+        INSERT INTO squads_squadmessage_fts(squads_squadmessage_fts, rowid, text, squad_id)
+        VALUES ('delete', old.id, old.text, old.squad_id);
+        INSERT INTO squads_squadmessage_fts(rowid, text, squad_id) VALUES (new.id, new.text, new.squad_id);
+    END""",
+    "INSERT INTO squads_squadmessage_fts(squads_squadmessage_fts) VALUES ('rebuild')",
+    "INSERT INTO squads_squadmessage_fts(squads_squadmessage_fts) VALUES ('optimize')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS squads_message_fts_insert",
+    "DROP TRIGGER IF EXISTS squads_message_fts_delete",
+    "DROP TRIGGER IF EXISTS squads_message_fts_update",
+    "DROP TABLE IF EXISTS squads_squadmessage_fts",
+]
+
+
+def create_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        for sql in POSTGRES_FORWARD:
+            schema_editor.execute(sql)
+        backfill(schema_editor)
+        # (squad_id, search) in one GIN index needs btree_gin
+        try:
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+            columns = "squad_id, search"
+        except Exception:
+            columns = "search"
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS squads_msg_search_idx "
+            f"ON squads_squadmessage USING gin ({columns})"
+        )
+    elif vendor == "sqlite":
+        for sql in SQLITE_FORWARD:
+            schema_editor.execute(sql)
+
+
+def backfill(schema_editor):
+    # existing rows, in short autocommitted batches (the migration is not atomic)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT coalesce(max(id), 0) FROM squads_squadmessage")
+        last_id = cursor.fetchone()[0]
+        for start in range(0, last_id + 1, BACKFILL_BATCH):
+            cursor.execute(
+                f"UPDATE squads_squadmessage SET search = to_tsvector('{CONFIG}', text) "
+                "WHERE id >= %s AND id < %s AND search IS NULL",
+                [start, start + BACKFILL_BATCH],
+            )
+
+
+def drop_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"postgresql": POSTGRES_BACKWARD, "sqlite": SQLITE_BACKWARD}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('squads', '0007_squad_points_shards'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -0,0 +1,56 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+INDEX = "squads_msg_squad_id_idx"
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    # CONCURRENTLY: no write lock on the message table while it builds
+    concurrently = " CONCURRENTLY" if vendor == "postgresql" else ""
+    schema_editor.execute(
+        f'CREATE INDEX{concurrently} IF NOT EXISTS "{INDEX}" ON "squads_squadmessage" ("squad_id", "id")'
+    )
+
+
+def drop_index(apps, schema_editor):
+    concurrently = " CONCURRENTLY" if schema_editor.connection.vendor == "postgresql" else ""
+    schema_editor.execute(f'DROP INDEX{concurrently} IF EXISTS "{INDEX}"')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('squads', '0008_squad_message_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SquadReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('squad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='squads.squad')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='squad_read_cursors', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('squad', 'user')},
+            },
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='squadmessage',
+                    index=models.Index(fields=['squad', 'id'], name=INDEX),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_index, drop_index),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+# the hourly closeout looks for goals still open after their week
+OPEN_GOALS = models.Index(
+    fields=['week_start_date'], condition=models.Q(closed_out=False), name='squads_goal_open_week_idx',
+)
+
+
+def create_index(apps, schema_editor):
+    model = apps.get_model('squads', 'SquadWeeklyGoal')
+    if schema_editor.connection.vendor == "postgresql":
+        # CONCURRENTLY: no write lock on the goal table while it builds
+        schema_editor.add_index(model, OPEN_GOALS, concurrently=True)
+    else:
+        schema_editor.add_index(model, OPEN_GOALS)
+
+
+def drop_index(apps, schema_editor):
+    model = apps.get_model('squads', 'SquadWeeklyGoal')
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.remove_index(model, OPEN_GOALS, concurrently=True)
+    else:
+        schema_editor.remove_index(model, OPEN_GOALS)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('squads', '0009_squad_read_cursor'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='squadweeklygoal', index=OPEN_GOALS),
+            ],
+            database_operations=[
+                migrations.RunPython(create_index, drop_index),
+            ],
+        ),
+    ]
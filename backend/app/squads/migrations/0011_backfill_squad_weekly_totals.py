@@ -0,0 +1,51 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from app.common.utils import get_current_week_start, week_range
+
+
+def backfill_weekly_totals(apps, schema_editor):
+    """
+    Fill SquadWeeklyTotal, which the outbox consumer only ever adjusts by
+    deltas, for every open goal week and every squad's current week, and
+    mirror the totals onto the open goals. Runs before the code that
+    emits outbox events takes traffic, so nothing is counted twice.
+    """
+    Squad = apps.get_model('squads', 'Squad')
+    SquadWeeklyGoal = apps.get_model('squads', 'SquadWeeklyGoal')
+    SquadWeeklyTotal = apps.get_model('squads', 'SquadWeeklyTotal')
+    RunLog = apps.get_model('runs', 'RunLog')
+    Membership = Squad.members.through
+
+    timezones = dict(Squad.objects.values_list('id', 'timezone'))
+    weeks = set(SquadWeeklyGoal.objects.filter(closed_out=False).values_list('squad_id', 'week_start_date'))
+    weeks.update((squad_id, get_current_week_start(tz_name)) for squad_id, tz_name in timezones.items())
+
+    for squad_id, week_start in sorted(weeks):
+        start_dt, end_dt = week_range(week_start, timezones[squad_id])
+        agg = RunLog.objects.filter(
+            user_id__in=Membership.objects.filter(squad_id=squad_id).values('user_id'),
+            timestamp__gte=start_dt,
+            timestamp__lt=end_dt,
+            excluded=False,
+        ).aggregate(km=Sum('distance_km'), runs=Count('id'))
+        km = agg['km'] or 0.0
+        SquadWeeklyTotal.objects.update_or_create(
+            squad_id=squad_id, week_start_date=week_start,
+            defaults={'total_distance_km': km, 'run_count': agg['runs']},
+        )
+        for goal in SquadWeeklyGoal.objects.filter(squad_id=squad_id, week_start_date=week_start, closed_out=False):
+            goal.total_distance_km = km
+            goal.achieved = 0 < goal.target_distance_km <= km
+            goal.save(update_fields=['total_distance_km', 'achieved'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('squads', '0010_squad_goal_open_index'),
+        ('runs', '0004_run_anomaly_score'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_weekly_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+from django.db.models import Max
+
+BATCH_SIZE = 1000
+
+
+def backfill_read_cursors(apps, schema_editor):
+    """
+    Start a read cursor at the squad's latest message for every membership
+    from before cursors existed, as joining does now; without one every
+    member of a busy squad would see it at SQUAD_UNREAD_COUNT_CAP. Cursors
+    already written (joins, reads since the deploy) are left alone.
+    """
+    Squad = apps.get_model('squads', 'Squad')
+    SquadMessage = apps.get_model('squads', 'SquadMessage')
+    SquadReadCursor = apps.get_model('squads', 'SquadReadCursor')
+    Membership = Squad.members.through
+
+    latest = dict(
+        SquadMessage.objects.values('squad_id').annotate(latest=Max('id')).values_list('squad_id', 'latest')
+    )
+    batch = []
+    for squad_id, user_id in Membership.objects.values_list('squad_id', 'user_id').iterator(chunk_size=BATCH_SIZE):
+        batch.append(SquadReadCursor(squad_id=squad_id, user_id=user_id, last_read_message_id=latest.get(squad_id, 0)))
+        if len(batch) == BATCH_SIZE:
+            SquadReadCursor.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    SquadReadCursor.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('squads', '0011_backfill_squad_weekly_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_read_cursors, migrations.RunPython.noop),
+    ]
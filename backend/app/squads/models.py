@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
+from app.common.utils import validate_timezone
 
 class Squad(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -11,10 +12,29 @@ class Squad(models.Model):
     is_private = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
     total_points = models.IntegerField(default=0)
+    # IANA zone name; weeks run Monday 00:00 -> Monday 00:00 in this zone
+    timezone = models.CharField(max_length=64, default="UTC", validators=[validate_timezone])
+    # days of chat kept in SquadMessage; None = settings default, 0 = keep forever
+    message_retention_days = models.PositiveIntegerField(null=True, blank=True)
+    # 0 = points are added to total_points directly; N = spread over N
+    # SquadPointsShard rows (see app.squads.points) for write-hot squads
+    points_shards = models.PositiveSmallIntegerField(default=0)
 
     def __str__(self):
         return self.name
 
+class SquadPointsShard(models.Model):
+    """
+    One slice of a sharded squad's uncompacted points. A squad's balance is
+    total_points plus the sum of its shards; compaction folds shards back in.
+    """
+    squad = models.ForeignKey(Squad, on_delete=models.CASCADE, related_name="point_shards")
+    shard = models.PositiveSmallIntegerField()
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("squad","shard")
+
 class SquadMessage(models.Model):
     squad = models.ForeignKey(Squad, on_delete=models.CASCADE, related_name="messages")
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -22,7 +42,39 @@ class SquadMessage(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
-        ordering = ["timestamp"]
+        indexes = [
+            models.Index(fields=["squad", "-timestamp"], name="squads_msg_squad_ts_idx"),
+            # unread counts: id ranges within one squad (app.squads.unread)
+            models.Index(fields=["squad", "id"], name="squads_msg_squad_id_idx"),
+        ]
+
+class SquadReadCursor(models.Model):
+    """
+    How far a member has read a squad's chat: messages with a higher id
+    are unread. Only ever moves forward.
+    """
+    squad = models.ForeignKey(Squad, on_delete=models.CASCADE, related_name="read_cursors")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="squad_read_cursors")
+    last_read_message_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("squad","user")
+
+class SquadMessageArchive(models.Model):
+    """A compressed chunk of chat history moved out of SquadMessage"""
+    squad = models.ForeignKey(Squad, on_delete=models.CASCADE, related_name="message_archives")
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    message_count = models.IntegerField()
+    # zlib-compressed JSON list of {id, sender_id, text, timestamp}
+    payload = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["squad", "-id"], name="squads_arch_squad_id_idx"),
+        ]
 
 class SquadWeeklyGoal(models.Model):
     squad = models.ForeignKey(Squad, on_delete=models.CASCADE, related_name="weekly_goals")
@@ -34,6 +86,24 @@ class SquadWeeklyGoal(models.Model):
     closed_out = models.BooleanField(default=False)
     unit_entered = models.CharField(max_length=5, default="km")  # "km" or "mi"
 
+    class Meta:
+        unique_together = ("squad","week_start_date")
+        indexes = [
+            # the hourly closeout looks for goals still open after their week
+            models.Index(fields=["week_start_date"], condition=models.Q(closed_out=False), name="squads_goal_open_week_idx"),
+        ]
+
+class SquadWeeklyTotal(models.Model):
+    """
+    Distance logged by a squad's members per week, kept current by the
+    outbox consumer so reads never aggregate RunLog.
+    """
+    squad = models.ForeignKey(Squad, on_delete=models.CASCADE, related_name="weekly_totals")
+    week_start_date = models.DateField()
+    total_distance_km = models.FloatField(default=0)
+    run_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
         unique_together = ("squad","week_start_date")
 
@@ -0,0 +1,112 @@
+"""
+Squad points counter.
+
+Writers never read-modify-write Squad.total_points: awards are a single
+UPDATE ... SET total_points = total_points + delta. For squads that take
+many concurrent awards the delta goes instead to one of points_shards
+SquadPointsShard rows picked at random, so writers rarely queue on the
+same row lock. Reads sum total_points and the shards; the periodic
+compaction folds shards back into total_points. Spending locks the squad
+row and compacts it first, so a balance can never be overdrawn.
+"""
+import random
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import Squad, SquadPointsShard
+
+def add_squad_points(squad, delta):
+    """
+    Atomically add delta (may be negative) to the squad's points.
+    """
+    if not delta:
+        return
+    if not squad.points_shards:
+        Squad.objects.filter(pk=squad.pk).update(total_points=F("total_points") + delta)
+        return
+    shard = random.randrange(squad.points_shards)
+    shards = SquadPointsShard.objects.filter(squad_id=squad.pk, shard=shard)
+    if not shards.update(points=F("points") + delta):
+        SquadPointsShard.objects.get_or_create(squad_id=squad.pk, shard=shard)
+        shards.update(points=F("points") + delta)
+
+def shard_points_sum():
+    # correlated to the outer Squad row; 0 for unsharded squads
+    return Coalesce(
+        Subquery(
+            SquadPointsShard.objects.filter(squad_id=OuterRef("pk"))
+            .order_by().values("squad_id").annotate(s=Sum("points")).values("s"),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+def with_points(queryset):
+    """
+    Annotate `points`: the squad's balance including uncompacted shards.
+    """
+    return queryset.annotate(points=F("total_points") + shard_points_sum())
+
+def squad_points(squad):
+    if hasattr(squad, "points"):
+        return squad.points
+    if not squad.points_shards:
+        return squad.total_points
+    return with_points(Squad.objects.filter(pk=squad.pk)).values_list("points", flat=True).get()
+
+def compact_squad(squad_id):
+    """
+    Fold a squad's shards into total_points. Shard rows are locked for the
+    rest of the caller's transaction, so awards that land meanwhile wait
+    and then apply to the zeroed shard.
+    """
+    with transaction.atomic():
+        shards = list(
+            SquadPointsShard.objects.select_for_update()
+            .filter(squad_id=squad_id).exclude(points=0)
+            .values_list("id", "points")
+        )
+        folded = sum(points for _, points in shards)
+        if shards:
+            SquadPointsShard.objects.filter(id__in=[i for i, _ in shards]).update(points=0)
+            Squad.objects.filter(pk=squad_id).update(total_points=F("total_points") + folded)
+        return folded
+
+def compact_point_shards():
+    """
+    Periodic job: compact every squad with pending shard points. Returns
+    the number of squads compacted.
+    """
+    squad_ids = list(
+        SquadPointsShard.objects.exclude(points=0)
+        .order_by("squad_id").values_list("squad_id", flat=True).distinct()
+    )
+    for squad_id in squad_ids:
+        compact_squad(squad_id)
+    return len(squad_ids)
+
+def lock_squad_balances(squad_ids):
+    """
+    Within the caller's transaction: lock the squads (in id order, so two
+    purchases cannot deadlock), compact them, and return {squad_id: points}.
+    """
+    squad_ids = sorted(squad_ids)
+    list(Squad.objects.select_for_update().filter(pk__in=squad_ids).order_by("pk").values_list("pk"))
+    for squad_id in squad_ids:
+        compact_squad(squad_id)
+    return dict(Squad.objects.filter(pk__in=squad_ids).order_by("pk").values_list("pk", "total_points"))
+
+def spend_squad_points(squad_id, amount):
+    """
+    Within the caller's transaction and after lock_squad_balances.
+    """
+    Squad.objects.filter(pk=squad_id).update(total_points=F("total_points") - amount)
+
+def set_point_shards(squad, count):
+    """
+    Change how many shards a squad's awards are spread over. Pending shard
+    points are folded in now; the emptied rows are left for reuse.
+    """
+    squad.points_shards = count
+    squad.save(update_fields=["points_shards"])
+    compact_squad(squad.pk)
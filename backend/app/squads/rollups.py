@@ -0,0 +1,115 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Sum, Count, Value, When
+from app.common.utils import week_range, get_current_week_start
+from app.runs.models import RunLog
+from app.sync.changes import GOAL, record
+from .caching import invalidate_goal
+from .models import SquadWeeklyGoal, SquadWeeklyTotal
+
+def squad_week_distance(squad_id, week_start):
+    total = (
+        SquadWeeklyTotal.objects
+        .filter(squad_id=squad_id, week_start_date=week_start)
+        .values_list("total_distance_km", flat=True)
+        .first()
+    )
+    return total or 0.0
+
+async def asquad_week_distance(squad_id, week_start):
+    total = await (
+        SquadWeeklyTotal.objects
+        .filter(squad_id=squad_id, week_start_date=week_start)
+        .values_list("total_distance_km", flat=True)
+        .afirst()
+    )
+    return total or 0.0
+
+def user_week_runs(user_id, week_start, tz_name):
+    """
+    (distance_km, run count) a user logged in one squad-local week.
+    """
+    start_dt, end_dt = week_range(week_start, tz_name)
+    agg = RunLog.objects.filter(
+        user_id=user_id,
+        timestamp__gte=start_dt,
+        timestamp__lt=end_dt,
+        excluded=False,
+    ).aggregate(km=Sum("distance_km"), runs=Count("id"))
+    return agg["km"] or 0.0, agg["runs"]
+
+def membership_delta(user_id, tz_name, sign=1):
+    """
+    Outbox delta for a member joining (sign=1) or leaving (sign=-1): their
+    runs this week start / stop counting toward the squad.
+    """
+    week_start = get_current_week_start(tz_name)
+    km, runs = user_week_runs(user_id, week_start, tz_name)
+    return [week_start.isoformat(), sign * km, sign * runs]
+
+def membership_deltas(user_ids, tz_name, sign=1):
+    """
+    membership_delta() for many users in one grouped query:
+    {user_id: [week, km, runs]}, users without runs included.
+    """
+    week_start = get_current_week_start(tz_name)
+    start_dt, end_dt = week_range(week_start, tz_name)
+    rows = (
+        RunLog.objects.filter(
+            user_id__in=user_ids,
+            timestamp__gte=start_dt,
+            timestamp__lt=end_dt,
+            excluded=False,
+        )
+        .values("user_id")
+        .annotate(km=Sum("distance_km"), runs=Count("id"))
+    )
+    week = week_start.isoformat()
+    deltas = {user_id: [week, 0.0, 0] for user_id in user_ids}
+    for row in rows:
+        deltas[row["user_id"]] = [week, sign * (row["km"] or 0.0), sign * row["runs"]]
+    return deltas
+
+def apply_week_delta(squad_id, week_start, km, runs):
+    """
+    Add a distance / run-count delta to one squad-week rollup (upsert),
+    then mirror the new total onto the open SquadWeeklyGoal for that week.
+    """
+    updated = SquadWeeklyTotal.objects.filter(squad_id=squad_id, week_start_date=week_start).update(
+        total_distance_km=F("total_distance_km") + km,
+        run_count=F("run_count") + runs,
+    )
+    if not updated:
+        try:
+            with transaction.atomic():
+                SquadWeeklyTotal.objects.create(
+                    squad_id=squad_id, week_start_date=week_start,
+                    total_distance_km=km, run_count=runs,
+                )
+        except IntegrityError:
+            # a concurrent consumer created the row first
+            SquadWeeklyTotal.objects.filter(squad_id=squad_id, week_start_date=week_start).update(
+                total_distance_km=F("total_distance_km") + km,
+                run_count=F("run_count") + runs,
+            )
+
+    total = squad_week_distance(squad_id, week_start)
+    mirror_to_goal(squad_id, week_start, total)
+    return total
+
+def mirror_to_goal(squad_id, week_start, total):
+    # the goal payload reads the rollup, so it is stale even without a goal row
+    invalidate_goal(squad_id, week_start)
+    goal_id = (
+        SquadWeeklyGoal.objects.filter(squad_id=squad_id, week_start_date=week_start, closed_out=False)
+        .values_list("id", flat=True).first()
+    )
+    if goal_id is None:
+        return
+    SquadWeeklyGoal.objects.filter(id=goal_id, closed_out=False).update(
+        total_distance_km=total,
+        achieved=Case(
+            When(target_distance_km__gt=0, target_distance_km__lte=total, then=Value(True)),
+            default=Value(False),
+        ),
+    )
+    record(GOAL, goal_id, squad_id=squad_id)
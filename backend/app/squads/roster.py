@@ -0,0 +1,66 @@
+"""
+Keyset pagination over a squad's members.
+
+Pages are cut with WHERE (sort key, membership id) after the previous
+page's last row, never OFFSET, so page 200 of a 10k-member squad costs
+the same as page 1. The cursor is that last row's key, opaque to clients.
+"""
+import base64
+import orjson
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .membership import Membership
+from .models import WeeklyResultLog
+from .slim import MEMBER_FIELDS, user_payload
+
+MEMBER_SORTS = ("contribution", "name")
+
+def encode_member_cursor(sort, key, membership_id):
+    raw = orjson.dumps([sort, key, membership_id])
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_member_cursor(value, sort):
+    """
+    (key, membership id) from a cursor, None for the first page. Raises
+    ValueError for anything this sort did not produce.
+    """
+    if not value:
+        return None
+    try:
+        cursor_sort, key, membership_id = orjson.loads(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+    except (orjson.JSONDecodeError, ValueError, TypeError):
+        raise ValueError("bad cursor")
+    expected = int if sort == "contribution" else str
+    if cursor_sort != sort or type(key) is not expected or type(membership_id) is not int:
+        raise ValueError("bad cursor")
+    return key, membership_id
+
+def member_page(squad_id, sort, cursor, limit):
+    """
+    One page of members as user payloads, plus the cursor for the next
+    page (None on the last one). contribution = the squad points closeout
+    recorded for the member in this squad (their WeeklyResultLog rows),
+    best first; name = username A-Z.
+    """
+    qs = Membership.objects.filter(squad_id=squad_id)
+    if sort == "contribution":
+        squad_points = (
+            WeeklyResultLog.objects.filter(squad_id=OuterRef("squad_id"), user_id=OuterRef("user_id"))
+            .values("user_id").annotate(total=Sum("points_change")).values("total")
+        )
+        qs = qs.annotate(key=Coalesce(Subquery(squad_points), Value(0)))
+        order = (F("key").desc(), "id")
+        after = lambda key, pk: Q(key__lt=key) | Q(key=key, id__gt=pk)
+    else:
+        qs = qs.annotate(key=F("user__username"))
+        order = ("key", "id")
+        after = lambda key, pk: Q(key__gt=key) | Q(key=key, id__gt=pk)
+    if cursor is not None:
+        qs = qs.filter(after(*cursor))
+    rows = list(qs.order_by(*order).values("id", "key", *MEMBER_FIELDS)[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_member_cursor(sort, rows[-1]["key"], rows[-1]["id"])
+    return [user_payload(row, "user__") for row in rows], next_cursor
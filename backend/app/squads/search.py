@@ -0,0 +1,258 @@
+"""
+Full-text search within one squad's chat.
+
+Postgres: SquadMessage has a `search` tsvector column (not on the model)
+filled by a trigger on insert/update of text, with a GIN index on
+(squad_id, search) when btree_gin is available, else on search alone.
+SQLite (local runs and tests): an FTS5 external-content table over the
+message table, kept in sync by triggers, with squad_id indexed as a
+column so a squad's matches come straight out of the index. Both are
+created by migration 0008.
+
+A search looks at the newest MESSAGE_SEARCH_CANDIDATES matches in the
+squad, ranks them (ts_rank / bm25, higher is better) and pages through
+them on (rank, id) keyset cursors, so the cost is bounded however long
+the chat history grows. Deletes (archival) leave tombstones in the FTS5
+index; optimize_search_index() merges them away after the nightly run.
+Archived messages (SquadMessageArchive) are not
+searched. `highlighted` is the HTML-escaped message text with matches
+wrapped in <mark></mark>: the database marks matches with private-use
+sentinel characters, which are swapped for the tags after escaping.
+
+Queries use websearch syntax on both backends: words (all required),
+"quoted phrases", -excluded words or phrases, and `or` between
+alternatives. Postgres parses them with websearch_to_tsquery;
+fts5_query() translates them into an FTS5 expression.
+
+Any other database has neither index: the same query syntax becomes
+icontains filters over the newest MESSAGE_SEARCH_CANDIDATES messages,
+unranked (rank 0, newest first), so search still answers, slowly.
+"""
+import base64
+import re
+import orjson
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.utils.html import escape
+from .models import SquadMessage
+from .slim import MESSAGE_FIELDS, message_rows
+
+# must match migration 0008's trigger
+SEARCH_CONFIG = "english"
+MARK_START, MARK_END = "<mark>", "</mark>"
+# what the database wraps matches in; never produced by escape()
+SENTINEL_START, SENTINEL_END = "\ue000", "\ue001"
+# a "quoted phrase" (closing quote optional) or a bare word, maybe negated
+QUERY_TOKEN = re.compile(r'(-?)(?:"([^"]*)"?|(\S+))')
+
+POSTGRES_SQL = """
+SELECT p.id, p.rank, ts_headline(%s::regconfig, p.text, p.query, %s)
+FROM (
+    SELECT h.id, h.text, h.query, ts_rank(h.search, h.query)::float8 AS rank
+    FROM (
+        SELECT m.id, m.text, m.search, q.query
+        FROM squads_squadmessage m, websearch_to_tsquery(%s::regconfig, %s) AS q(query)
+        WHERE m.squad_id = %s AND m.search @@ q.query
+        ORDER BY m.id DESC
+        LIMIT %s
+    ) h
+) p
+{after}
+ORDER BY p.rank DESC, p.id DESC
+LIMIT %s
+"""
+
+SQLITE_SQL = """
+SELECT p.id, p.rank
+FROM (
+    SELECT rowid AS id, -bm25(squads_squadmessage_fts) AS rank
+    FROM squads_squadmessage_fts
+    WHERE squads_squadmessage_fts MATCH %s
+    ORDER BY rowid DESC
+    LIMIT %s
+) p
+{after}
+ORDER BY p.rank DESC, p.id DESC
+LIMIT %s
+"""
+
+# highlight() only for the page, not every candidate
+SQLITE_HIGHLIGHT_SQL = """
+SELECT rowid, highlight(squads_squadmessage_fts, 0, %s, %s)
+FROM squads_squadmessage_fts
+WHERE squads_squadmessage_fts MATCH %s AND rowid IN ({ids})
+"""
+
+def encode_search_cursor(rank, message_id):
+    raw = orjson.dumps([rank, message_id])
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_search_cursor(value):
+    """
+    (rank, message id) from a cursor, None for the first page. Raises
+    ValueError for anything search did not produce.
+    """
+    if not value:
+        return None
+    try:
+        rank, message_id = orjson.loads(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+    except (orjson.JSONDecodeError, ValueError, TypeError):
+        raise ValueError("bad cursor")
+    if type(rank) not in (int, float) or type(message_id) is not int:
+        raise ValueError("bad cursor")
+    return float(rank), message_id
+
+def parse_search_query(query):
+    """
+    (groups, excluded) from a websearch-style query: groups is a list of
+    alternatives (`or`), each a list of terms that must all match;
+    excluded lists the negated terms. A term is a tuple of its \\w+
+    tokens: one for a word, several for a phrase.
+    """
+    groups, excluded, either = [[]], [], False
+    for negated, phrase, word in QUERY_TOKEN.findall(query):
+        if not negated and not phrase and word.lower() == "or":
+            either = True
+            continue
+        tokens = tuple(re.findall(r"\w+", phrase or word))
+        if not tokens:
+            continue
+        if negated:
+            excluded.append(tokens)
+            continue
+        if either and groups[-1]:
+            groups.append([])
+        groups[-1].append(tokens)
+        either = False
+    return [group for group in groups if group], excluded
+
+def fts5_query(squad_id, query):
+    """
+    The websearch-style query as an FTS5 expression within the squad, or
+    None if it has nothing to match on. Each word or phrase becomes a
+    quoted FTS5 phrase of its tokens; `or` joins the terms either side
+    of it, and negated terms are subtracted with NOT.
+    """
+    groups, excluded = parse_search_query(query)
+    if not groups and not excluded:
+        return None
+    phrase = '"{}"'.format
+    match = f'squad_id:"{squad_id}"'
+    if groups:
+        included = " OR ".join(
+            "({})".format(" AND ".join(phrase(" ".join(term)) for term in group)) for group in groups
+        )
+        match = f"({match} AND text:({included}))"
+    if excluded:
+        match += " NOT text:({})".format(" OR ".join(phrase(" ".join(term)) for term in excluded))
+    return match
+
+def mark_highlights(text):
+    """
+    HTML-escape text highlighted with the sentinels, then turn the
+    sentinels into <mark></mark>.
+    """
+    if text is None:
+        return None
+    return str(escape(text)).replace(SENTINEL_START, MARK_START).replace(SENTINEL_END, MARK_END)
+
+def ranked_hits(squad_id, query, cursor, limit):
+    """
+    [(message id, rank, highlighted text)], best first, at most limit.
+    """
+    connection = connections[router.db_for_read(SquadMessage)]
+    after = "WHERE (p.rank, p.id) < (%s, %s)" if cursor is not None else ""
+    after_params = list(cursor) if cursor is not None else []
+    if connection.vendor == "postgresql":
+        return _postgres_hits(connection, squad_id, query, after, after_params, limit)
+    if connection.vendor == "sqlite":
+        return _sqlite_hits(connection, squad_id, query, after, after_params, limit)
+    return _plain_hits(squad_id, query, cursor, limit)
+
+def _postgres_hits(connection, squad_id, query, after, after_params, limit):
+    options = f'HighlightAll=true, StartSel="{SENTINEL_START}", StopSel="{SENTINEL_END}"'
+    with connection.cursor() as c:
+        c.execute(POSTGRES_SQL.format(after=after), [
+            SEARCH_CONFIG, options, SEARCH_CONFIG, query, squad_id,
+            settings.MESSAGE_SEARCH_CANDIDATES, *after_params, limit,
+        ])
+        return [(message_id, rank, mark_highlights(text)) for message_id, rank, text in c.fetchall()]
+
+def _sqlite_hits(connection, squad_id, query, after, after_params, limit):
+    match = fts5_query(squad_id, query)
+    if match is None:
+        return []
+    with connection.cursor() as c:
+        c.execute(SQLITE_SQL.format(after=after), [
+            match, settings.MESSAGE_SEARCH_CANDIDATES, *after_params, limit,
+        ])
+        ranked = c.fetchall()
+        if not ranked:
+            return []
+        c.execute(
+            SQLITE_HIGHLIGHT_SQL.format(ids=", ".join(["%s"] * len(ranked))),
+            [SENTINEL_START, SENTINEL_END, match, *[message_id for message_id, _ in ranked]],
+        )
+        highlighted = dict(c.fetchall())
+    return [(message_id, rank, mark_highlights(highlighted.get(message_id))) for message_id, rank in ranked]
+
+def _plain_hits(squad_id, query, cursor, limit):
+    groups, excluded = parse_search_query(query)
+    if not groups and not excluded:
+        return []
+    messages = SquadMessage.objects.filter(squad_id=squad_id)
+    if groups:
+        included = Q()
+        for group in groups:
+            required = Q()
+            for term in group:
+                required &= Q(text__icontains=" ".join(term))
+            included |= required
+        messages = messages.filter(included)
+    for term in excluded:
+        messages = messages.exclude(text__icontains=" ".join(term))
+    candidates = messages.order_by("-id").values_list("id", "text")[:settings.MESSAGE_SEARCH_CANDIDATES]
+    if cursor is not None:
+        candidates = [(message_id, text) for message_id, text in candidates if (0.0, message_id) < cursor]
+    terms = [re.escape(" ".join(term)) for group in groups for term in group]
+    marker = re.compile("|".join(terms), re.IGNORECASE) if terms else None
+    return [
+        (message_id, 0.0, mark_highlights(
+            marker.sub(lambda m: SENTINEL_START + m.group(0) + SENTINEL_END, text) if marker else text
+        ))
+        for message_id, text in list(candidates)[:limit]
+    ]
+
+def optimize_search_index():
+    """
+    Merge the FTS5 index's segments and delete markers into one; a no-op
+    on Postgres, where autovacuum cleans the GIN index.
+    """
+    connection = connections[router.db_for_write(SquadMessage)]
+    if connection.vendor == "sqlite":
+        with connection.cursor() as c:
+            c.execute("INSERT INTO squads_squadmessage_fts(squads_squadmessage_fts) VALUES ('optimize')")
+
+def search_messages(squad_id, query, cursor, limit):
+    """
+    One page of matching messages, shaped like the message list plus
+    rank and highlighted, and the cursor for the next page (None on the
+    last one).
+    """
+    hits = ranked_hits(squad_id, query, cursor, limit + 1)
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_search_cursor(hits[-1][1], hits[-1][0])
+    rows = {
+        row["id"]: row
+        for row in message_rows(SquadMessage.objects.filter(id__in=[h[0] for h in hits]).values(*MESSAGE_FIELDS))
+    }
+    results = [
+        {**rows[message_id], "rank": rank, "highlighted": highlighted}
+        for message_id, rank, highlighted in hits
+        # deleted between the two queries
+        if message_id in rows
+    ]
+    return results, next_cursor
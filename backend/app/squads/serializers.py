@@ -1,13 +1,23 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
 from .models import (
     Squad,
     SquadMessage,
     SquadWeeklyGoal,
     SquadMemberStats,
 )
-from app.common.utils import get_current_week_start, miles_to_km
+from app.common.utils import get_current_week_start, miles_to_km, valid_timezones
+from app.tasks.outbox import emit_membership, emit_memberships
+from app.sync.changes import GOAL, MESSAGE, SQUAD, record
+from app.common.upsert import upsert
+from .membership import add_member, add_members, is_member
+from .points import squad_points
+from .slim import member_preview
+from .unread import mark_read
 from django.utils import timezone
 
 User = get_user_model()
@@ -23,31 +33,47 @@ class SimpleUserSerializer(serializers.ModelSerializer):
 class SquadCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Squad
-        fields = ["id","name","description","is_private"]
+        fields = ["id","name","description","is_private","timezone"]
 
+    def validate_timezone(self, value):
+        if value not in valid_timezones():
+            raise serializers.ValidationError("Unknown timezone.")
+        return value
+
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context["request"].user
         squad = Squad.objects.create(
             name=validated_data["name"],
             description=validated_data.get("description", ""),
             is_private=validated_data.get("is_private", False),
+            timezone=validated_data.get("timezone", "UTC"),
             owner=user
         )
-        squad.members.add(user)
-        squad.admins.add(user)
-        # ensure SquadMemberStats row for owner
-        SquadMemberStats.objects.get_or_create(squad=squad, user=user)
+        # a brand-new squad can't conflict: plain inserts, no existence checks
+        Squad.members.through.objects.create(squad=squad, user=user)
+        Squad.admins.through.objects.create(squad=squad, user=user)
+        SquadMemberStats.objects.create(squad=squad, user=user)
+        emit_membership("member.joined", squad, user.id, 1)
+        record(SQUAD, squad.id, squad_id=squad.id)
         return squad
 
 class SquadDetailSerializer(serializers.ModelSerializer):
     owner = SimpleUserSerializer(read_only=True)
-    members = SimpleUserSerializer(many=True, read_only=True)
+    member_preview = serializers.SerializerMethodField()
     member_count = serializers.SerializerMethodField()
     is_member = serializers.SerializerMethodField()
+    total_points = serializers.SerializerMethodField()
 
     class Meta:
         model = Squad
-        fields = ["id","name","description","owner","members","member_count","is_member","is_private","created_at","total_points"]
+        fields = ["id","name","description","owner","member_preview","member_count","is_member","is_private","timezone","created_at","total_points"]
+
+    def get_total_points(self, obj):
+        return squad_points(obj)
+
+    def get_member_preview(self, obj):
+        return member_preview(obj.id)
 
     def get_member_count(self, obj):
         return obj.members.count()
@@ -55,11 +81,12 @@ class SquadDetailSerializer(serializers.ModelSerializer):
     def get_is_member(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.members.filter(id=request.user.id).exists()
+            return is_member(obj.id, request.user.id)
         return False
 
 class SquadInviteSerializer(serializers.Serializer):
     username = serializers.CharField()
+    status = serializers.CharField(read_only=True)
 
     def validate(self, data):
         req_user = self.context["request"].user
@@ -73,12 +100,82 @@ class SquadInviteSerializer(serializers.Serializer):
         data["invited_user"] = invited
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         squad: Squad = self.context["squad"]
         invited_user = validated_data["invited_user"]
-        squad.members.add(invited_user)
-        SquadMemberStats.objects.get_or_create(squad=squad, user=invited_user)
-        return {"status": "ok"}
+        if add_member(squad, invited_user.id):
+            emit_membership("member.joined", squad, invited_user.id, 1)
+        return {"username": invited_user.username, "status": "ok"}
+
+class SquadBulkInviteSerializer(serializers.Serializer):
+    """
+    Invite up to SQUAD_BULK_INVITE_MAX users by username or email (anything
+    with an "@"; case-insensitive). All of them are resolved in one query
+    and added in one statement per batch; an email shared by several
+    accounts is reported as ambiguous rather than guessed.
+    """
+    identifiers = serializers.ListField(
+        child=serializers.CharField(max_length=254),
+        allow_empty=False,
+        max_length=settings.SQUAD_BULK_INVITE_MAX,
+        write_only=True,
+    )
+    invited = serializers.ListField(read_only=True)
+    already_members = serializers.ListField(read_only=True)
+    not_found = serializers.ListField(read_only=True)
+    ambiguous = serializers.ListField(read_only=True)
+
+    def validate(self, data):
+        req_user = self.context["request"].user
+        squad: Squad = self.context["squad"]
+        if squad.owner != req_user:
+            raise serializers.ValidationError("Only squad owner can invite.")
+        identifiers = list(dict.fromkeys(data["identifiers"]))
+        usernames = [i for i in identifiers if "@" not in i]
+        emails = {i.lower() for i in identifiers if "@" in i}
+        by_username, by_email = {}, {}
+        rows = (
+            User.objects.annotate(email_lower=Lower("email"))
+            .filter(Q(username__in=usernames) | Q(email_lower__in=emails))
+            .values_list("id", "username", "email_lower")
+        )
+        for user_id, username, email in rows:
+            by_username[username] = (user_id, username)
+            by_email.setdefault(email, []).append((user_id, username))
+
+        resolved, not_found, ambiguous = {}, [], []
+        for identifier in identifiers:
+            if "@" in identifier:
+                matches = by_email.get(identifier.lower(), [])
+                if len(matches) > 1:
+                    ambiguous.append(identifier)
+                    continue
+                match = matches[0] if matches else None
+            else:
+                match = by_username.get(identifier)
+            if match is None:
+                not_found.append(identifier)
+            else:
+                resolved[match[0]] = match[1]
+        data["resolved"] = resolved
+        data["not_found"] = not_found
+        data["ambiguous"] = ambiguous
+        return data
+
+    @transaction.atomic
+    def create(self, validated_data):
+        squad: Squad = self.context["squad"]
+        resolved = validated_data["resolved"]
+        joined = add_members(squad, list(resolved))
+        emit_memberships("member.joined", squad, joined, 1)
+        joined_set = set(joined)
+        return {
+            "invited": [resolved[u] for u in joined],
+            "already_members": [name for u, name in resolved.items() if u not in joined_set],
+            "not_found": validated_data["not_found"],
+            "ambiguous": validated_data["ambiguous"],
+        }
 
 class SquadMessageSerializer(serializers.ModelSerializer):
     sender = SimpleUserSerializer(read_only=True)
@@ -86,6 +183,12 @@ class SquadMessageSerializer(serializers.ModelSerializer):
         model = SquadMessage
         fields = ["id","sender","text","timestamp"]
 
+class SquadArchivedMessageSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    sender = SimpleUserSerializer(allow_null=True)
+    text = serializers.CharField()
+    timestamp = serializers.DateTimeField()
+
 class SquadMessageCreateSerializer(serializers.Serializer):
     text = serializers.CharField()
 
@@ -93,13 +196,16 @@ class SquadMessageCreateSerializer(serializers.Serializer):
         user = self.context["request"].user
         squad: Squad = self.context["squad"]
 
-        if user not in squad.members.all():
+        if not is_member(squad.id, user.id):
             raise serializers.ValidationError("Not a squad member.")
         msg = SquadMessage.objects.create(
             squad=squad,
             sender=user,
             text=validated_data["text"]
         )
+        record(MESSAGE, msg.id, squad_id=squad.id)
+        # the sender has read everything up to their own message
+        mark_read(squad.id, user.id, msg.id)
         return msg
 
 class SquadGoalSerializer(serializers.ModelSerializer):
@@ -136,23 +242,23 @@ class SquadGoalCreateUpdateSerializer(serializers.Serializer):
     def create(self, validated_data):
         user = self.context["request"].user
         squad: Squad = self.context["squad"]
-        if user not in squad.members.all():
+        if not is_member(squad.id, user.id):
             raise serializers.ValidationError("Not a member.")
-        week_start = get_current_week_start()
+        week_start = get_current_week_start(squad.timezone)
 
         target_distance = validated_data["target_distance"]
         unit = validated_data["unit"]
         km_target = target_distance if unit == "km" else miles_to_km(target_distance)
 
-        goal, _ = SquadWeeklyGoal.objects.get_or_create(
-            squad=squad,
-            week_start_date=week_start,
-            defaults={"target_distance_km": km_target, "unit_entered": unit},
-        )
         # update target mid-week overwrites
-        goal.target_distance_km = km_target
-        goal.unit_entered = unit
-        goal.save()
+        goal, _ = upsert(
+            SquadWeeklyGoal,
+            {"squad_id": squad.id, "week_start_date": week_start,
+             "target_distance_km": km_target, "unit_entered": unit},
+            conflict=["squad", "week_start_date"],
+            update=["target_distance_km", "unit_entered"],
+        )
+        record(GOAL, goal.id, squad_id=squad.id)
         return goal
 
 class SquadMemberStatsSerializer(serializers.ModelSerializer):
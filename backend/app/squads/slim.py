@@ -0,0 +1,158 @@
+"""
+.values()-based serializers for the read-heavy squad endpoints.
+
+These build exactly the payloads SquadDetailSerializer and
+SquadMessageSerializer produce, but from flat row dicts instead of model
+instances, so there is no per-object ModelSerializer field machinery and
+no per-row related lookups.
+"""
+from rest_framework.fields import DateTimeField
+from django.db.models import Count, F
+from django.db.models.functions import RowNumber
+from django.db.models.expressions import Window
+from .membership import Membership
+from .models import SquadMemberStats
+from .points import with_points
+
+# members embedded in squad payloads; the full roster is /squads/<id>/members/
+MEMBER_PREVIEW_SIZE = 5
+
+_datetime = DateTimeField()
+
+def iso(value):
+    # same formatting as serializers.DateTimeField
+    return _datetime.to_representation(value)
+
+def user_fields(prefix):
+    return (
+        f"{prefix}id",
+        f"{prefix}username",
+        f"{prefix}profile__display_name",
+        f"{prefix}profile__total_points",
+    )
+
+def user_payload(row, prefix):
+    return {
+        "id": row[f"{prefix}id"],
+        "username": row[f"{prefix}username"],
+        "display_name": row[f"{prefix}profile__display_name"],
+        "total_points": row[f"{prefix}profile__total_points"],
+    }
+
+SQUAD_FIELDS = (
+    "id", "name", "description", "is_private", "timezone", "created_at", "total_points",
+) + user_fields("owner__")
+
+MEMBER_FIELDS = ("squad_id",) + user_fields("user__")
+
+MESSAGE_FIELDS = ("id", "text", "timestamp") + user_fields("sender__")
+
+def squad_rows(queryset, user):
+    """
+    Serialize a Squad queryset the way SquadDetailSerializer(many=True) does,
+    in four queries however large the squads are: squads + owners, member
+    counts with the preview positions, the preview members, and which of
+    the squads the user belongs to.
+    """
+    squads = list(with_points(queryset).values(*SQUAD_FIELDS, "points"))
+    ids = [s["id"] for s in squads]
+    counts, preview_ids = {}, []
+    ranked = (
+        Membership.objects.filter(squad_id__in=ids)
+        .annotate(
+            position=Window(RowNumber(), partition_by=[F("squad_id")], order_by=F("id").asc()),
+            count=Window(Count("id"), partition_by=[F("squad_id")]),
+        )
+        .filter(position__lte=MEMBER_PREVIEW_SIZE)
+        .values_list("id", "squad_id", "count")
+    )
+    for membership_id, squad_id, count in ranked:
+        counts[squad_id] = count
+        preview_ids.append(membership_id)
+    previews = {}
+    for row in Membership.objects.filter(id__in=preview_ids).order_by("id").values(*MEMBER_FIELDS):
+        previews.setdefault(row["squad_id"], []).append(user_payload(row, "user__"))
+    joined = set(
+        Membership.objects.filter(squad_id__in=ids, user_id=user.id).values_list("squad_id", flat=True)
+    )
+
+    out = []
+    for s in squads:
+        out.append({
+            "id": s["id"],
+            "name": s["name"],
+            "description": s["description"],
+            "owner": user_payload(s, "owner__"),
+            "member_preview": previews.get(s["id"], []),
+            "member_count": counts.get(s["id"], 0),
+            "is_member": s["id"] in joined,
+            "is_private": s["is_private"],
+            "timezone": s["timezone"],
+            "created_at": iso(s["created_at"]),
+            "total_points": s["points"],
+        })
+    return out
+
+def member_preview(squad_id):
+    rows = (
+        Membership.objects.filter(squad_id=squad_id)
+        .order_by("id").values(*MEMBER_FIELDS)[:MEMBER_PREVIEW_SIZE]
+    )
+    return [user_payload(row, "user__") for row in rows]
+
+def _leaderboard_members(squad_id, limit):
+    return (
+        Membership.objects.filter(squad_id=squad_id)
+        .order_by(F("user__profile__total_points").desc(nulls_last=True), "id")
+        .values_list("user_id", "user__username", "user__profile__display_name", "user__profile__total_points")
+        [:limit]
+    )
+
+def _leaderboard_streaks(squad_id, limit, rows):
+    stats = SquadMemberStats.objects.filter(squad_id=squad_id)
+    if limit is not None:
+        stats = stats.filter(user_id__in=[r[0] for r in rows])
+    return stats.values_list("user_id", "current_streak_weeks", "longest_streak_weeks")
+
+def _leaderboard_payload(rows, streak_rows):
+    streaks = {user_id: (current, longest) for user_id, current, longest in streak_rows}
+    out = []
+    for user_id, username, display_name, points in rows:
+        current, longest = streaks.get(user_id, (0, 0))
+        out.append({
+            "username": username,
+            "display_name": username if display_name is None else display_name,
+            "total_points": points or 0,
+            "current_streak_weeks": current,
+            "longest_streak_weeks": longest,
+        })
+    return out
+
+def leaderboard_rows(squad_id, limit=None):
+    """
+    Squad leaderboard, best first (the top `limit` only, if given): two
+    flat queries rather than a model instance per member.
+    """
+    rows = list(_leaderboard_members(squad_id, limit))
+    return _leaderboard_payload(rows, _leaderboard_streaks(squad_id, limit, rows))
+
+async def aleaderboard_rows(squad_id, limit=None):
+    """
+    leaderboard_rows through the async ORM.
+    """
+    rows = [r async for r in _leaderboard_members(squad_id, limit)]
+    return _leaderboard_payload(rows, [r async for r in _leaderboard_streaks(squad_id, limit, rows)])
+
+def message_rows(rows):
+    """
+    Serialize SquadMessage rows fetched with .values(*MESSAGE_FIELDS).
+    """
+    return [
+        {
+            "id": r["id"],
+            "sender": user_payload(r, "sender__"),
+            "text": r["text"],
+            "timestamp": iso(r["timestamp"]),
+        }
+        for r in rows
+    ]
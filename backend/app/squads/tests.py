@@ -1,3 +1,674 @@
-from django.test import TestCase
+import json
+import logging
+import threading
+from importlib import import_module
+from unittest import mock
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from datetime import date, timedelta
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from app.common import response_cache
+from app.common.upsert import upsert
+from app.common.utils import get_current_week_start, get_previous_week_start
+from app.runs import tracks
+from app.runs.models import RunLog
+from app.sync.models import ChangeLogEntry
+from app.tasks.closeout import closeout_week
+from app.tasks.models import OutboxEvent
+from app.tasks.outbox import drain_until_empty
+from app.shop.models import Badge, UserBadge
+from .archive import archive_expired_messages, archive_squad_messages, pack_messages, unpack_messages
+from .membership import Membership, add_member, is_member
+from .points import add_squad_points, compact_point_shards, squad_points
+from .models import (
+    Squad,
+    SquadMemberStats,
+    SquadMessage,
+    SquadMessageArchive,
+    SquadReadCursor,
+    SquadWeeklyGoal,
+    SquadWeeklyTotal,
+    WeeklyResultLog,
+)
+from .slim import aleaderboard_rows, leaderboard_rows
+from .unread import unread_counts
 
-# Create your tests here.
+User = get_user_model()
+
+WEEK_A = date(2026, 1, 5)
+WEEK_B = date(2026, 1, 12)
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False)
+class SquadAdminMembershipTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_superuser(username="ops", password="x")
+        self.owner = User.objects.create_user(username="owner", password="x")
+        self.runner = User.objects.create_user(username="runner", password="x")
+        self.squad = Squad.objects.create(name="admins", owner=self.owner)
+        add_member(self.squad, self.owner.id)
+        RunLog.objects.create(user=self.runner, distance_km=5.0, duration_minutes=30, timestamp=timezone.now())
+        self.client.force_login(self.staff)
+
+    def save_members(self, *users, **fields):
+        return self.client.post(f"/admin/squads/squad/{self.squad.id}/change/", {
+            "name": self.squad.name,
+            "description": "",
+            "owner": self.owner.id,
+            "members": ",".join(str(u.id) for u in users),
+            "admins": "",
+            "created_at_0": self.squad.created_at.strftime("%Y-%m-%d"),
+            "created_at_1": self.squad.created_at.strftime("%H:%M:%S"),
+            "timezone": self.squad.timezone,
+            "message_retention_days": "",
+            "points_shards": 0,
+            **fields,
+        })
+
+    def week_km(self):
+        return sum(SquadWeeklyTotal.objects.filter(squad=self.squad).values_list("total_distance_km", flat=True))
+
+    def test_add_and_remove_go_through_membership_events(self):
+        self.assertEqual(self.save_members(self.owner, self.runner).status_code, 302)
+        self.assertTrue(is_member(self.squad.id, self.runner.id))
+        self.assertTrue(SquadMemberStats.objects.filter(squad=self.squad, user=self.runner).exists())
+        self.assertTrue(OutboxEvent.objects.filter(topic="member.joined", user_id=self.runner.id).exists())
+        drain_until_empty()
+        self.assertAlmostEqual(self.week_km(), 5.0)
+
+        self.assertEqual(self.save_members(self.owner).status_code, 302)
+        self.assertFalse(is_member(self.squad.id, self.runner.id))
+        self.assertTrue(OutboxEvent.objects.filter(topic="member.left", user_id=self.runner.id).exists())
+        self.assertTrue(ChangeLogEntry.objects.filter(user_id=self.runner.id, entity_id=self.squad.id, deleted=True).exists())
+        drain_until_empty()
+        self.assertAlmostEqual(self.week_km(), 0.0)
+
+    def recompute(self):
+        goal, _ = SquadWeeklyGoal.objects.get_or_create(
+            squad=self.squad, week_start_date=get_current_week_start(self.squad.timezone),
+            defaults={"target_distance_km": 20},
+        )
+        resp = self.client.post("/admin/squads/squadweeklygoal/", {
+            "action": "recompute_squad_weeks", "_selected_action": [goal.id],
+        })
+        self.assertEqual(resp.status_code, 302)
+
+    def test_recompute_counts_pending_events_once(self):
+        self.assertEqual(self.save_members(self.owner, self.runner).status_code, 302)
+        # member.joined is still pending (or its run committed just after a
+        # drain): overwriting the rollup would count 5 km twice
+        self.recompute()
+        self.assertFalse(OutboxEvent.objects.filter(topic="rollup.corrected").exists())
+        drain_until_empty()
+        self.assertAlmostEqual(self.week_km(), 5.0)
+
+    def test_recompute_corrects_drift_alongside_pending_runs(self):
+        self.assertEqual(self.save_members(self.owner, self.runner).status_code, 302)
+        drain_until_empty()
+        SquadWeeklyTotal.objects.filter(squad=self.squad).update(total_distance_km=100.0, run_count=9)
+        client = APIClient()
+        client.force_authenticate(self.runner)
+        self.assertEqual(client.post("/api/runs/", {"distance": 3, "duration_minutes": 20}, format="json").status_code, 201)
+        self.recompute()
+        [event] = OutboxEvent.objects.filter(topic="rollup.corrected")
+        self.assertEqual(event.payload["deltas"][0][1:], [-95.0, -8])
+        drain_until_empty()
+        total = SquadWeeklyTotal.objects.get(squad=self.squad)
+        self.assertEqual((total.total_distance_km, total.run_count), (8.0, 2))
+        self.recompute()
+        self.assertEqual(OutboxEvent.objects.filter(topic="rollup.corrected").count(), 1)
+
+    def test_unknown_timezone_is_rejected(self):
+        resp = self.save_members(self.owner, timezone="Mars/Olympus_Mons")
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, "Unknown timezone")
+        self.squad.refresh_from_db()
+        self.assertEqual(self.squad.timezone, "UTC")
+        self.assertEqual(self.save_members(self.owner, timezone="Asia/Tokyo").status_code, 302)
+        self.squad.refresh_from_db()
+        self.assertEqual(self.squad.timezone, "Asia/Tokyo")
+
+    def test_unchanged_members_emit_nothing(self):
+        self.assertEqual(self.save_members(self.owner).status_code, 302)
+        self.assertFalse(OutboxEvent.objects.filter(topic__startswith="member.").exists())
+
+
+class WeeklyTotalBackfillTests(TestCase):
+    def test_open_weeks_start_from_run_history(self):
+        backfill = import_module("app.squads.migrations.0011_backfill_squad_weekly_totals").backfill_weekly_totals
+        owner = User.objects.create_user(username="owner", password="x")
+        squad = Squad.objects.create(name="backfill", owner=owner)
+        add_member(squad, owner.id)
+        week = get_current_week_start(squad.timezone)
+        goal = SquadWeeklyGoal.objects.create(squad=squad, week_start_date=week, target_distance_km=5)
+        RunLog.objects.create(user=owner, distance_km=6.0, duration_minutes=36, timestamp=timezone.now())
+        RunLog.objects.create(user=owner, distance_km=40.0, duration_minutes=60, timestamp=timezone.now(), excluded=True)
+        backfill(apps, None)
+        total = SquadWeeklyTotal.objects.get(squad=squad, week_start_date=week)
+        self.assertEqual((total.total_distance_km, total.run_count), (6.0, 1))
+        goal.refresh_from_db()
+        self.assertEqual((goal.total_distance_km, goal.achieved), (6.0, True))
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False, SYNC_STAMP_ON_COMMIT=False, RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheInvalidationTests(TestCase):
+    """
+    Every write feeding the cached squad detail and goal payloads must
+    leave them equal to a fresh computation, and must actually change
+    them (otherwise the check proves nothing).
+    """
+    def setUp(self):
+        cache.clear()
+        response_cache.clear_local()
+        self.owner = User.objects.create_user(username="owner", password="x")
+        self.joiner = User.objects.create_user(username="joiner", password="x")
+        self.squad = Squad.objects.create(name="cached", owner=self.owner)
+        add_member(self.squad, self.owner.id)
+        SquadWeeklyGoal.objects.create(
+            squad=self.squad, week_start_date=get_current_week_start(self.squad.timezone), target_distance_km=20,
+        )
+        self.client = self.as_user(self.owner)
+        self.urls = [f"/api/squads/{self.squad.id}/", f"/api/squads/{self.squad.id}/goal/"]
+
+    def as_user(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def payloads(self):
+        return [self.client.get(url).content for url in self.urls]
+
+    def assert_invalidated(self, mutate):
+        self.payloads()
+        before = self.payloads()
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = mutate()
+        if resp is not None:
+            self.assertLess(resp.status_code, 300, resp.content)
+        with self.captureOnCommitCallbacks(execute=True):
+            drain_until_empty()
+        after = self.payloads()
+        with override_settings(RESPONSE_CACHE_ENABLED=False):
+            fresh = self.payloads()
+        self.assertEqual(after, fresh)
+        self.assertNotEqual(after, before)
+
+    def test_run_create(self):
+        self.assert_invalidated(lambda: self.client.post("/api/runs/", {"distance": 5, "duration_minutes": 30}, format="json"))
+
+    def log_run(self, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post("/api/runs/", {"distance": 5, "duration_minutes": 30, **extra}, format="json")
+        self.assertEqual(resp.status_code, 201)
+        drain_until_empty()
+        return resp.json()["id"]
+
+    def test_run_edit(self):
+        run_id = self.log_run()
+        self.assert_invalidated(lambda: self.client.patch(f"/api/runs/{run_id}/", {"distance": 8}, format="json"))
+
+    def test_run_delete(self):
+        run_id = self.log_run()
+        self.assert_invalidated(lambda: self.client.delete(f"/api/runs/{run_id}/"))
+
+    def test_track_upload(self):
+        run_id = self.log_run()
+        lat = np.linspace(52.0, 52.01, 20)
+        polyline = tracks.encode_polyline(lat, np.full(lat.size, 4.0))
+        self.assert_invalidated(lambda: self.client.post(f"/api/runs/{run_id}/track/", {"polyline": polyline}, format="json"))
+
+    def test_badge_purchase(self):
+        add_squad_points(self.squad, 100)
+        badge = Badge.objects.create(name="Cached", description="", price=30)
+        self.assert_invalidated(lambda: self.client.post(f"/api/shop/badges/{badge.id}/purchase/"))
+
+    def test_correction(self):
+        SquadWeeklyGoal.objects.create(
+            squad=self.squad, week_start_date=get_previous_week_start(self.squad.timezone), target_distance_km=10,
+        )
+        closeout_week(squads=Squad.objects.filter(pk=self.squad.pk))
+        # a late run into the closed week turns the miss into a hit
+        last_week = (timezone.now() - timedelta(days=7)).isoformat()
+        self.assert_invalidated(
+            lambda: self.client.post("/api/runs/", {"distance": 12, "duration_minutes": 70, "timestamp": last_week}, format="json"),
+        )
+
+    def test_join(self):
+        self.assert_invalidated(lambda: self.as_user(self.joiner).post(f"/api/squads/{self.squad.id}/join/"))
+
+    def test_leave(self):
+        add_member(self.squad, self.joiner.id)
+        self.assert_invalidated(lambda: self.as_user(self.joiner).post(f"/api/squads/{self.squad.id}/leave/"))
+
+    def test_invite(self):
+        self.assert_invalidated(
+            lambda: self.client.post(f"/api/squads/{self.squad.id}/invite/", {"username": "joiner"}, format="json"),
+        )
+
+    def test_bulk_invite(self):
+        self.assert_invalidated(
+            lambda: self.client.post(f"/api/squads/{self.squad.id}/invite/bulk/", {"identifiers": ["joiner"]}, format="json"),
+        )
+
+    def test_goal_set(self):
+        self.assert_invalidated(
+            lambda: self.client.post(f"/api/squads/{self.squad.id}/goal/", {"target_distance": 12}, format="json"),
+        )
+
+    def test_closeout(self):
+        SquadWeeklyGoal.objects.create(
+            squad=self.squad, week_start_date=get_previous_week_start(self.squad.timezone), target_distance_km=10,
+        )
+        RunLog.objects.create(user=self.owner, distance_km=12, duration_minutes=70, timestamp=timezone.now() - timedelta(days=7))
+        self.assert_invalidated(lambda: closeout_week(squads=Squad.objects.filter(pk=self.squad.pk)))
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False)
+class SquadMemberListTests(TestCase):
+    def setUp(self):
+        self.squad = Squad.objects.create(name="roster", owner=User.objects.create_user(username="owner", password="x"))
+        other = Squad.objects.create(name="other", owner=self.squad.owner)
+        # squad points per member: ties and a net loss included
+        points = {"dana": 70, "bo": 25, "cy": 25, "al": -20, "eve": 0}
+        self.users = {}
+        for name, pts in points.items():
+            user = self.users[name] = User.objects.create_user(username=name, password="x")
+            add_member(self.squad, user.id)
+            if pts:
+                WeeklyResultLog.objects.create(user=user, squad=self.squad, week_start_date=WEEK_A, points_change=pts // 2 + pts % 2)
+                WeeklyResultLog.objects.create(user=user, squad=self.squad, week_start_date=WEEK_B, points_change=pts // 2)
+        # neither points earned elsewhere nor app-wide points count here
+        WeeklyResultLog.objects.create(user=self.users["eve"], squad=other, week_start_date=WEEK_A, points_change=500)
+        self.users["al"].profile.total_points = 1000
+        self.users["al"].profile.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users["eve"])
+        self.url = f"/api/squads/{self.squad.id}/members/"
+
+    def pages(self, sort, limit=2):
+        names, cursor = [], None
+        while True:
+            params = {"sort": sort, "limit": limit, **({"cursor": cursor} if cursor else {})}
+            resp = self.client.get(self.url, params)
+            self.assertEqual(resp.status_code, 200)
+            data = resp.json()
+            self.assertEqual(data["count"], 5)
+            self.assertLessEqual(len(data["results"]), limit)
+            names.append([r["username"] for r in data["results"]])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return names
+
+    def test_contribution_is_squad_points_best_first(self):
+        # ties keep join order
+        self.assertEqual(self.pages("contribution"), [["dana", "bo"], ["cy", "eve"], ["al"]])
+
+    def test_name_sort(self):
+        self.assertEqual(self.pages("name"), [["al", "bo"], ["cy", "dana"], ["eve"]])
+
+    def test_single_page(self):
+        self.assertEqual(self.pages("name", limit=5), [["al", "bo", "cy", "dana", "eve"]])
+
+    def test_rejects_bad_sort_cursor_and_outsiders(self):
+        self.assertEqual(self.client.get(self.url, {"sort": "points"}).status_code, 400)
+        cursor = self.client.get(self.url, {"sort": "name", "limit": 1}).json()["next_cursor"]
+        self.assertEqual(self.client.get(self.url, {"sort": "contribution", "cursor": cursor}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"cursor": "garbage"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"limit": 0}).status_code, 400)
+        outsider = APIClient()
+        outsider.force_authenticate(User.objects.create_user(username="outsider", password="x"))
+        self.assertEqual(outsider.get(self.url).status_code, 404)
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False)
+class SquadExportTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", password="x")
+        self.member = User.objects.create_user(username="member", password="x")
+        self.squad = Squad.objects.create(name="export", owner=self.owner, created_at=timezone.now() - timedelta(days=10))
+        for user in (self.owner, self.member):
+            add_member(self.squad, user.id)
+        RunLog.objects.create(user=self.member, distance_km=5, duration_minutes=30, timestamp=timezone.now() - timedelta(days=30))
+        self.recent = RunLog.objects.create(user=self.member, distance_km=6, duration_minutes=36, timestamp=timezone.now())
+        self.url = f"/api/squads/{self.squad.id}/export/"
+
+    def export(self, user, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(self.url, {"fmt": "ndjson", **params})
+
+    def exported_ids(self, resp):
+        self.assertEqual(resp.status_code, 200)
+        return [json.loads(line)["id"] for line in b"".join(resp.streaming_content).splitlines()]
+
+    def test_members_cannot_export(self):
+        self.assertEqual(self.export(self.member).status_code, 403)
+
+    def test_admins_export_runs_since_the_squad_began(self):
+        admin = User.objects.create_user(username="admin", password="x")
+        add_member(self.squad, admin.id)
+        self.squad.admins.add(admin)
+        self.assertEqual(self.exported_ids(self.export(admin)), [self.recent.id])
+        start = (timezone.now() - timedelta(days=60)).date().isoformat()
+        self.assertEqual(self.exported_ids(self.export(self.owner, start=start)), [self.recent.id])
+
+
+@override_settings(THROTTLE_ENABLED=False)
+class SquadMessageSearchTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", password="x")
+        self.squad = Squad.objects.create(name="search", owner=self.owner)
+        add_member(self.squad, self.owner.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.texts = {
+            SquadMessage.objects.create(squad=self.squad, sender=self.owner, text=text).id: text
+            for text in ("long run today", "run long tomorrow", "easy walk", '<img src=x onerror="alert(1)"> run')
+        }
+
+    def search(self, q):
+        resp = self.client.get(f"/api/squads/{self.squad.id}/messages/search/", {"q": q})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()["results"]
+
+    def found(self, q):
+        return {self.texts[r["id"]] for r in self.search(q)}
+
+    def test_highlight_is_escaped(self):
+        [hit] = [r for r in self.search("run") if r["text"].startswith("<img")]
+        self.assertEqual(hit["highlighted"], "&lt;img src=x onerror=&quot;alert(1)&quot;&gt; <mark>run</mark>")
+
+    def test_phrases_exclusions_and_or(self):
+        self.assertEqual(self.found('"long run"'), {"long run today"})
+        self.assertEqual(self.found("run long"), {"long run today", "run long tomorrow"})
+        self.assertEqual(self.found("run -today -alert"), {"run long tomorrow"})
+        self.assertEqual(self.found('-"long run"'), {"run long tomorrow", "easy walk", '<img src=x onerror="alert(1)"> run'})
+        self.assertEqual(self.found("tomorrow or walk"), {"run long tomorrow", "easy walk"})
+
+    def test_other_databases_fall_back_to_icontains(self):
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], "vendor", "mysql"):
+            self.test_phrases_exclusions_and_or()
+            self.test_highlight_is_escaped()
+            self.assertEqual([r["rank"] for r in self.search("run")], [0.0, 0.0, 0.0])
+            resp = self.client.get(f"/api/squads/{self.squad.id}/messages/search/", {"q": "run", "limit": 2})
+            page = resp.json()
+            self.assertEqual([r["text"] for r in page["results"]], ['<img src=x onerror="alert(1)"> run', "run long tomorrow"])
+            resp = self.client.get(
+                f"/api/squads/{self.squad.id}/messages/search/", {"q": "run", "limit": 2, "cursor": page["next_cursor"]}
+            )
+            self.assertEqual([r["text"] for r in resp.json()["results"]], ["long run today"])
+
+
+@override_settings(THROTTLE_ENABLED=False)
+class MessageArchiveTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", password="x")
+        self.squad = Squad.objects.create(name="archive", owner=self.owner)
+        add_member(self.squad, self.owner.id)
+        old = timezone.now() - timedelta(days=40)
+        self.old_ids = []
+        for i in range(5):
+            msg = SquadMessage.objects.create(squad=self.squad, sender=self.owner, text=f"old {i} ✓")
+            SquadMessage.objects.filter(id=msg.id).update(timestamp=old + timedelta(minutes=i))
+            self.old_ids.append(msg.id)
+        SquadMessage.objects.create(squad=self.squad, sender=self.owner, text="today")
+        self.cutoff = timezone.now() - timedelta(days=30)
+
+    def test_pack_round_trip(self):
+        rows = list(SquadMessage.objects.order_by("id").values("id", "sender_id", "text", "timestamp"))
+        self.assertEqual(unpack_messages(pack_messages(rows)), rows)
+        self.assertEqual(unpack_messages(pack_messages([])), [])
+
+    def test_archives_in_batches_and_reruns_are_no_ops(self):
+        self.assertEqual(archive_squad_messages(self.squad.id, self.cutoff, batch_size=2), 5)
+        chunks = list(SquadMessageArchive.objects.filter(squad=self.squad).order_by("id"))
+        self.assertEqual([c.message_count for c in chunks], [2, 2, 1])
+        archived = [r["id"] for c in chunks for r in unpack_messages(c.payload)]
+        self.assertEqual(archived, self.old_ids)
+        self.assertEqual(list(SquadMessage.objects.values_list("text", flat=True)), ["today"])
+        self.assertEqual(archive_squad_messages(self.squad.id, self.cutoff, batch_size=2), 0)
+        self.assertEqual(SquadMessageArchive.objects.count(), 3)
+
+    def test_archival_is_opt_in(self):
+        self.assertEqual(archive_expired_messages(), 0)
+        Squad.objects.filter(id=self.squad.id).update(message_retention_days=30)
+        self.assertEqual(archive_expired_messages(), 5)
+
+    def test_archive_view_pages_newest_chunk_first(self):
+        archive_squad_messages(self.squad.id, self.cutoff, batch_size=3)
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        url = f"/api/squads/{self.squad.id}/messages/archive/"
+        first = client.get(url).json()
+        self.assertEqual([r["id"] for r in first["results"]], self.old_ids[4:2:-1])
+        self.assertEqual(first["results"][0]["sender"]["username"], "owner")
+        second = client.get(url, {"before": first["next_before"]}).json()
+        self.assertEqual([r["id"] for r in second["results"]], self.old_ids[2::-1])
+        self.assertEqual(client.get(url, {"before": second["next_before"]}).json(), {"results": [], "next_before": None})
+        self.assertEqual(client.get(url, {"before": "x"}).status_code, 400)
+        outsider = APIClient()
+        outsider.force_authenticate(User.objects.create_user(username="outsider", password="x"))
+        self.assertEqual(outsider.get(url).status_code, 404)
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False)
+class UnreadCountTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", password="x")
+        self.joiner = User.objects.create_user(username="joiner", password="x")
+        self.squad = Squad.objects.create(name="unread", owner=self.owner)
+        add_member(self.squad, self.owner.id)
+        SquadMessage.objects.bulk_create(
+            [SquadMessage(squad=self.squad, sender=self.owner, text=f"m{i}") for i in range(120)]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.joiner)
+
+    def unread(self):
+        return unread_counts(self.joiner.id).get(self.squad.id)
+
+    def test_new_members_start_with_history_read(self):
+        self.assertEqual(self.client.post(f"/api/squads/{self.squad.id}/join/").status_code, 200)
+        self.assertEqual(self.unread(), 0)
+        SquadMessage.objects.create(squad=self.squad, sender=self.owner, text="welcome")
+        self.assertEqual(self.unread(), 1)
+
+    def test_backfill_starts_existing_members_at_the_latest_message(self):
+        backfill = import_module("app.squads.migrations.0012_backfill_read_cursors").backfill_read_cursors
+        # a membership from before cursors existed, and one already reading
+        Membership.objects.create(squad=self.squad, user=self.joiner)
+        self.assertEqual(self.unread(), 100)
+        read_to = SquadMessage.objects.filter(squad=self.squad).order_by("id")[100].id
+        SquadReadCursor.objects.filter(squad=self.squad, user=self.owner).update(last_read_message_id=read_to)
+        backfill(apps, None)
+        self.assertEqual(self.unread(), 0)
+        self.assertEqual(unread_counts(self.owner.id)[self.squad.id], 19)
+
+    def test_invited_members_start_with_history_read(self):
+        owner = APIClient()
+        owner.force_authenticate(self.owner)
+        resp = owner.post(f"/api/squads/{self.squad.id}/invite/bulk/", {"identifiers": ["joiner"]}, format="json")
+        self.assertLess(resp.status_code, 300)
+        self.assertEqual(self.unread(), 0)
+
+    def test_read_rejects_non_object_bodies(self):
+        add_member(self.squad, self.joiner.id)
+        url = f"/api/squads/{self.squad.id}/messages/read/"
+        for body in ([1, 2], 5, "x"):
+            self.assertEqual(self.client.post(url, body, format="json").status_code, 400)
+        self.assertEqual(self.client.post(url, {"message_id": 1.5}, format="json").status_code, 400)
+        self.assertEqual(self.client.post(url, {}, format="json").status_code, 200)
+
+
+class LeaderboardRowsTests(TestCase):
+    async def test_async_rows_match_sync(self):
+        owner = await User.objects.acreate(username="owner")
+        squad = await Squad.objects.acreate(name="board", owner=owner)
+        for i in range(4):
+            user = await User.objects.acreate(username=f"m{i}")
+            await SquadMemberStats.objects.acreate(squad=squad, user=user, current_streak_weeks=i, longest_streak_weeks=i)
+            await Membership.objects.acreate(squad=squad, user=user)
+        for limit in (None, 2):
+            self.assertEqual(
+                await aleaderboard_rows(squad.id, limit),
+                await sync_to_async(leaderboard_rows)(squad.id, limit),
+            )
+
+
+class UpsertStatementTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", password="x")
+        self.squad = Squad.objects.create(name="upserts", owner=self.owner)
+
+    def test_join_cost_does_not_grow_with_the_squad(self):
+        for size in (1, 50):
+            users = [User.objects.create_user(username=f"m{size}_{i}", password="x") for i in range(size)]
+            for user in users[:-1]:
+                add_member(self.squad, user.id)
+            # membership insert, stats insert, latest message id, read
+            # cursor insert, change log entry
+            with self.assertNumQueries(5):
+                self.assertTrue(add_member(self.squad, users[-1].id))
+            with self.assertNumQueries(2):
+                self.assertFalse(add_member(self.squad, users[-1].id))
+
+    def test_goal_upsert_is_one_statement(self):
+        week = get_current_week_start(self.squad.timezone)
+        for target in (10.0, 25.0):
+            with self.assertNumQueries(1):
+                goal, written = upsert(
+                    SquadWeeklyGoal,
+                    {"squad_id": self.squad.id, "week_start_date": week,
+                     "target_distance_km": target, "unit_entered": "km"},
+                    conflict=["squad", "week_start_date"],
+                    update=["target_distance_km", "unit_entered"],
+                )
+            self.assertTrue(written)
+            self.assertEqual(goal.target_distance_km, target)
+        self.assertEqual(SquadWeeklyGoal.objects.filter(squad=self.squad).count(), 1)
+
+
+@override_settings(SYNC_STAMP_ON_COMMIT=False)
+class ConcurrentJoinTests(TransactionTestCase):
+    THREADS = 8
+
+    def test_double_tapped_joins_count_once(self):
+        owner = User.objects.create_user(username="owner", password="x")
+        squad = Squad.objects.create(name="races", owner=owner)
+        joiners = [User.objects.create_user(username=f"j{i}", password="x").id for i in range(self.THREADS // 2)]
+        barrier = threading.Barrier(self.THREADS)
+        lock = threading.Lock()
+        results, errors = [], []
+
+        def worker(i):
+            user_id = joiners[i % len(joiners)]
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        with transaction.atomic():
+                            joined = add_member(squad, user_id)
+                        break
+                    except OperationalError:
+                        # SQLite "database table is locked"; PostgreSQL never gets here
+                        continue
+                with lock:
+                    results.append((user_id, joined))
+            except Exception as exc:
+                with lock:
+                    errors.append(exc)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(self.THREADS)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(u for u, joined in results if joined), sorted(joiners))
+        self.assertEqual(Membership.objects.filter(squad=squad).count(), len(joiners))
+        self.assertEqual(SquadMemberStats.objects.filter(squad=squad).count(), len(joiners))
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False, SYNC_STAMP_ON_COMMIT=False)
+class ConcurrentPointsTests(TransactionTestCase):
+    AWARDS = 20
+    AWARD = 5
+    BUYERS = 6
+    PRICE = 40
+
+    def test_awards_purchases_and_compaction_never_lose_or_overdraw(self):
+        owner = User.objects.create_user(username="owner", password="x")
+        squad = Squad.objects.create(name="shards", owner=owner, points_shards=4)
+        buyers = [User.objects.create_user(username=f"b{i}", password="x") for i in range(self.BUYERS)]
+        for user in buyers:
+            add_member(squad, user.id)
+        badge = Badge.objects.create(name="bolt", description="", price=self.PRICE)
+        # SQLite's table locks surface as 500s that the buyers retry
+        request_log = logging.getLogger("django.request")
+        self.addCleanup(request_log.setLevel, request_log.level)
+        request_log.setLevel(logging.CRITICAL)
+        barrier = threading.Barrier(self.AWARDS + self.BUYERS + 1)
+        lock = threading.Lock()
+        errors = []
+
+        def retrying(fn):
+            while True:
+                try:
+                    return fn()
+                except OperationalError:
+                    # SQLite "database table is locked"; PostgreSQL never gets here
+                    continue
+
+        def award():
+            def once():
+                with transaction.atomic():
+                    add_squad_points(squad, self.AWARD)
+            retrying(once)
+
+        def buy(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            retrying(lambda: client.post(f"/api/shop/badges/{badge.id}/purchase/"))
+
+        def compact():
+            for _ in range(5):
+                retrying(compact_point_shards)
+
+        def worker(fn, *args):
+            try:
+                barrier.wait()
+                fn(*args)
+            except Exception as exc:
+                with lock:
+                    errors.append(exc)
+            finally:
+                connections.close_all()
+
+        workers = (
+            [threading.Thread(target=worker, args=(award,)) for _ in range(self.AWARDS)]
+            + [threading.Thread(target=worker, args=(buy, user)) for user in buyers]
+            + [threading.Thread(target=worker, args=(compact,))]
+        )
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        self.assertEqual(errors, [])
+        bought = UserBadge.objects.filter(badge=badge).count()
+        self.assertLessEqual(bought * self.PRICE, self.AWARDS * self.AWARD)
+        balance = squad_points(Squad.objects.get(id=squad.id))
+        self.assertEqual(balance, self.AWARDS * self.AWARD - bought * self.PRICE)
+        compact_point_shards()
+        squad.refresh_from_db()
+        self.assertEqual(squad.total_points, balance)
+        self.assertGreaterEqual(squad.total_points, 0)
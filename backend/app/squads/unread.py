@@ -0,0 +1,77 @@
+"""
+Per-member read state for squad chat.
+
+Each (squad, user) has a SquadReadCursor holding the id of the last
+message they have read; anything newer is unread (posting a message
+moves the sender's cursor up to it). Joining starts the cursor at the
+squad's latest message (app.squads.membership), so history from before
+someone joined is not unread. Memberships from before cursors existed
+were started the same way by migration 0012; a member with no cursor row
+at all would count as having read nothing yet.
+
+unread_counts() answers for all of a user's squads in one query: their
+memberships, left-joined to their cursors, each with a count of the
+squad's messages past the cursor. Every count is a range scan of the
+(squad_id, id) message index capped at SQUAD_UNREAD_COUNT_CAP rows, so a
+busy squad nobody has opened in months costs the same as a quiet one;
+clients show the cap as "99+" or similar.
+"""
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Max
+from django.utils import timezone
+from app.common.upsert import upsert
+from .models import SquadMessage, SquadReadCursor
+
+UNREAD_SQL = """
+SELECT mb.squad_id, (
+    SELECT count(*) FROM (
+        SELECT 1 FROM squads_squadmessage m
+        WHERE m.squad_id = mb.squad_id AND m.id > coalesce(rc.last_read_message_id, 0)
+        LIMIT %s
+    ) u
+)
+FROM squads_squad_members mb
+LEFT JOIN squads_squadreadcursor rc ON rc.squad_id = mb.squad_id AND rc.user_id = mb.user_id
+WHERE mb.user_id = %s {squads}
+"""
+
+def latest_message_id(squad_id):
+    return SquadMessage.objects.filter(squad_id=squad_id).aggregate(latest=Max("id"))["latest"] or 0
+
+def mark_read(squad_id, user_id, message_id):
+    """
+    Move the user's cursor up to message_id (never back). Returns the
+    cursor as stored, which is higher than message_id if another request
+    already read further.
+    """
+    upsert(
+        SquadReadCursor,
+        {"squad_id": squad_id, "user_id": user_id, "last_read_message_id": message_id},
+        conflict=["squad", "user"],
+    )
+    SquadReadCursor.objects.filter(
+        squad_id=squad_id, user_id=user_id, last_read_message_id__lt=message_id,
+    ).update(last_read_message_id=message_id, updated_at=timezone.now())
+    return SquadReadCursor.objects.filter(squad_id=squad_id, user_id=user_id).values_list(
+        "last_read_message_id", flat=True,
+    ).first() or 0
+
+def unread_counts(user_id, squad_ids=None):
+    """
+    {squad id: unread messages, at most SQUAD_UNREAD_COUNT_CAP} for every
+    squad the user is a member of (only those in squad_ids, if given).
+    """
+    if squad_ids is not None:
+        squad_ids = list(squad_ids)
+        if not squad_ids:
+            return {}
+    connection = connections[router.db_for_read(SquadMessage)]
+    squads = ""
+    params = [settings.SQUAD_UNREAD_COUNT_CAP, user_id]
+    if squad_ids is not None:
+        squads = "AND mb.squad_id IN ({})".format(", ".join(["%s"] * len(squad_ids)))
+        params.extend(squad_ids)
+    with connection.cursor() as c:
+        c.execute(UNREAD_SQL.format(squads=squads), params)
+        return dict(c.fetchall())
@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     SquadListCreateView,
     SquadDetailView,
     SquadInviteView,
+    SquadBulkInviteView,
     SquadMessageListCreateView,
+    SquadMessageArchiveView,
+    SquadMessageReadView,
+    SquadMessageSearchView,
     SquadGoalView,
     SquadGoalPreviousView,
     SquadLeaderboardView,
@@ -13,20 +18,44 @@ from .views import (
     SquadJoinView,
     SquadLeaveView,
     SquadDeleteView,
+    SquadExportView,
+    SquadMemberListView,
 )
 
+# Under ASGI the hot reads are served by async views (writes on the
+# same routes still go through the DRF views).
+if settings.ASYNC_READ_VIEWS:
+    from app.common.async_views import async_reads
+    from . import async_views
+
+    messages_view = async_reads(async_views.squad_messages, SquadMessageListCreateView.as_view())
+    goal_view = async_reads(async_views.squad_goal, SquadGoalView.as_view())
+    leaderboard_view = async_views.squad_leaderboard
+    weekly_summary_view = async_views.my_weekly_summary
+else:
+    messages_view = SquadMessageListCreateView.as_view()
+    goal_view = SquadGoalView.as_view()
+    leaderboard_view = SquadLeaderboardView.as_view()
+    weekly_summary_view = MyWeeklySummaryView.as_view()
+
 urlpatterns = [
     path("", SquadListCreateView.as_view(), name="squad_list_create"),
     path("browse/", SquadBrowseView.as_view(), name="squad_browse"),
     path("<int:pk>/", SquadDetailFullView.as_view(), name="squad_full_detail"),
     path("<int:pk>/basic/", SquadDetailView.as_view(), name="squad_basic"),
+    path("<int:pk>/members/", SquadMemberListView.as_view(), name="squad_members"),
     path("<int:pk>/invite/", SquadInviteView.as_view(), name="squad_invite"),
+    path("<int:pk>/invite/bulk/", SquadBulkInviteView.as_view(), name="squad_bulk_invite"),
     path("<int:pk>/join/", SquadJoinView.as_view(), name="squad_join"),
     path("<int:pk>/leave/", SquadLeaveView.as_view(), name="squad_leave"),
     path("<int:pk>/delete/", SquadDeleteView.as_view(), name="squad_delete"),
-    path("<int:pk>/messages/", SquadMessageListCreateView.as_view(), name="squad_messages"),
-    path("<int:pk>/goal/", SquadGoalView.as_view(), name="squad_goal"),
+    path("<int:pk>/messages/", messages_view, name="squad_messages"),
+    path("<int:pk>/messages/archive/", SquadMessageArchiveView.as_view(), name="squad_message_archive"),
+    path("<int:pk>/messages/read/", SquadMessageReadView.as_view(), name="squad_message_read"),
+    path("<int:pk>/messages/search/", SquadMessageSearchView.as_view(), name="squad_message_search"),
+    path("<int:pk>/export/", SquadExportView.as_view(), name="squad_export"),
+    path("<int:pk>/goal/", goal_view, name="squad_goal"),
     path("<int:pk>/goal/previous/", SquadGoalPreviousView.as_view(), name="squad_goal_previous"),
-    path("<int:pk>/leaderboard/", SquadLeaderboardView.as_view(), name="squad_leaderboard"),
-    path("me/weekly-summary/", MyWeeklySummaryView.as_view(), name="my_weekly_summary"),
+    path("<int:pk>/leaderboard/", leaderboard_view, name="squad_leaderboard"),
+    path("me/weekly-summary/", weekly_summary_view, name="my_weekly_summary"),
 ]
@@ -1,21 +1,37 @@
 from rest_framework import generics, permissions, response, pagination, status
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum, Q
+from django.db import transaction
+from django.db.models import Q
 from .models import (
     Squad,
     SquadMessage,
+    SquadMessageArchive,
     SquadWeeklyGoal,
     SquadMemberStats,
     WeeklyResultLog,
 )
+from .archive import unpack_messages
+from .slim import squad_rows, message_rows, leaderboard_rows, MESSAGE_FIELDS
+from .roster import MEMBER_SORTS, decode_member_cursor, member_page
+from .search import decode_search_cursor, search_messages
+from .unread import latest_message_id, mark_read, unread_counts
+from .rollups import squad_week_distance
+from .membership import Membership, add_member, is_member, remove_members
+from .caching import goal_tag, invalidate_goal, squad_tag
+from app.tasks.outbox import emit_membership
+from app.sync.changes import GOAL, record, record_squad_deleted
+from app.common.export import ExportError, export_options, export_response
+from app.common.response_cache import cached
 from app.runs.models import RunLog
-from app.common.utils import get_current_week_start, week_range, get_previous_week_start
+from app.common.utils import get_current_week_start, get_previous_week_start
 from .serializers import (
     SquadCreateSerializer,
     SquadDetailSerializer,
     SquadInviteSerializer,
+    SquadBulkInviteSerializer,
     SquadMessageSerializer,
+    SquadArchivedMessageSerializer,
     SquadMessageCreateSerializer,
     SquadGoalSerializer,
     SquadGoalCreateUpdateSerializer,
@@ -30,13 +46,20 @@ class SquadListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return self.request.user.squads.all().prefetch_related("members","owner")
+        return self.request.user.squads.all()
 
     def get_serializer_class(self):
         if self.request.method.lower() == "post":
             return SquadCreateSerializer
         return SquadDetailSerializer
 
+    def list(self, request, *args, **kwargs):
+        rows = squad_rows(self.get_queryset(), request.user)
+        unread = unread_counts(request.user.id)
+        for row in rows:
+            row["unread_count"] = unread.get(row["id"], 0)
+        return response.Response(rows)
+
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
         return ctx
@@ -47,7 +70,43 @@ class SquadDetailView(generics.RetrieveAPIView):
 
     def get_queryset(self):
         # user must be in squad
-        return Squad.objects.filter(members=self.request.user).prefetch_related("members","owner")
+        return Squad.objects.filter(members=self.request.user).select_related("owner__profile")
+
+MEMBER_PAGE_SIZE = 50
+MEMBER_MAX_PAGE_SIZE = 200
+
+class SquadMemberListView(generics.GenericAPIView):
+    """
+    The full member roster, one keyset page at a time (members only).
+    ?sort=contribution (squad points while a member, best first) or ?sort=name; ?limit= up to
+    200. Pass ?cursor=<next_cursor> from the previous response to go on.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        squad = get_object_or_404(Squad, pk=pk, members=request.user)
+        sort = request.query_params.get("sort", "contribution")
+        if sort not in MEMBER_SORTS:
+            return response.Response(
+                {"error": f"sort must be one of: {', '.join(MEMBER_SORTS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = int(request.query_params.get("limit", MEMBER_PAGE_SIZE))
+            cursor = decode_member_cursor(request.query_params.get("cursor"), sort)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return response.Response(
+                {"error": "Invalid limit or cursor."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        rows, next_cursor = member_page(squad.id, sort, cursor, min(limit, MEMBER_MAX_PAGE_SIZE))
+        return response.Response({
+            "count": Membership.objects.filter(squad_id=squad.id).count(),
+            "results": rows,
+            "next_cursor": next_cursor,
+        })
 
 class SquadInviteView(generics.CreateAPIView):
     serializer_class = SquadInviteSerializer
@@ -59,6 +118,9 @@ class SquadInviteView(generics.CreateAPIView):
         ctx["squad"] = squad
         return ctx
 
+class SquadBulkInviteView(SquadInviteView):
+    serializer_class = SquadBulkInviteSerializer
+
 class SquadMessagePagination(pagination.PageNumberPagination):
     page_size = 50
 
@@ -75,6 +137,10 @@ class SquadMessageListCreateView(generics.ListCreateAPIView):
             return SquadMessageCreateSerializer
         return SquadMessageSerializer
 
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset().values(*MESSAGE_FIELDS))
+        return self.get_paginated_response(message_rows(page))
+
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
         squad = get_object_or_404(Squad, pk=self.kwargs["pk"])
@@ -83,38 +149,170 @@ class SquadMessageListCreateView(generics.ListCreateAPIView):
 
     def perform_create(self, serializer):
         squad = get_object_or_404(Squad, pk=self.kwargs["pk"])
-        if self.request.user not in squad.members.all():
+        if not is_member(squad.id, self.request.user.id):
             raise PermissionError("Not a squad member.")
         serializer.save()
 
-class SquadGoalView(generics.GenericAPIView):
+class SquadMessageReadView(generics.GenericAPIView):
+    """
+    Mark the squad's chat read (members only): up to {"message_id": n},
+    or everything so far without it. The cursor never moves back.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        squad = get_object_or_404(Squad, pk=pk, members=request.user)
+        if not isinstance(request.data, dict):
+            return response.Response(
+                {"error": "Expected an object body."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        latest = latest_message_id(squad.id)
+        message_id = request.data.get("message_id", latest)
+        if type(message_id) is not int or message_id < 0:
+            return response.Response(
+                {"error": "message_id must be a message id."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        last_read = mark_read(squad.id, request.user.id, min(message_id, latest))
+        return response.Response({
+            "last_read_message_id": last_read,
+            "unread_count": unread_counts(request.user.id, [squad.id]).get(squad.id, 0),
+        })
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+
+class SquadMessageSearchView(generics.GenericAPIView):
+    """
+    Full-text search of the squad's chat (members only), best matches
+    first. ?q= takes words, "quoted phrases", -excluded words and `or`;
+    ?limit= up to 50. Pass ?cursor=<next_cursor> from the previous response
+    to go on. `highlighted` is HTML-escaped text with <mark></mark> tags.
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, pk):
         squad = get_object_or_404(Squad, pk=pk, members=request.user)
-        week_start = get_current_week_start()
-        # update total_distance_km live:
-        start_dt, end_dt = week_range(week_start)
-        members_ids = squad.members.values_list("id", flat=True)
-        total_km = RunLog.objects.filter(
-            user_id__in=members_ids,
-            timestamp__gte=start_dt,
-            timestamp__lt=end_dt,
-        ).aggregate(total=Sum("distance_km"))["total"] or 0.0
-
-        goal, _ = SquadWeeklyGoal.objects.get_or_create(
-            squad=squad,
-            week_start_date=week_start,
-            defaults={"target_distance_km": 0, "total_distance_km": total_km},
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return response.Response(
+                {"error": "q is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = int(request.query_params.get("limit", SEARCH_PAGE_SIZE))
+            cursor = decode_search_cursor(request.query_params.get("cursor"))
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return response.Response(
+                {"error": "Invalid limit or cursor."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        results, next_cursor = search_messages(squad.id, query, cursor, min(limit, SEARCH_MAX_PAGE_SIZE))
+        return response.Response({"results": results, "next_cursor": next_cursor})
+
+class SquadMessageArchiveView(generics.GenericAPIView):
+    """
+    Page backwards through archived chat history, one archive chunk per page.
+    Pass ?before=<next_before> from the previous response to keep going.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        squad = get_object_or_404(Squad, pk=pk, members=request.user)
+        qs = SquadMessageArchive.objects.filter(squad=squad)
+
+        before = request.query_params.get("before")
+        if before:
+            try:
+                qs = qs.filter(id__lt=int(before))
+            except ValueError:
+                return response.Response(
+                    {"error": "before must be an archive id."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        chunk = qs.order_by("-id").first()
+        if not chunk:
+            return response.Response({"results": [], "next_before": None})
+
+        rows = unpack_messages(chunk.payload)
+        rows.reverse()  # newest first, like the live message list
+        senders = User.objects.select_related("profile").in_bulk({r["sender_id"] for r in rows})
+        for r in rows:
+            r["sender"] = senders.get(r["sender_id"])
+
+        return response.Response({
+            "results": SquadArchivedMessageSerializer(rows, many=True).data,
+            "next_before": chunk.id,
+        })
+
+SQUAD_EXPORT_COLUMNS = ["id", "user__username", "timestamp", "distance_km", "duration_minutes", "excluded"]
+
+class SquadExportView(generics.GenericAPIView):
+    """
+    Stream the runs everyone currently in the squad logged since it was
+    created (owner and squad admins only). Same ?fmt=, ?gzip=, ?start= /
+    ?end= options as /runs/export/.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        squad = get_object_or_404(Squad, pk=pk, members=request.user)
+        if squad.owner_id != request.user.id and not squad.admins.filter(id=request.user.id).exists():
+            return response.Response(
+                {"error": "Only the squad owner and admins can export its runs."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            fmt, gzipped, date_filter = export_options(request.query_params)
+        except ExportError as e:
+            return response.Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        qs = (
+            RunLog.objects.filter(user__in=squad.members.values("id"), timestamp__gte=squad.created_at)
+            .filter(**date_filter)
+            .order_by("timestamp", "id")
+            .values_list(*SQUAD_EXPORT_COLUMNS)
         )
-        # refresh live progress
+        columns = ["id", "username"] + SQUAD_EXPORT_COLUMNS[2:]
+        return export_response(qs, columns, fmt, gzipped, f"squad-{squad.id}-runs")
+
+def current_goal_payload(squad, week_start):
+    # progress comes from the outbox-maintained rollup
+    total_km = squad_week_distance(squad.id, week_start)
+
+    goal, created = SquadWeeklyGoal.objects.get_or_create(
+        squad=squad,
+        week_start_date=week_start,
+        defaults={"target_distance_km": 0, "total_distance_km": total_km},
+    )
+    # Check if goal is achieved (but don't close out yet)
+    achieved = total_km >= goal.target_distance_km if goal.target_distance_km > 0 else False
+    if goal.total_distance_km != total_km or goal.achieved != achieved:
         goal.total_distance_km = total_km
-        # Check if goal is achieved (but don't close out yet)
-        goal.achieved = total_km >= goal.target_distance_km if goal.target_distance_km > 0 else False
-        goal.save()
+        goal.achieved = achieved
+        goal.save(update_fields=["total_distance_km", "achieved"])
+        record(GOAL, goal.id, squad_id=squad.id)
+    elif created:
+        record(GOAL, goal.id, squad_id=squad.id)
+    return SquadGoalSerializer(goal).data
 
-        ser = SquadGoalSerializer(goal)
-        return response.Response(ser.data)
+class SquadGoalView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = "squad_goal"
+
+    def get(self, request, pk):
+        squad = get_object_or_404(Squad, pk=pk, members=request.user)
+        week_start = get_current_week_start(squad.timezone)
+        # shared by every member until a run, goal edit or closeout moves it
+        data = cached(
+            "squad-goal", (squad.id, week_start, "member"),
+            [goal_tag(squad.id, week_start)],
+            lambda: current_goal_payload(squad, week_start),
+        )
+        return response.Response(data)
 
     def post(self, request, pk):
         squad = get_object_or_404(Squad, pk=pk, members=request.user)
@@ -124,6 +322,7 @@ class SquadGoalView(generics.GenericAPIView):
         )
         ser.is_valid(raise_exception=True)
         goal = ser.save()
+        invalidate_goal(squad.id, goal.week_start_date)
         return response.Response(SquadGoalSerializer(goal).data)
 
 class SquadGoalPreviousView(generics.GenericAPIView):
@@ -131,7 +330,7 @@ class SquadGoalPreviousView(generics.GenericAPIView):
 
     def get(self, request, pk):
         squad = get_object_or_404(Squad, pk=pk, members=request.user)
-        prev_week_start = get_previous_week_start()
+        prev_week_start = get_previous_week_start(squad.timezone)
 
         goal = SquadWeeklyGoal.objects.filter(
             squad=squad,
@@ -149,36 +348,22 @@ class SquadGoalPreviousView(generics.GenericAPIView):
 
 class SquadLeaderboardView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = "leaderboard"
 
     def get(self, request, pk):
         squad = get_object_or_404(Squad, pk=pk, members=request.user)
-        members = squad.members.select_related("profile").all()
-        stats_map = {
-            (s.user_id): s for s in SquadMemberStats.objects.filter(squad=squad)
-        }
-        data = []
-        for m in members:
-            stat = stats_map.get(m.id)
-            data.append({
-                "username": m.username,
-                "display_name": m.profile.display_name if hasattr(m,"profile") else m.username,
-                "total_points": m.profile.total_points if hasattr(m,"profile") else 0,
-                "current_streak_weeks": stat.current_streak_weeks if stat else 0,
-                "longest_streak_weeks": stat.longest_streak_weeks if stat else 0,
-            })
-        data.sort(key=lambda x: x["total_points"], reverse=True)
-        return response.Response({"members": data})
+        return response.Response({"members": leaderboard_rows(squad.id)})
 
 class MyWeeklySummaryView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         user = request.user
-        current_week = get_current_week_start()
-
         squads = user.squads.all()
         out = []
         for squad in squads:
+            current_week = get_current_week_start(squad.timezone)
+
             # get current goal
             goal = SquadWeeklyGoal.objects.filter(
                 squad=squad,
@@ -186,7 +371,7 @@ class MyWeeklySummaryView(generics.GenericAPIView):
             ).first()
 
             # last closeout = previous week's result
-            prev_week = get_previous_week_start()
+            prev_week = get_previous_week_start(squad.timezone)
             wr = WeeklyResultLog.objects.filter(
                 user=user,
                 squad=squad,
@@ -195,14 +380,7 @@ class MyWeeklySummaryView(generics.GenericAPIView):
 
             # compute progress (live)
             if goal:
-                start_dt, end_dt = week_range(goal.week_start_date)
-                members_ids = squad.members.values_list("id", flat=True)
-                total_km = RunLog.objects.filter(
-                    user_id__in=members_ids,
-                    timestamp__gte=start_dt,
-                    timestamp__lt=end_dt,
-                ).aggregate(Sum("distance_km"))["distance_km__sum"] or 0.0
-                progress_cur = total_km
+                progress_cur = squad_week_distance(squad.id, goal.week_start_date)
                 goal_cur = goal.target_distance_km
                 achieved = goal.achieved
             else:
@@ -227,35 +405,45 @@ class MyWeeklySummaryView(generics.GenericAPIView):
             })
         return response.Response({"summary": out})
 
+DETAIL_LEADERBOARD_SIZE = 10
+
 class SquadDetailFullView(generics.GenericAPIView):
     """
-    GET squad details + current goal status + streak leaderboard
+    GET squad details + current goal status + the top DETAIL_LEADERBOARD_SIZE
+    of the streak leaderboard (the whole board is /squads/<id>/leaderboard/)
     """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, pk):
         squad = get_object_or_404(Squad, pk=pk, members=request.user)
+        week_start = get_current_week_start(squad.timezone)
+        # only members get here, and members all see the same payload
+        data = cached(
+            "squad-detail-full", (squad.id, week_start, "member"),
+            [squad_tag(squad.id), goal_tag(squad.id, week_start)],
+            lambda: self.payload(squad, week_start),
+        )
+        return response.Response(data)
 
+    def payload(self, squad, week_start):
         # serialize squad base info
         squad_data = SquadDetailSerializer(squad).data
 
         # goal info
-        week_start = get_current_week_start()
         goal = SquadWeeklyGoal.objects.filter(
             squad=squad,
             week_start_date=week_start
         ).first()
         goal_data = SquadGoalSerializer(goal).data if goal else None
 
-        # leaderboard info
-        lb_resp = SquadLeaderboardView().get(request, pk)
-        leaderboard_data = lb_resp.data["members"]
+        # leaderboard top; the whole board is /squads/<id>/leaderboard/
+        leaderboard_data = leaderboard_rows(squad.id, limit=DETAIL_LEADERBOARD_SIZE)
 
-        return response.Response({
+        return {
             "squad": squad_data,
             "goal": goal_data,
             "leaderboard": leaderboard_data,
-        })
+        }
 
 class SquadBrowseView(generics.ListAPIView):
     """
@@ -265,7 +453,7 @@ class SquadBrowseView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        queryset = Squad.objects.filter(is_private=False).prefetch_related("members", "owner")
+        queryset = Squad.objects.filter(is_private=False)
 
         # Search by name
         search = self.request.query_params.get('search', None)
@@ -279,6 +467,9 @@ class SquadBrowseView(generics.ListAPIView):
 
         return queryset.order_by('-created_at')
 
+    def list(self, request, *args, **kwargs):
+        return response.Response(squad_rows(self.get_queryset(), request.user))
+
 class SquadJoinView(APIView):
     """
     Join a public squad
@@ -295,15 +486,14 @@ class SquadJoinView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Check if already a member
-        if request.user in squad.members.all():
-            return response.Response(
-                {"error": "You are already a member of this squad."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Add user to squad
-        squad.members.add(request.user)
+        # Add user to squad; a no-op insert means they already were a member
+        with transaction.atomic():
+            if not add_member(squad, request.user.id):
+                return response.Response(
+                    {"error": "You are already a member of this squad."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            emit_membership("member.joined", squad, request.user.id, 1)
 
         return response.Response(
             {"message": "Successfully joined squad!", "squad": SquadDetailSerializer(squad).data},
@@ -322,15 +512,18 @@ class SquadLeaveView(APIView):
         # If owner leaves, delete the entire squad
         if squad.owner == request.user:
             squad_name = squad.name
-            squad.delete()
+            with transaction.atomic():
+                record_squad_deleted(squad)
+                squad.delete()
             return response.Response(
                 {"message": f"Squad '{squad_name}' has been deleted."},
                 status=status.HTTP_200_OK
             )
 
         # Remove user from squad
-        squad.members.remove(request.user)
-        squad.admins.remove(request.user)
+        with transaction.atomic():
+            emit_membership("member.left", squad, request.user.id, -1)
+            remove_members(squad, [request.user.id])
 
         return response.Response(
             {"message": "Successfully left squad."},
@@ -354,7 +547,9 @@ class SquadDeleteView(APIView):
             )
 
         squad_name = squad.name
-        squad.delete()
+        with transaction.atomic():
+            record_squad_deleted(squad)
+            squad.delete()
 
         return response.Response(
             {"message": f"Squad '{squad_name}' has been deleted."},
@@ -0,0 +1,106 @@
+"""
+Change log for client delta sync.
+
+Write paths call record() inside their own transaction, so an entry
+exists if and only if the change it describes was committed. Entries are
+addressed either to one user (their runs and badges, a squad they left)
+or to a squad (everyone currently in it sees its goals, messages and
+squad row).
+
+Row ids are handed out at INSERT time, not commit time, so a slow
+transaction can commit a lower id after a client has already read past
+it. Clients therefore page on seq instead, which stamp_changes() assigns
+to committed entries under one row lock: anything committed later gets a
+higher seq than everything already stamped.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import ChangeLogEntry, ChangeSequence
+
+logger = logging.getLogger(__name__)
+
+RUN = ChangeLogEntry.RUN
+SQUAD = ChangeLogEntry.SQUAD
+GOAL = ChangeLogEntry.GOAL
+BADGE = ChangeLogEntry.BADGE
+MESSAGE = ChangeLogEntry.MESSAGE
+
+def record(entity, ids, user_id=None, squad_id=None, deleted=False):
+    """
+    ids: one id or an iterable of ids of `entity` that changed.
+    """
+    if isinstance(ids, int):
+        ids = [ids]
+    return record_many([(entity, entity_id, user_id, squad_id, deleted) for entity_id in ids])
+
+def record_many(changes):
+    """
+    changes: iterable of (entity, entity_id, user_id, squad_id, deleted)
+    in one INSERT.
+    """
+    rows = [
+        ChangeLogEntry(entity=entity, entity_id=entity_id, user_id=user_id, squad_id=squad_id, deleted=deleted)
+        for entity, entity_id, user_id, squad_id, deleted in changes
+    ]
+    if rows:
+        ChangeLogEntry.objects.bulk_create(rows, batch_size=1000)
+        if settings.SYNC_STAMP_ON_COMMIT:
+            transaction.on_commit(schedule_stamp)
+    return rows
+
+def record_squad_deleted(squad):
+    # the squad's own audience is gone with it: tell each member directly
+    member_ids = squad.members.values_list("id", flat=True)
+    return record_many((SQUAD, squad.id, user_id, None, True) for user_id in member_ids)
+
+def schedule_stamp():
+    # best effort: if the broker is down the periodic stamp picks it up
+    from app.tasks.tasks import run_change_stamp
+    try:
+        run_change_stamp.apply_async(retry=False)
+    except Exception:
+        logger.warning("sync: could not enqueue stamp, leaving it to the periodic task")
+
+@transaction.atomic
+def stamp_changes(batch_size=None):
+    """
+    Give committed, unstamped entries the next seqs, in id order. seq is
+    id plus a per-batch offset, so one UPDATE stamps the whole batch.
+    Returns the number stamped.
+    """
+    batch_size = batch_size or settings.SYNC_STAMP_BATCH_SIZE
+    # the row is created by the sync migration
+    head = ChangeSequence.objects.select_for_update().get(pk=1)
+    ids = list(
+        ChangeLogEntry.objects.filter(seq__isnull=True)
+        .order_by("id").values_list("id", flat=True)[:batch_size]
+    )
+    if not ids:
+        return 0
+    offset = head.last_seq + 1 - ids[0]
+    ChangeLogEntry.objects.filter(id__in=ids).update(seq=F("id") + offset)
+    head.last_seq = ids[-1] + offset
+    head.save(update_fields=["last_seq"])
+    return len(ids)
+
+def stamp_until_empty(max_batches=20):
+    stamped = 0
+    for _ in range(max_batches):
+        n = stamp_changes()
+        stamped += n
+        if n < settings.SYNC_STAMP_BATCH_SIZE:
+            break
+    return stamped
+
+def prune_changes(now=None):
+    """
+    Drop entries older than SYNC_RETENTION_DAYS; tokens that old get a
+    reset from /sync/ instead.
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=settings.SYNC_RETENTION_DAYS)
+    deleted, _ = ChangeLogEntry.objects.filter(created_at__lt=cutoff, seq__isnull=False).delete()
+    return deleted
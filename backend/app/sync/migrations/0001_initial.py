@@ -0,0 +1,42 @@
+# Generated by Django 5.0.6 on 2026-10-19 16:23
+
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    apps.get_model("sync", "ChangeSequence").objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_seq', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(choices=[('run', 'Run'), ('squad', 'Squad'), ('goal', 'Squad weekly goal'), ('badge', 'User badge'), ('message', 'Squad message')], max_length=10)),
+                ('entity_id', models.BigIntegerField()),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('squad_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted', models.BooleanField(default=False)),
+                ('seq', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('user_id__isnull', False)), fields=['user_id', 'seq'], name='sync_user_seq_idx'), models.Index(condition=models.Q(('squad_id__isnull', False)), fields=['squad_id', 'seq'], name='sync_squad_seq_idx'), models.Index(condition=models.Q(('seq__isnull', True)), fields=['id'], name='sync_unstamped_idx')],
+            },
+        ),
+        migrations.RunPython(create_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+from django.db import models
+from django.db.models import Q
+
+
+class ChangeLogEntry(models.Model):
+    """
+    One insert/update/delete of a synced row, written in the same
+    transaction as the change. seq is stamped after commit, in commit
+    order, by app.sync.changes.stamp_changes; clients page on seq.
+    """
+    RUN = "run"
+    SQUAD = "squad"
+    GOAL = "goal"
+    BADGE = "badge"
+    MESSAGE = "message"
+    ENTITY_CHOICES = [
+        (RUN, "Run"),
+        (SQUAD, "Squad"),
+        (GOAL, "Squad weekly goal"),
+        (BADGE, "User badge"),
+        (MESSAGE, "Squad message"),
+    ]
+
+    entity = models.CharField(max_length=10, choices=ENTITY_CHOICES)
+    entity_id = models.BigIntegerField()
+    # audience: one user, or everyone currently in the squad
+    user_id = models.BigIntegerField(null=True, blank=True)
+    squad_id = models.BigIntegerField(null=True, blank=True)
+    deleted = models.BooleanField(default=False)
+    seq = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user_id", "seq"], condition=Q(user_id__isnull=False), name="sync_user_seq_idx"),
+            models.Index(fields=["squad_id", "seq"], condition=Q(squad_id__isnull=False), name="sync_squad_seq_idx"),
+            models.Index(fields=["id"], condition=Q(seq__isnull=True), name="sync_unstamped_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.entity} #{self.entity_id}{' (deleted)' if self.deleted else ''}"
+
+
+class ChangeSequence(models.Model):
+    """
+    Single row holding the last seq handed out; locking it serializes
+    stamping so seq order is commit order.
+    """
+    last_seq = models.BigIntegerField(default=0)
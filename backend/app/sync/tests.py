@@ -0,0 +1,83 @@
+import time
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from app.squads.membership import add_member
+from app.squads.models import Squad
+from .changes import RUN, stamp_until_empty
+from .models import ChangeLogEntry
+from .views import make_token
+
+User = get_user_model()
+
+
+@override_settings(THROTTLE_ENABLED=False, OUTBOX_DRAIN_ON_COMMIT=False, SYNC_STAMP_ON_COMMIT=False)
+class SyncTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", password="x")
+        self.runner = User.objects.create_user(username="runner", password="x")
+        self.squad = Squad.objects.create(name="sync", owner=self.owner)
+        for user in (self.owner, self.runner):
+            add_member(self.squad, user.id)
+        stamp_until_empty()
+        self.token = self.sync(self.runner)["token"]
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def sync(self, user, since=None):
+        stamp_until_empty()
+        params = {"since": since} if since else {}
+        resp = self.client_for(user).get("/api/sync/", params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def log_run(self, km=5):
+        resp = self.client_for(self.runner).post("/api/runs/", {"distance": km, "duration_minutes": 30}, format="json")
+        self.assertEqual(resp.status_code, 201)
+        return resp.json()["id"]
+
+    def test_late_commit_with_a_lower_id_is_not_skipped(self):
+        # ids are handed out at INSERT: a slow transaction took id 500,
+        # a fast one took 900 and committed (and was stamped) first
+        ChangeLogEntry.objects.create(id=900, entity=RUN, entity_id=1, user_id=self.runner.id, deleted=True)
+        first = self.sync(self.runner, self.token)
+        self.assertEqual(first["deletes"], {"runs": [1]})
+        ChangeLogEntry.objects.create(id=500, entity=RUN, entity_id=2, user_id=self.runner.id, deleted=True)
+        second = self.sync(self.runner, first["token"])
+        self.assertEqual(second["deletes"], {"runs": [2]})
+        seqs = dict(ChangeLogEntry.objects.filter(id__in=[500, 900]).values_list("id", "seq"))
+        self.assertGreater(seqs[500], seqs[900])
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_pages_until_has_more_is_false(self):
+        run_ids = [self.log_run(km) for km in (3, 4, 5)]
+        first = self.sync(self.runner, self.token)
+        self.assertTrue(first["has_more"])
+        second = self.sync(self.runner, first["token"])
+        self.assertFalse(second["has_more"])
+        synced = [r["id"] for page in (first, second) for r in page["upserts"]["runs"]]
+        self.assertEqual(synced, run_ids)
+        self.assertNotIn("upserts", self.sync(self.runner, second["token"]))
+
+    def test_leaving_sends_a_tombstone(self):
+        self.assertEqual(self.client_for(self.runner).post(f"/api/squads/{self.squad.id}/leave/").status_code, 200)
+        data = self.sync(self.runner, self.token)
+        self.assertEqual(data["deletes"], {"squads": [self.squad.id]})
+        self.assertNotIn("upserts", data)
+
+    def test_deleting_a_squad_tells_every_member(self):
+        resp = self.client_for(self.owner).delete(f"/api/squads/{self.squad.id}/delete/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.sync(self.runner, self.token)["deletes"], {"squads": [self.squad.id]})
+
+    @override_settings(SYNC_RETENTION_DAYS=30)
+    def test_expired_token_resets(self):
+        seq = int(self.token.split(".")[0])
+        stale = f"{seq}.{int(time.time()) - 29 * 86400}"
+        data = self.sync(self.runner, stale)
+        self.assertTrue(data["reset"])
+        self.assertNotEqual(data["token"], stale)
+        self.assertNotIn("reset", self.sync(self.runner, make_token(seq)))
@@ -0,0 +1,151 @@
+import time
+from django.conf import settings
+from rest_framework import permissions, response, status
+from rest_framework.views import APIView
+from app.runs.models import RunLog, is_flagged
+from app.shop.models import UserBadge
+from app.shop.serializers import UserBadgeSerializer
+from app.squads.membership import Membership
+from app.squads.models import Squad, SquadMessage, SquadWeeklyGoal
+from app.squads.serializers import SquadGoalSerializer
+from app.squads.slim import iso, message_rows, squad_rows, MESSAGE_FIELDS
+from app.squads.unread import unread_counts
+from .changes import BADGE, GOAL, MESSAGE, RUN, SQUAD
+from .models import ChangeLogEntry, ChangeSequence
+
+# response keys per entity
+COLLECTIONS = {RUN: "runs", SQUAD: "squads", GOAL: "goals", BADGE: "badges", MESSAGE: "messages"}
+RUN_FIELDS = ("id", "distance_km", "duration_minutes", "timestamp", "anomaly_score", "excluded")
+
+def make_token(seq):
+    return f"{seq}.{int(time.time())}"
+
+def parse_token(token):
+    """
+    (seq, issued unix time); raises ValueError.
+    """
+    seq, issued = token.split(".")
+    return int(seq), int(issued)
+
+def head_token():
+    seq = ChangeSequence.objects.filter(pk=1).values_list("last_seq", flat=True).first() or 0
+    return make_token(seq)
+
+def changes_after(user, seq, limit):
+    """
+    Stamped entries for this user after seq, oldest first: their own, and
+    their current squads'. Each half of the UNION walks its (audience, seq)
+    index, so with nothing new this is one cheap query.
+    """
+    fields = ("seq", "entity", "entity_id", "deleted")
+    mine = ChangeLogEntry.objects.filter(user_id=user.id, seq__gt=seq).values_list(*fields)
+    squads = ChangeLogEntry.objects.filter(
+        squad_id__in=Membership.objects.filter(user_id=user.id).values("squad_id"),
+        seq__gt=seq,
+    ).values_list(*fields)
+    return list(mine.union(squads, all=True).order_by("seq")[:limit])
+
+def build_payload(request, entries):
+    """
+    Collapse the page to the latest change per row, then load the live
+    rows in one query per entity. Rows the caller can no longer see
+    (deleted, or a squad they have left) are reported as deleted.
+    """
+    latest = {}
+    for _, entity, entity_id, deleted in entries:
+        latest[(entity, entity_id)] = deleted
+    wanted = {entity: [] for entity in COLLECTIONS}
+    for (entity, entity_id), deleted in latest.items():
+        if not deleted:
+            wanted[entity].append(entity_id)
+
+    user = request.user
+    upserts = {}
+    if wanted[RUN]:
+        rows = RunLog.objects.filter(id__in=wanted[RUN], user=user).values(*RUN_FIELDS)
+        upserts[RUN] = [
+            {**r, "timestamp": iso(r["timestamp"]), "flagged": is_flagged(r["anomaly_score"], r["excluded"])}
+            for r in rows
+        ]
+    if wanted[SQUAD]:
+        upserts[SQUAD] = squad_rows(Squad.objects.filter(id__in=wanted[SQUAD], members=user), user)
+    if wanted[GOAL]:
+        goals = SquadWeeklyGoal.objects.filter(
+            id__in=wanted[GOAL], squad_id__in=Membership.objects.filter(user_id=user.id).values("squad_id"),
+        )
+        upserts[GOAL] = [{"id": g.id, **SquadGoalSerializer(g).data} for g in goals]
+    if wanted[BADGE]:
+        badges = UserBadge.objects.filter(id__in=wanted[BADGE], user=user).select_related("badge")
+        upserts[BADGE] = UserBadgeSerializer(badges, many=True, context={"request": request}).data
+    if wanted[MESSAGE]:
+        rows = list(
+            SquadMessage.objects.filter(
+                id__in=wanted[MESSAGE],
+                squad_id__in=Membership.objects.filter(user_id=user.id).values("squad_id"),
+            ).order_by("id").values("squad_id", *MESSAGE_FIELDS)
+        )
+        upserts[MESSAGE] = [
+            {"squad": row["squad_id"], **payload} for row, payload in zip(rows, message_rows(rows))
+        ]
+
+    deletes = {}
+    for (entity, entity_id), deleted in latest.items():
+        if deleted:
+            deletes.setdefault(entity, []).append(entity_id)
+    for entity, ids in wanted.items():
+        found = {row["id"] for row in upserts.get(entity, [])}
+        gone = [i for i in ids if i not in found]
+        if gone:
+            deletes.setdefault(entity, []).extend(gone)
+
+    out = {}
+    if upserts:
+        out["upserts"] = {COLLECTIONS[e]: rows for e, rows in upserts.items() if rows}
+    if deletes:
+        out["deletes"] = {COLLECTIONS[e]: ids for e, ids in deletes.items()}
+    return out
+
+class SyncView(APIView):
+    """
+    Delta sync for the mobile client.
+
+    GET without ?since= returns just a token: take it *before* the full
+    list loads, then pass it back as ?since= to receive only what changed
+    since. Each page holds at most SYNC_PAGE_SIZE changes, collapsed to
+    the latest state per row: "upserts" carry the rows in the same shape
+    as their list endpoints, "deletes" carry ids. Keep paging while
+    has_more is true. A squad showing up in upserts that the client did
+    not have yet (a new membership) should be loaded in full. reset=true
+    means the token is too old to replay: reload everything. Every
+    response also carries "unread": unread chat messages per squad id,
+    so the client never has to page through chats to find new ones.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        since = request.query_params.get("since")
+        unread = {str(squad_id): n for squad_id, n in unread_counts(request.user.id).items()}
+        if not since:
+            return response.Response({"token": head_token(), "unread": unread})
+        try:
+            seq, issued = parse_token(since)
+        except ValueError:
+            return response.Response(
+                {"error": "since must be a token returned by /sync/."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # a day of slack before pruning could have removed entries it needs
+        if time.time() - issued > (settings.SYNC_RETENTION_DAYS - 1) * 86400:
+            return response.Response({"token": head_token(), "reset": True, "unread": unread})
+
+        limit = settings.SYNC_PAGE_SIZE
+        entries = changes_after(request.user, seq, limit + 1)
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        data = {
+            "token": make_token(entries[-1][0] if entries else seq),
+            "has_more": has_more,
+            "unread": unread,
+        }
+        data.update(build_payload(request, entries))
+        return response.Response(data)
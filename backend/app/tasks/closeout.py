@@ -1,64 +1,141 @@
+from collections import defaultdict
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta, timezone as dt_timezone
 from app.common.utils import get_current_week_start, get_previous_week_start, week_range
+from app.common.db_router import use_primary
 from app.squads.models import (
     Squad,
     SquadWeeklyGoal,
     SquadMemberStats,
     WeeklyResultLog,
 )
+from app.squads.caching import invalidate_squad
+from app.squads.membership import Membership
+from app.squads.points import add_squad_points
+from app.sync.changes import GOAL, SQUAD, record
 from app.runs.models import RunLog
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# rows per bulk INSERT when recording a closeout for every member
+MEMBER_BATCH_SIZE = 1000
+
+# weekly squad points: base + bonus (bigger when the goal went up) on
+# success, penalty on a miss (app.tasks.simulator replays alternatives)
+BASE_POINTS = 50
+RAISED_GOAL_BONUS = 20
+HELD_GOAL_BONUS = 5
+MISSED_GOAL_POINTS = -20
+
 def compute_week_points(goal_cur, goal_prev, progress_cur):
     if progress_cur >= goal_cur:
-        base_points = 50
-        bonus_points = 20 if goal_cur > goal_prev else 5
+        base_points = BASE_POINTS
+        bonus_points = RAISED_GOAL_BONUS if goal_cur > goal_prev else HELD_GOAL_BONUS
         pts = base_points + bonus_points
         return pts, True
     else:
-        return -20, False
+        return MISSED_GOAL_POINTS, False
 
-@transaction.atomic
-def closeout_week(test_current_week=False):
+def week_distance(squad, week_start, user_ids=None):
+    # authoritative squad-week distance, straight from RunLog, for user_ids
+    # (the current members by default)
+    start_dt, end_dt = week_range(week_start, squad.timezone)
+    if user_ids is None:
+        user_ids = squad.members.values_list("id", flat=True)
+    return RunLog.objects.filter(
+        user_id__in=user_ids,
+        timestamp__gte=start_dt,
+        timestamp__lt=end_dt,
+        excluded=False,
+    ).aggregate(sum_km=Sum("distance_km"))["sum_km"] or 0.0
+
+def closing_weeks(squads, test_current_week=False, now=None):
+    """
+    (squad, week_start, prev_week_start) for each squad's week to close.
+    """
+    weeks = []
+    for squad in squads:
+        if test_current_week:
+            # For testing: close out the CURRENT week
+            week_start = get_current_week_start(squad.timezone, now=now)
+            prev_week_start = get_previous_week_start(squad.timezone, now=now)
+        else:
+            # Normal operation: close out LAST week
+            week_start = get_previous_week_start(squad.timezone, now=now)
+            prev_week_start = week_start - timedelta(days=7)
+        weeks.append((squad, week_start, prev_week_start))
+    return weeks
+
+def closing_run_ids(weeks):
+    """
+    Ids of the counted runs in the still-open weeks about to be closed:
+    one query per distinct week range (squads sharing a timezone share it).
     """
-    Called weekly (Sunday 23:59:59 -> new Monday).
-    We'll finalize LAST week.
+    open_weeks = set(
+        SquadWeeklyGoal.objects.filter(
+            squad_id__in=[squad.id for squad, _, _ in weeks], closed_out=False,
+        ).values_list("squad_id", "week_start_date")
+    )
+    by_range = defaultdict(list)
+    for squad, week_start, _ in weeks:
+        if (squad.id, week_start) in open_weeks:
+            by_range[week_range(week_start, squad.timezone)].append(squad.id)
+    run_ids = set()
+    for (start_dt, end_dt), squad_ids in by_range.items():
+        run_ids.update(
+            RunLog.objects.filter(
+                user_id__in=Membership.objects.filter(squad_id__in=squad_ids).values("user_id"),
+                timestamp__gte=start_dt,
+                timestamp__lt=end_dt,
+                excluded=False,
+            ).values_list("id", flat=True)
+        )
+    return run_ids
+
+@use_primary()
+def closeout_week(test_current_week=False, squads=None, now=None):
+    """
+    Called once each squad's local week is over (see closeout_timezone_bucket).
+    We'll finalize LAST week, as seen from the squad's timezone.
 
     Args:
         test_current_week: If True, close out THIS week instead (for testing only)
+        squads: Squad queryset to close out, defaults to every squad
+        now: Reference time for "last week", defaults to the current time
     """
-    if test_current_week:
-        # For testing: close out the CURRENT week
-        week_start = get_current_week_start()
-        prev_week_start = get_previous_week_start()
-    else:
-        # Normal operation: close out LAST week
-        week_start = get_previous_week_start()
-        prev_week_start = week_start - timedelta(days=7)
+    if squads is None:
+        squads = Squad.objects.all()
+    weeks = closing_weeks(squads, test_current_week, now)
+    # last chance to keep implausible runs out of the weeks being scored:
+    # only their runs, in a short transaction of its own so the row locks
+    # are released before the closeout starts
+    # (imported here: web requests reach this module through the outbox)
+    from app.runs.anomaly import exclude_anomalous_runs
+    run_ids = closing_run_ids(weeks)
+    if run_ids:
+        with transaction.atomic():
+            exclude_anomalous_runs(run_ids=run_ids)
+    close_out_weeks(weeks)
 
-    squads = Squad.objects.all()
-    for squad in squads:
+@transaction.atomic
+def close_out_weeks(weeks):
+    for squad, week_start, prev_week_start in weeks:
         # find last week's record
-        goal_qs = SquadWeeklyGoal.objects.filter(squad=squad, week_start_date=week_start)
-        if not goal_qs.exists():
+        goal_obj = SquadWeeklyGoal.objects.filter(squad=squad, week_start_date=week_start, closed_out=False).first()
+        if goal_obj is None:
             continue
-        goal_obj = goal_qs.first()
-        if goal_obj.closed_out:
+        # claim the week: when two closeouts overlap (a bucket running past
+        # the hour, the catch-up path, the admin action) the second one's
+        # UPDATE waits for the first to commit, then matches no row
+        if not SquadWeeklyGoal.objects.filter(pk=goal_obj.pk, closed_out=False).update(closed_out=True):
             continue
 
         # compute total_distance_km for that squad + week_start
-        start_dt, end_dt = week_range(goal_obj.week_start_date)
-        members_ids = squad.members.values_list("id", flat=True)
-        total_km = RunLog.objects.filter(
-            user_id__in=members_ids,
-            timestamp__gte=start_dt,
-            timestamp__lt=end_dt,
-        ).aggregate(sum_km=Sum("distance_km"))["sum_km"] or 0.0
+        total_km = week_distance(squad, goal_obj.week_start_date)
 
         # prev week's goal for scaling
         prev_goal_obj = SquadWeeklyGoal.objects.filter(squad=squad, week_start_date=prev_week_start).first()
@@ -76,32 +153,81 @@ def closeout_week(test_current_week=False):
         goal_obj.achieved = achieved
         goal_obj.points_awarded_each_member = points_change
         goal_obj.closed_out = True
-        goal_obj.save()
+        goal_obj.save(update_fields=["total_distance_km", "achieved", "points_awarded_each_member"])
 
         # Award points to the SQUAD (not individuals)
-        squad.total_points += points_change
-        squad.save()
-
-        # update each member's streaks (but NOT individual points)
-        for member in squad.members.select_related("profile").all():
-            stats, _ = SquadMemberStats.objects.get_or_create(squad=squad, user=member)
-            if achieved:
-                if stats.last_week_achieved:
-                    stats.current_streak_weeks += 1
-                else:
-                    stats.current_streak_weeks = 1
-                if stats.current_streak_weeks > stats.longest_streak_weeks:
-                    stats.longest_streak_weeks = stats.current_streak_weeks
-                stats.last_week_achieved = True
-            else:
-                stats.current_streak_weeks = 0
-                stats.last_week_achieved = False
-            stats.save()
-
-            # log result for personal weekly summary
-            WeeklyResultLog.objects.update_or_create(
-                user=member,
-                squad=squad,
-                week_start_date=week_start,
-                defaults={"points_change": points_change}
-            )
+        add_squad_points(squad, points_change)
+        record(GOAL, goal_obj.id, squad_id=squad.id)
+        record(SQUAD, squad.id, squad_id=squad.id)
+        invalidate_squad(squad.id, week_start)
+
+        update_member_results(squad, week_start, achieved, points_change)
+
+def update_member_results(squad, week_start, achieved, points_change):
+    """
+    Advance every member's streak (but NOT individual points) and log the
+    week for their personal summary. Bulk statements, so a 10k-member squad
+    costs a handful of queries rather than several per member.
+    """
+    member_ids = list(squad.members.values_list("id", flat=True))
+    SquadMemberStats.objects.bulk_create(
+        [SquadMemberStats(squad=squad, user_id=user_id) for user_id in member_ids],
+        ignore_conflicts=True, batch_size=MEMBER_BATCH_SIZE,
+    )
+    # one UPDATE for everyone; right-hand F()s all see the pre-update row
+    stats = SquadMemberStats.objects.filter(squad=squad, user__squads=squad)
+    if achieved:
+        streak = Case(When(last_week_achieved=True, then=F("current_streak_weeks") + 1), default=Value(1))
+        stats.update(
+            current_streak_weeks=streak,
+            longest_streak_weeks=Greatest(F("longest_streak_weeks"), streak),
+            last_week_achieved=True,
+        )
+    else:
+        stats.update(current_streak_weeks=0, last_week_achieved=False)
+
+    WeeklyResultLog.objects.bulk_create(
+        [
+            WeeklyResultLog(user_id=user_id, squad=squad, week_start_date=week_start, points_change=points_change)
+            for user_id in member_ids
+        ],
+        update_conflicts=True,
+        unique_fields=["user", "squad", "week_start_date"],
+        update_fields=["points_change"],
+        batch_size=MEMBER_BATCH_SIZE,
+    )
+
+def overdue_goals(now=None):
+    """
+    {week_start: [squad ids]} of goals still open after their squad's
+    local week has ended. The partial index on open goals keeps this to
+    the handful of rows not yet closed out.
+    """
+    now = now or timezone.now()
+    # no local week that started within the last 6 UTC days can be over yet
+    rows = (
+        SquadWeeklyGoal.objects.filter(closed_out=False, week_start_date__lte=now.date() - timedelta(days=6))
+        .values_list("squad_id", "squad__timezone", "week_start_date")
+    )
+    due = {}
+    for squad_id, tz_name, week_start in rows:
+        if week_start < get_current_week_start(tz_name, now=now):
+            due.setdefault(week_start, []).append(squad_id)
+    return due
+
+def closeout_timezone_bucket(now=None):
+    """
+    Hourly entry point: close out every squad whose week has ended but is
+    still open. Each timezone's squads fall due in the hour after their
+    local Monday 00:00, which spreads the closeout across the day instead
+    of one global spike; squads missed by an earlier run (worker down, a
+    deploy) are picked up by the next one, oldest week first so streaks
+    advance in order. Returns the number of squad-weeks due.
+    """
+    due = overdue_goals(now)
+    for week_start in sorted(due):
+        # midday UTC on the following Monday is within that local week
+        # (Monday or Tuesday) in every timezone, so "last week" is week_start
+        week_now = datetime.combine(week_start + timedelta(days=7), time(12), tzinfo=dt_timezone.utc)
+        closeout_week(squads=Squad.objects.filter(id__in=due[week_start]), now=week_now)
+    return sum(len(squad_ids) for squad_ids in due.values())
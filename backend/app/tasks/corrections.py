@@ -0,0 +1,156 @@
+"""
+Retroactive corrections for runs that land in already closed-out weeks.
+
+A backdated run (or a later edit) can change a week after closeout_week
+has scored it. Instead of re-running closeout, apply_corrections
+re-scores only the affected squad-weeks. It applies the point difference
+through the squad points counter. When a week's achieved flag flips, it replays
+SquadMemberStats streaks forward from that week. Squads that were not
+touched are never loaded.
+
+A closed week is always re-scored for the members it was scored for at
+closeout (its WeeklyResultLog rows), never the squad's members today:
+joining or leaving later does not change a past week.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.db import transaction
+from app.common.db_router import use_primary
+from app.squads.models import Squad, SquadWeeklyGoal, SquadMemberStats, WeeklyResultLog
+from app.squads.caching import invalidate_squad
+from app.squads.points import add_squad_points
+from app.sync.changes import GOAL, SQUAD, record
+from .closeout import compute_week_points, week_distance
+
+def closed_weeks(pairs):
+    """
+    Filter (squad_id, week_start) pairs down to the ones already closed out.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return set()
+    squad_ids = {squad_id for squad_id, _ in pairs}
+    weeks = {week for _, week in pairs}
+    closed = SquadWeeklyGoal.objects.filter(
+        squad_id__in=squad_ids, week_start_date__in=weeks, closed_out=True,
+    ).values_list("squad_id", "week_start_date")
+    return pairs & set(closed)
+
+def closed_week_members(pairs):
+    """
+    {(squad_id, week_start): set of user ids} for closed squad-weeks: the
+    members each was scored for at closeout. Every pair gets an entry.
+    """
+    pairs = set(pairs)
+    members = {pair: set() for pair in pairs}
+    if not pairs:
+        return members
+    rows = WeeklyResultLog.objects.filter(
+        squad_id__in={squad_id for squad_id, _ in pairs},
+        week_start_date__in={week for _, week in pairs},
+    ).values_list("squad_id", "week_start_date", "user_id")
+    for squad_id, week, user_id in rows:
+        if (squad_id, week) in members:
+            members[(squad_id, week)].add(user_id)
+    return members
+
+@use_primary()
+@transaction.atomic
+def apply_corrections(pairs):
+    """
+    Re-score closed squad-weeks in one pass. pairs may contain many late
+    arrivals for the same squad-week; each is recomputed once.
+    Returns {squad_id: points delta}.
+    """
+    weeks_by_squad = defaultdict(set)
+    for squad_id, week in pairs:
+        weeks_by_squad[squad_id].add(week)
+
+    deltas = {}
+    for squad in Squad.objects.filter(id__in=weeks_by_squad):
+        goals = {
+            g.week_start_date: g
+            for g in SquadWeeklyGoal.objects.select_for_update().filter(
+                squad=squad, week_start_date__in=weeks_by_squad[squad.id], closed_out=True,
+            )
+        }
+        if not goals:
+            continue
+        scored_for = closed_week_members((squad.id, week) for week in goals)
+        prev_targets = dict(
+            SquadWeeklyGoal.objects.filter(
+                squad=squad, week_start_date__in=[w - timedelta(days=7) for w in goals],
+            ).values_list("week_start_date", "target_distance_km")
+        )
+
+        delta = 0
+        replay_from = None
+        for week in sorted(goals):
+            goal = goals[week]
+            total_km = week_distance(squad, week, scored_for[(squad.id, week)])
+            points, achieved = compute_week_points(
+                goal.target_distance_km,
+                prev_targets.get(week - timedelta(days=7), 0.0),
+                total_km,
+            )
+            delta += points - goal.points_awarded_each_member
+            if achieved != goal.achieved and replay_from is None:
+                replay_from = week
+
+            goal.total_distance_km = total_km
+            goal.achieved = achieved
+            goal.points_awarded_each_member = points
+            goal.save(update_fields=["total_distance_km", "achieved", "points_awarded_each_member"])
+            WeeklyResultLog.objects.filter(squad=squad, week_start_date=week).update(points_change=points)
+            record(GOAL, goal.id, squad_id=squad.id)
+
+        add_squad_points(squad, delta)
+        if delta:
+            record(SQUAD, squad.id, squad_id=squad.id)
+        if replay_from is not None:
+            replay_member_streaks(squad, replay_from)
+        invalidate_squad(squad.id, *goals)
+        deltas[squad.id] = delta
+    return deltas
+
+def replay_member_streaks(squad, from_week):
+    """
+    Recompute streaks for members who took part in any closeout on or after
+    from_week. A member's history is the closed weeks they have a
+    WeeklyResultLog row for, which is exactly the set of closeouts that
+    updated their SquadMemberStats.
+    """
+    achieved_by_week = dict(
+        SquadWeeklyGoal.objects.filter(squad=squad, closed_out=True)
+        .values_list("week_start_date", "achieved")
+    )
+    weeks_by_user = defaultdict(list)
+    for user_id, week in (
+        WeeklyResultLog.objects.filter(squad=squad)
+        .order_by("week_start_date")
+        .values_list("user_id", "week_start_date")
+    ):
+        weeks_by_user[user_id].append(week)
+
+    affected = {uid for uid, weeks in weeks_by_user.items() if weeks and weeks[-1] >= from_week}
+    changed = []
+    for stats in SquadMemberStats.objects.filter(squad=squad, user_id__in=affected):
+        current = longest = 0
+        last = False
+        for week in weeks_by_user[stats.user_id]:
+            if achieved_by_week.get(week, False):
+                current = current + 1 if last else 1
+                longest = max(longest, current)
+                last = True
+            else:
+                current = 0
+                last = False
+        if (stats.current_streak_weeks, stats.longest_streak_weeks, stats.last_week_achieved) != (current, longest, last):
+            stats.current_streak_weeks = current
+            stats.longest_streak_weeks = longest
+            stats.last_week_achieved = last
+            changed.append(stats)
+    SquadMemberStats.objects.bulk_update(
+        changed, ["current_streak_weeks", "longest_streak_weeks", "last_week_achieved"]
+    )
+    return len(changed)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from app.common.bench import format_table
+from app.tasks import reports
+from app.tasks.snapshot import Snapshot
+
+REPORTS = ('active', 'goals', 'distance', 'points', 'squads')
+
+
+class Command(BaseCommand):
+    help = 'Standard reports from the analytics snapshot (reads no database tables)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--report', action='append', choices=REPORTS, help='repeatable; default: all of them')
+        parser.add_argument('--weeks', type=int, default=12)
+        parser.add_argument('--dir', help='snapshot directory (default ANALYTICS_SNAPSHOT_DIR)')
+
+    def handle(self, *args, **options):
+        snapshot = Snapshot(options['dir'])
+        if snapshot.manifest is None:
+            raise CommandError(f'no snapshot in {snapshot.root}; run analytics_snapshot first')
+        weeks = options['weeks']
+        self.stdout.write(f"Snapshot taken {snapshot.manifest['taken_at']} (change seq {snapshot.manifest['seq']})")
+
+        for report in options['report'] or REPORTS:
+            self.stdout.write('')
+            if report == 'active':
+                rows = [[w, n, runs, f'{km:.0f}'] for w, n, runs, km in reports.weekly_active_runners(snapshot, weeks)]
+                self.stdout.write(format_table(['week', 'active runners', 'runs', 'km'], rows))
+            elif report == 'goals':
+                rows = [[w, n, f'{rate:.1%}', f'{target:.1f}'] for w, n, rate, target in reports.goal_hit_rates(snapshot, weeks)]
+                self.stdout.write(format_table(['week', 'closed goals', 'hit rate', 'median target km'], rows))
+            elif report == 'distance':
+                percentiles, buckets = reports.distance_distribution(snapshot, min(weeks, 4))
+                self.stdout.write('run distance ' + ', '.join(f'p{p} {km:.1f} km' for p, km in percentiles.items()))
+                self.stdout.write(format_table(['km', 'runs'], buckets))
+            elif report == 'points':
+                rows = [[w, n, total, f'{gained:.1%}'] for w, n, total, gained in reports.member_points(snapshot, weeks)]
+                self.stdout.write(format_table(['week', 'members scored', 'points', 'gained'], rows))
+            elif report == 'squads':
+                percentiles, count = reports.squad_sizes(snapshot)
+                self.stdout.write(f'{count} squads, members ' + ', '.join(f'p{p} {n:.0f}' for p, n in percentiles.items()))
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS('✓ Reports complete'))
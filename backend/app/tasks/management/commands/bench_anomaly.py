@@ -0,0 +1,52 @@
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from app.common.bench import format_table
+from app.runs.anomaly import score_arrays
+
+
+class Command(BaseCommand):
+    help = 'Measure run anomaly scoring throughput over synthetic run histories'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs', type=int, nargs='+', default=[100_000, 1_000_000, 5_000_000],
+            help='history sizes to score',
+        )
+        parser.add_argument('--users', type=int, default=50_000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=11)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        rows = []
+        for n in options['runs']:
+            user_ids, distance, duration = self.synthetic_history(rng, n, options['users'])
+            best = float('inf')
+            for _ in range(options['repeat']):
+                t0 = time.perf_counter()
+                score, excluded = score_arrays(user_ids, distance, duration)
+                best = min(best, time.perf_counter() - t0)
+            flagged = int(((score >= settings.RUN_ANOMALY_Z) & ~excluded).sum())
+            rows.append([
+                f'{n:,}',
+                f'{best * 1000:.0f}',
+                f'{n / best / 1e6:.2f}',
+                int(excluded.sum()),
+                flagged,
+            ])
+
+        self.stdout.write(format_table(['runs', 'best ms', 'M runs/s', 'excluded', 'flagged'], rows))
+        self.stdout.write(self.style.SUCCESS('✓ Anomaly scoring benchmark complete'))
+
+    def synthetic_history(self, rng, n, n_users):
+        # each user has a typical distance and pace; 0.1% of runs are junk
+        user_ids = rng.integers(1, n_users + 1, n)
+        typical_km = rng.uniform(3, 15, n_users + 1)[user_ids]
+        pace = rng.uniform(4.5, 7.5, n_users + 1)[user_ids]
+        distance = typical_km * rng.lognormal(0, 0.25, n)
+        duration = distance * pace * rng.lognormal(0, 0.08, n)
+        junk = rng.random(n) < 0.001
+        distance[junk] *= 50
+        return user_ids, distance, duration
@@ -0,0 +1,108 @@
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from app.common.bench import latency_stats, format_table
+from app.runs.models import RunLog
+from app.squads.models import Squad, SquadMessage, SquadWeeklyGoal
+from app.common.utils import get_current_week_start
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the hot read endpoints on one or more running stacks, e.g. '
+        '--target sync=http://localhost:8000 --target async=http://localhost:8001. '
+        'Run with --seed first so every stack reads the same dataset.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help='create the benchmark dataset')
+        parser.add_argument('--target', action='append', default=[], help='name=base_url, repeatable')
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--requests', type=int, default=2000, help='requests per endpoint per target')
+        parser.add_argument('--squads', type=int, default=20)
+        parser.add_argument('--members', type=int, default=30)
+        parser.add_argument('--runs-per-member', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['squads'], options['members'], options['runs_per_member'])
+
+        if not options['target']:
+            return
+        user = User.objects.filter(username='bench_async_0').first()
+        squad = Squad.objects.filter(name='bench_async_0').first()
+        if not user or not squad:
+            raise CommandError('No benchmark dataset, run with --seed first.')
+        token = str(RefreshToken.for_user(user).access_token)
+
+        paths = [
+            f'/api/squads/{squad.id}/goal/',
+            '/api/squads/me/weekly-summary/',
+            f'/api/squads/{squad.id}/leaderboard/',
+            f'/api/squads/{squad.id}/messages/',
+            '/api/leaderboard/global/',
+        ]
+        rows = []
+        for target in options['target']:
+            name, _, base_url = target.partition('=')
+            for path in paths:
+                result = self.load(base_url.rstrip('/') + path, token, options['concurrency'], options['requests'])
+                rows.append([
+                    name, path, f"{result['rps']:.0f}",
+                    f"{result['p50']:.1f}", f"{result['p99']:.1f}", result['errors'],
+                ])
+        self.stdout.write(format_table(['stack', 'endpoint', 'req/s', 'p50 ms', 'p99 ms', 'errors'], rows))
+
+    def load(self, url, token, concurrency, total):
+        def one(_):
+            req = urllib.request.Request(url, headers={'Authorization': f'Bearer {token}'})
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=30) as resp:
+                    resp.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return (time.perf_counter() - t0) * 1000, ok
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(total)))
+        wall = time.perf_counter() - t0
+
+        stats = latency_stats([ms for ms, ok in results if ok] or [0.0])
+        stats['rps'] = total / wall
+        stats['errors'] = sum(1 for _, ok in results if not ok)
+        return stats
+
+    def seed(self, n_squads, n_members, runs_per_member):
+        week_start = get_current_week_start()
+        now = timezone.now()
+        users = [User.objects.get_or_create(username=f'bench_async_{i}')[0] for i in range(n_members)]
+        for i in range(n_squads):
+            squad, _ = Squad.objects.get_or_create(name=f'bench_async_{i}', defaults={'owner': users[0]})
+            squad.members.add(*users)
+            SquadWeeklyGoal.objects.get_or_create(
+                squad=squad, week_start_date=week_start, defaults={'target_distance_km': 500},
+            )
+            if not squad.messages.exists():
+                SquadMessage.objects.bulk_create([
+                    SquadMessage(squad=squad, sender=users[j % n_members], text=f'bench message {j}')
+                    for j in range(200)
+                ])
+        if not RunLog.objects.filter(user=users[0]).exists():
+            RunLog.objects.bulk_create([
+                RunLog(user=u, distance_km=5 + j % 7, duration_minutes=30, timestamp=now - timedelta(hours=j))
+                for u in users for j in range(runs_per_member)
+            ])
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {n_squads} squads x {n_members} members (week of {week_start})'
+        ))
@@ -0,0 +1,111 @@
+import random
+import string
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from app.authapp.models import UserProfile
+from app.authapp.search import search_users
+from app.common.bench import format_table, time_call
+from app.squads.models import Squad
+
+User = get_user_model()
+
+MARK = 'bench_ac'
+SYLLABLES = 'ka lo mi ra te su no vi an el or is ur ja ne po'.split()
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed users and time username / display name autocomplete against the 10 ms '
+        'target (vs an unindexed istartswith scan), then a 200-user bulk invite vs '
+        'one invite request per user'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200_000)
+        parser.add_argument('--lookups', type=int, default=200)
+        parser.add_argument('--invitees', type=int, default=200)
+
+    def handle(self, *args, **options):
+        rng = random.Random(46)
+        self.seed(options['users'], rng)
+        prefixes = [
+            ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(1, 3)))
+            for _ in range(options['lookups'])
+        ]
+
+        def indexed():
+            search_users(prefixes[rng.randrange(len(prefixes))], 10)
+
+        def scan():
+            prefix = prefixes[rng.randrange(len(prefixes))]
+            list(
+                User.objects.filter(Q(username__istartswith=prefix) | Q(profile__display_name__istartswith=prefix))
+                .order_by('username').values('id', 'username')[:10]
+            )
+
+        rows = []
+        for name, fn in (('prefix index (search_users)', indexed), ('istartswith scan', scan)):
+            stats = time_call(fn, repeat=options['lookups'])
+            rows.append([name, f"{stats['p50']:.2f}", f"{stats['p95']:.2f}", f"{stats['p99']:.2f}"])
+        self.stdout.write(format_table(['autocomplete, top 10', 'p50 ms', 'p95 ms', 'p99 ms'], rows))
+        p95 = float(rows[0][2])
+
+        self.stdout.write('')
+        self.stdout.write(format_table(['invite', 'requests', 'queries', 'ms'], self.invites(options['invitees'])))
+
+        if p95 > 10:
+            raise CommandError(f'autocomplete p95 {p95:.2f} ms is over the 10 ms target')
+        self.stdout.write(self.style.SUCCESS('✓ Autocomplete benchmark complete'))
+
+    def seed(self, n, rng):
+        have = User.objects.filter(last_name=MARK).count()
+        if have >= n:
+            return
+        self.stdout.write(f'seeding {n - have} users...')
+        for start in range(have, n, 5000):
+            users = User.objects.bulk_create([
+                User(username=''.join(rng.choices(SYLLABLES, k=3)) + str(i), last_name=MARK,
+                     email=f'{MARK}{i}@example.com')
+                for i in range(start, min(n, start + 5000))
+            ])
+            # bulk_create skips the post_save signal that makes profiles
+            UserProfile.objects.bulk_create([
+                UserProfile(user=u, display_name=' '.join(rng.choices(SYLLABLES, k=2)).title())
+                for u in users
+            ])
+
+    def invites(self, count):
+        owner, _ = User.objects.get_or_create(username=f'{MARK}_owner')
+        client = APIClient()
+        client.force_authenticate(owner)
+        usernames = list(User.objects.filter(last_name=MARK).order_by('id').values_list('username', flat=True)[:count])
+        rows = []
+        with override_settings(THROTTLE_ENABLED=False):
+            for label in ('one request per user', 'bulk'):
+                Squad.objects.filter(name=f'{MARK}_squad').delete()
+                squad = Squad.objects.create(name=f'{MARK}_squad', owner=owner)
+                with CaptureQueriesContext(connection) as captured:
+                    if label == 'bulk':
+                        stats = time_call(lambda: self.bulk(client, squad, usernames, count), repeat=1, warmup=0)
+                        requests = 1
+                    else:
+                        stats = time_call(lambda: self.singles(client, squad, usernames), repeat=1, warmup=0)
+                        requests = len(usernames)
+                rows.append([label, requests, len(captured), f"{stats['p50']:.0f}"])
+        Squad.objects.filter(name=f'{MARK}_squad').delete()
+        return rows
+
+    def singles(self, client, squad, usernames):
+        for username in usernames:
+            resp = client.post(f'/api/squads/{squad.id}/invite/', {'username': username}, format='json')
+            if resp.status_code != 201:
+                raise CommandError(f'invite {username}: HTTP {resp.status_code}')
+
+    def bulk(self, client, squad, usernames, count):
+        resp = client.post(f'/api/squads/{squad.id}/invite/bulk/', {'identifiers': usernames}, format='json')
+        if resp.status_code != 201 or len(resp.json()['invited']) != count:
+            raise CommandError(f'bulk invite: HTTP {resp.status_code} {resp.content[:200]!r}')
@@ -0,0 +1,119 @@
+import random
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from app.authapp.models import UserProfile
+from app.common.bench import format_table
+from app.common.renderers import ORJSONRenderer
+from app.common.utils import get_previous_week_start
+from app.squads.models import Squad, SquadWeeklyGoal
+from app.squads.serializers import SimpleUserSerializer
+from app.tasks.closeout import closeout_week
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed one squad with --members members and time the squad payloads, the '
+        'paginated roster, the leaderboard and a closeout against it'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=10000)
+        parser.add_argument('--keep', action='store_true', help='keep the seeded benchmark data')
+
+    def handle(self, *args, **options):
+        squad, viewer = self.seed(options['members'])
+        client = APIClient()
+        client.force_authenticate(viewer)
+        base = f'/api/squads/{squad.id}'
+        rows = []
+        try:
+            with override_settings(THROTTLE_ENABLED=False):
+                rows.append(self.measure(
+                    'embedded roster (before)',
+                    lambda: ORJSONRenderer().render(
+                        SimpleUserSerializer(squad.members.select_related('profile'), many=True).data
+                    ),
+                ))
+                for name, url in (
+                    ('GET /squads/', '/api/squads/'),
+                    ('GET /squads/{id}/', f'{base}/'),
+                    ('GET /squads/{id}/members/', f'{base}/members/'),
+                    ('GET /squads/{id}/members/?sort=name', f'{base}/members/?sort=name'),
+                    ('GET /squads/{id}/leaderboard/', f'{base}/leaderboard/'),
+                ):
+                    rows.append(self.measure(name, lambda: client.get(url).content))
+                rows.append(self.walk(client, f'{base}/members/?limit=200'))
+                rows.append(self.measure('closeout_week (1 squad)', lambda: self.closeout(squad)))
+        finally:
+            if not options['keep']:
+                Squad.objects.filter(name='bench_big_squad').delete()
+                User.objects.filter(username__startswith='bench_big_').delete()
+
+        self.stdout.write(format_table(['call', 'ms', 'queries', 'bytes'], rows))
+        self.stdout.write(self.style.SUCCESS(f'✓ Large squad benchmark complete ({options["members"]} members)'))
+
+    def seed(self, n):
+        squad = Squad.objects.filter(name='bench_big_squad').first()
+        if squad and squad.members.count() >= n:
+            return squad, squad.owner
+        existing = set(User.objects.filter(username__startswith='bench_big_').values_list('username', flat=True))
+        User.objects.bulk_create(
+            [User(username=f'bench_big_{i}') for i in range(n) if f'bench_big_{i}' not in existing],
+            batch_size=1000,
+        )
+        users = list(User.objects.filter(username__startswith='bench_big_').order_by('id')[:n])
+        rng = random.Random(41)
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=u, display_name=u.username, total_points=rng.randint(0, 5000)) for u in users],
+            ignore_conflicts=True, batch_size=1000,
+        )
+        owner = users[0]
+        squad, _ = Squad.objects.get_or_create(name='bench_big_squad', defaults={'owner': owner})
+        Squad.members.through.objects.bulk_create(
+            [Squad.members.through(squad=squad, user=u) for u in users],
+            ignore_conflicts=True, batch_size=1000,
+        )
+        return squad, owner
+
+    def measure(self, name, fn):
+        with CaptureQueriesContext(connection) as queries:
+            t0 = time.perf_counter()
+            body = fn()
+            elapsed = (time.perf_counter() - t0) * 1000
+        size = len(body) if isinstance(body, bytes) else '-'
+        return [name, f'{elapsed:.1f}', len(queries), size]
+
+    def walk(self, client, url):
+        """
+        Every page of the roster, following next_cursor to the end.
+        """
+        pages, size = 0, 0
+        with CaptureQueriesContext(connection) as queries:
+            t0 = time.perf_counter()
+            cursor = None
+            while True:
+                resp = client.get(url + (f'&cursor={cursor}' if cursor else ''))
+                pages += 1
+                size += len(resp.content)
+                cursor = resp.json()['next_cursor']
+                if not cursor:
+                    break
+            elapsed = (time.perf_counter() - t0) * 1000
+        return [f'full roster walk ({pages} pages)', f'{elapsed:.1f}', len(queries), size]
+
+    def closeout(self, squad):
+        # score last week, then roll everything back so reruns start clean
+        week = get_previous_week_start(squad.timezone)
+        with transaction.atomic():
+            SquadWeeklyGoal.objects.update_or_create(
+                squad=squad, week_start_date=week, defaults={'target_distance_km': 10, 'closed_out': False},
+            )
+            closeout_week(squads=Squad.objects.filter(pk=squad.pk), now=timezone.now())
+            transaction.set_rollback(True)
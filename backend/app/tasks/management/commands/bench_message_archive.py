@@ -0,0 +1,80 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from app.common.bench import time_call, format_table
+from app.squads.archive import archive_squad_messages, retention_cutoff
+from app.squads.models import Squad, SquadMessage
+from app.squads.serializers import SquadMessageSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark chat retention: grows two squads by the same volume, archives one, '
+        'and compares hot-table size and first-page list latency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--steps', type=int, default=5)
+        parser.add_argument('--per-step', type=int, default=20000, help='messages inserted per squad per step')
+        parser.add_argument('--recent', type=int, default=500, help='messages per step kept inside retention')
+        parser.add_argument('--retention-days', type=int, default=30)
+        parser.add_argument('--keep', action='store_true', help='keep the benchmark squads afterwards')
+
+    def handle(self, *args, **options):
+        sender, _ = User.objects.get_or_create(username='bench_chat_sender')
+        control, _ = Squad.objects.get_or_create(name='bench_chat_control', defaults={'owner': sender})
+        archived, _ = Squad.objects.get_or_create(
+            name='bench_chat_archived',
+            defaults={'owner': sender, 'message_retention_days': options['retention_days']},
+        )
+        for squad in (control, archived):
+            squad.members.add(sender)
+
+        rows = []
+        try:
+            for step in range(1, options['steps'] + 1):
+                for squad in (control, archived):
+                    self.seed(squad, sender, options['per_step'], options['recent'], options['retention_days'])
+
+                cutoff = retention_cutoff(options['retention_days'])
+                archive_squad_messages(archived.id, cutoff)
+
+                control_lat = time_call(lambda: self.first_page(control))
+                archived_lat = time_call(lambda: self.first_page(archived))
+                rows.append([
+                    step * options['per_step'],
+                    SquadMessage.objects.filter(squad=control).count(),
+                    SquadMessage.objects.filter(squad=archived).count(),
+                    f"{control_lat['p50']:.2f}",
+                    f"{archived_lat['p50']:.2f}",
+                    f"{archived_lat['p95']:.2f}",
+                ])
+                self.stdout.write(f'step {step} done')
+        finally:
+            if not options['keep']:
+                control.delete()
+                archived.delete()
+
+        self.stdout.write(format_table(
+            ['total/squad', 'hot rows (control)', 'hot rows (archived)',
+             'p50 ms (control)', 'p50 ms (archived)', 'p95 ms (archived)'],
+            rows,
+        ))
+
+    def seed(self, squad, sender, count, recent, retention_days):
+        batch = [SquadMessage(squad=squad, sender=sender, text=f'bench message {i}') for i in range(count)]
+        created = SquadMessage.objects.bulk_create(batch, batch_size=5000)
+        # auto_now_add stamps "now"; age everything but the recent tail past retention
+        old_ids = [m.id for m in created[:max(0, count - recent)]]
+        old_ts = timezone.now() - timedelta(days=retention_days + 1)
+        for i in range(0, len(old_ids), 5000):
+            SquadMessage.objects.filter(id__in=old_ids[i:i + 5000]).update(timestamp=old_ts)
+
+    def first_page(self, squad):
+        # mirrors SquadMessageListCreateView: COUNT for the paginator + first 50 rows
+        qs = SquadMessage.objects.filter(squad=squad).order_by('-timestamp')
+        qs.count()
+        return SquadMessageSerializer(qs.select_related('sender__profile')[:50], many=True).data
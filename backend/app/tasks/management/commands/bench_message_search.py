@@ -0,0 +1,80 @@
+import random
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from app.common.bench import format_table, time_call
+from app.squads.membership import add_member
+from app.squads.models import Squad, SquadMessage
+from app.squads.search import optimize_search_index, search_messages
+
+User = get_user_model()
+
+WORDS = 'run pace km tempo easy long hill sprint rest week goal squad nice crushed it tomorrow morning legs tired'.split()
+RARE = 'marathon'
+QUERIES = (
+    ('common word', 'run'),
+    ('two words', 'long run'),
+    ('phrase', '"hill sprint"'),
+    ('rare word', RARE),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Time squad chat search (first page, ranked and highlighted) as the message table '
+        'grows, against an icontains scan'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[20_000, 100_000, 300_000],
+                            help='total messages to grow the table to, in steps')
+        parser.add_argument('--squads', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=30)
+
+    def handle(self, *args, **options):
+        rng = random.Random(49)
+        sender, _ = User.objects.get_or_create(username='bench_search_user')
+        squads = []
+        for i in range(options['squads']):
+            squad, _ = Squad.objects.get_or_create(name=f'bench_search_{i}', defaults={'owner': sender})
+            add_member(squad, sender.id)
+            squads.append(squad)
+        target = squads[0]
+
+        rows = []
+        for size in options['sizes']:
+            self.grow(squads, size, rng)
+            for label, query in QUERIES:
+                hits, _ = search_messages(target.id, query, None, 20)
+                if label == 'rare word' and not hits:
+                    raise CommandError('search missed the seeded rare word')
+                fts = time_call(lambda: search_messages(target.id, query, None, 20), repeat=options['repeat'])
+                words = query.strip('"').split()
+                scan = time_call(lambda: list(
+                    SquadMessage.objects.filter(squad=target, **{'text__icontains': words[0]})
+                    .order_by('-id').values('id', 'text')[:20]
+                ), repeat=max(3, options['repeat'] // 10))
+                rows.append([f'{size:,}', label, len(hits), f"{fts['p50']:.2f}", f"{fts['p95']:.2f}", f"{scan['p50']:.2f}"])
+
+        self.stdout.write(format_table(
+            ['messages', 'query', 'hits (page)', 'search p50 ms', 'search p95 ms', 'icontains p50 ms'], rows,
+        ))
+        self.stdout.write(self.style.SUCCESS('✓ Message search benchmark complete'))
+
+    def grow(self, squads, size, rng):
+        have = SquadMessage.objects.filter(squad__in=squads).count()
+        if have >= size:
+            return
+        self.stdout.write(f'seeding {size - have:,} messages...')
+        sender_id = squads[0].owner_id
+        for start in range(have, size, 5000):
+            batch = []
+            for i in range(start, min(size, start + 5000)):
+                words = rng.choices(WORDS, k=rng.randint(3, 14))
+                squad = rng.choice(squads)
+                if i % 5000 == 0:
+                    words.append(RARE)
+                    squad = squads[0]
+                batch.append(SquadMessage(squad=squad, sender_id=sender_id, text=' '.join(words)))
+            SquadMessage.objects.bulk_create(batch)
+        # as after the nightly archival run
+        optimize_search_index()
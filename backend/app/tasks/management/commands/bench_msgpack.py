@@ -0,0 +1,103 @@
+import gzip
+import random
+from datetime import timedelta
+import msgpack
+import orjson
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from app.authapp.models import UserProfile
+from app.common.bench import format_table, time_call
+from app.common.renderers import MessagePackRenderer, ORJSONRenderer, from_columns
+from app.runs.models import RunLog
+from app.squads.membership import add_member
+from app.squads.models import Squad, SquadMessage
+
+User = get_user_model()
+
+WORDS = 'run pace km tempo easy long hill sprint rest week goal squad nice crushed it tomorrow morning legs tired'.split()
+
+FORMATS = (
+    ('json', ORJSONRenderer(), 'application/json'),
+    ('msgpack', MessagePackRenderer(), 'application/msgpack'),
+    ('msgpack columns', MessagePackRenderer(), 'application/msgpack; layout=columns'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Payload size (raw and gzipped) and encode/decode time of JSON vs MessagePack '
+        'vs columnar MessagePack for the list endpoints, checking all three decode to '
+        'the same data'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=50)
+        parser.add_argument('--runs', type=int, default=40, help='runs this week for the viewer')
+
+    def handle(self, *args, **options):
+        squad, viewer = self.seed(options['members'], options['runs'])
+        client = APIClient()
+        client.force_authenticate(viewer)
+        endpoints = [
+            ('squad messages', f'/api/squads/{squad.id}/messages/'),
+            ('squad leaderboard', f'/api/squads/{squad.id}/leaderboard/'),
+            ('squad members', f'/api/squads/{squad.id}/members/?limit=200'),
+            ('weekly runs', '/api/runs/weekly/'),
+            ('my squads', '/api/squads/'),
+        ]
+        rows = []
+        with override_settings(THROTTLE_ENABLED=False, RESPONSE_CACHE_ENABLED=False):
+            for name, url in endpoints:
+                reference = None
+                for label, renderer, accept in FORMATS:
+                    resp = client.get(url, HTTP_ACCEPT=accept)
+                    if resp.status_code != 200:
+                        raise CommandError(f'{url} ({label}): HTTP {resp.status_code}')
+                    decoded = self.decode(resp.content, label)
+                    if reference is None:
+                        reference = decoded
+                    elif decoded != reference:
+                        raise CommandError(f'{url}: {label} does not decode to the JSON payload')
+                    encode = time_call(lambda: renderer.render(resp.data, accept), repeat=50)
+                    decode = time_call(lambda: self.decode(resp.content, label), repeat=50)
+                    rows.append([
+                        name, label, len(resp.content), len(gzip.compress(resp.content)),
+                        f"{encode['p50']:.3f}", f"{decode['p50']:.3f}",
+                    ])
+
+        self.stdout.write(format_table(
+            ['endpoint', 'format', 'bytes', 'gzip bytes', 'encode ms', 'decode ms'], rows,
+        ))
+        self.stdout.write(self.style.SUCCESS('✓ MessagePack benchmark complete (all formats decode identically)'))
+
+    def decode(self, content, label):
+        if label == 'json':
+            return orjson.loads(content)
+        data = msgpack.unpackb(content, raw=False)
+        return from_columns(data) if label.endswith('columns') else data
+
+    def seed(self, members, runs):
+        owner, _ = User.objects.get_or_create(username='bench_mp_owner')
+        squad = Squad.objects.filter(name='bench_mp_squad').first()
+        if squad is None:
+            squad = Squad.objects.create(name='bench_mp_squad', owner=owner)
+            rng = random.Random(45)
+            users = [owner] + [User.objects.get_or_create(username=f'bench_mp_{i}')[0] for i in range(members - 1)]
+            for user in users:
+                UserProfile.objects.filter(user=user).update(total_points=rng.randint(0, 5000))
+            for user in users:
+                add_member(squad, user.id)
+            SquadMessage.objects.bulk_create([
+                SquadMessage(squad=squad, sender=rng.choice(users), text=' '.join(rng.choices(WORDS, k=rng.randint(2, 15))))
+                for i in range(200)
+            ])
+            now = timezone.now()
+            RunLog.objects.bulk_create([
+                RunLog(user=owner, distance_km=round(rng.uniform(2, 20), 2), duration_minutes=round(rng.uniform(10, 120), 1),
+                       timestamp=now - timedelta(minutes=rng.randint(0, 60 * 24 * 3)))
+                for _ in range(runs)
+            ])
+        return squad, owner
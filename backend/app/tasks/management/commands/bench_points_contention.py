@@ -0,0 +1,102 @@
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from app.common.bench import latency_stats, format_table
+from app.squads.models import Squad, SquadPointsShard
+from app.squads.points import add_squad_points, compact_point_shards, set_point_shards, squad_points
+from django.contrib.auth import get_user_model
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Many concurrent writers award points to one squad: the old read-modify-write '
+        'save(), an F() increment, and F() increments over N shards. Reports lost '
+        'updates, lock retries, throughput and per-award latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=16)
+        parser.add_argument('--awards', type=int, default=50, help='awards per writer')
+        parser.add_argument('--shards', type=int, default=8)
+
+    def handle(self, *args, **options):
+        owner, _ = User.objects.get_or_create(username='bench_points_owner')
+        squad, _ = Squad.objects.get_or_create(name='bench_points_squad', defaults={'owner': owner})
+
+        def naive(s):
+            # what closeout_week / PurchaseBadgeView used to do
+            s = Squad.objects.get(pk=s.pk)
+            s.total_points += 1
+            s.save()
+
+        modes = [
+            ('save()', 0, naive),
+            ('F()', 0, lambda s: add_squad_points(s, 1)),
+            (f'F() x{options["shards"]} shards', options['shards'], lambda s: add_squad_points(s, 1)),
+        ]
+        expected = options['writers'] * options['awards']
+        rows = []
+        for name, shards, award in modes:
+            Squad.objects.filter(pk=squad.pk).update(total_points=0)
+            SquadPointsShard.objects.filter(squad=squad).delete()
+            set_point_shards(squad, shards)
+
+            elapsed, samples, retries = self.race(squad, award, options['writers'], options['awards'])
+            read_back = squad_points(Squad.objects.get(pk=squad.pk))
+            compact_point_shards()
+            final = Squad.objects.get(pk=squad.pk).total_points
+            assert read_back == final, 'sum-on-read disagrees with compacted total'
+
+            stats = latency_stats(samples)
+            rows.append([
+                name, expected, final, expected - final, retries,
+                f'{expected / elapsed:.0f}', f"{stats['p50']:.1f}", f"{stats['p95']:.1f}",
+            ])
+
+        set_point_shards(squad, 0)
+        self.stdout.write(format_table(
+            ['mode', 'awards', 'recorded', 'lost', 'lock retries', 'awards/s', 'p50 ms', 'p95 ms'], rows,
+        ))
+        self.stdout.write(self.style.SUCCESS('✓ Points contention benchmark complete'))
+
+    def race(self, squad, award, writers, awards):
+        """
+        Release `writers` threads at once, each making `awards` awards.
+        Returns (wall seconds, per-award latencies, lock retries).
+        """
+        barrier = threading.Barrier(writers + 1)
+        lock = threading.Lock()
+        samples, retries = [], [0]
+
+        def writer():
+            mine, retried = [], 0
+            try:
+                barrier.wait()
+                for _ in range(awards):
+                    t0 = time.perf_counter()
+                    while True:
+                        try:
+                            award(squad)
+                            break
+                        except OperationalError:
+                            # SQLite "database is locked": wait and retry
+                            retried += 1
+                            time.sleep(0.001)
+                    mine.append((time.perf_counter() - t0) * 1000)
+            finally:
+                connections.close_all()
+                with lock:
+                    samples.extend(mine)
+                    retries[0] += retried
+
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        for t in threads:
+            t.start()
+        barrier.wait()
+        t0 = time.perf_counter()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - t0, samples, retries[0]
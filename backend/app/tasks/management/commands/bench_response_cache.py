@@ -0,0 +1,132 @@
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from app.common import response_cache
+from app.common.bench import format_table, latency_stats
+from app.common.utils import get_previous_week_start
+from app.runs.models import RunLog
+from app.shop.models import Badge
+from app.squads.membership import add_member
+from app.squads.models import Squad, SquadWeeklyGoal
+from app.tasks.closeout import closeout_week
+from app.tasks.corrections import apply_corrections
+from app.tasks.outbox import drain_until_empty
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that every write feeding the cached squad detail and goal payloads '
+        'invalidates them, then time cached vs uncached reads and print the cache metrics'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        owner, _ = User.objects.get_or_create(username='bench_resp_owner')
+        joiner, _ = User.objects.get_or_create(username='bench_resp_joiner')
+        Squad.objects.filter(name='bench_resp_squad').delete()
+        squad = Squad.objects.create(name='bench_resp_squad', owner=owner)
+        add_member(squad, owner.id)
+        self.squad = squad
+        self.client = APIClient()
+        self.client.force_authenticate(owner)
+        joiner_client = APIClient()
+        joiner_client.force_authenticate(joiner)
+        self.urls = [f'/api/squads/{squad.id}/', f'/api/squads/{squad.id}/goal/']
+        prev_week = get_previous_week_start(squad.timezone)
+        runs = []
+
+        def log_run():
+            runs.append(self.client.post('/api/runs/', {'distance': 5, 'duration_minutes': 30}, format='json').json()['id'])
+
+        # missed at closeout, then achieved by a late run: points and streaks move
+        def close_last_week():
+            SquadWeeklyGoal.objects.create(squad=squad, week_start_date=prev_week, target_distance_km=10)
+            RunLog.objects.create(user=owner, distance_km=3, duration_minutes=20, timestamp=timezone.now() - timedelta(days=7))
+            closeout_week(squads=Squad.objects.filter(pk=squad.pk))
+
+        def correct_last_week():
+            RunLog.objects.create(user=owner, distance_km=30, duration_minutes=90, timestamp=timezone.now() - timedelta(days=7))
+            apply_corrections([(squad.id, prev_week)])
+
+        def purchase():
+            badge = Badge.objects.create(name='bench_resp_badge', description='', icon='*', price=1)
+            self.client.post(f'/api/shop/badges/{badge.id}/purchase/')
+
+        checks = [
+            ('POST /runs/', log_run),
+            ('PATCH /runs/{id}/', lambda: self.client.patch(f'/api/runs/{runs[0]}/', {'distance': 8}, format='json')),
+            ('DELETE /runs/{id}/', lambda: self.client.delete(f'/api/runs/{runs[0]}/')),
+            ('POST /squads/{id}/goal/', lambda: self.client.post(f'/api/squads/{squad.id}/goal/', {'target_distance': 12}, format='json')),
+            ('POST /squads/{id}/join/', lambda: joiner_client.post(f'/api/squads/{squad.id}/join/')),
+            ('POST /squads/{id}/leave/', lambda: joiner_client.post(f'/api/squads/{squad.id}/leave/')),
+            ('closeout_week', close_last_week),
+            ('apply_corrections', correct_last_week),
+            ('POST /shop/badges/{id}/purchase/', purchase),
+        ]
+        rows, failures = [], 0
+        try:
+            with override_settings(THROTTLE_ENABLED=False):
+                for name, mutate in checks:
+                    ok, changed = self.check_write(mutate)
+                    failures += not ok
+                    rows.append([name, 'ok' if ok else 'STALE', 'yes' if changed else 'no'])
+                self.stdout.write(format_table(['write', 'cached == fresh', 'payload changed'], rows))
+
+                self.stdout.write('')
+                response_cache.reset_metrics()
+                timing = [self.measure(label, enabled, options['requests'])
+                          for label, enabled in (('uncached', False), ('cached', True))]
+                self.stdout.write(format_table(['GET /squads/{id}/ + /goal/', 'p50 ms', 'p95 ms', 'queries/request'], timing))
+                response_cache.flush_metrics()
+                metrics = response_cache.shared_metrics()
+        finally:
+            Squad.objects.filter(name='bench_resp_squad').delete()
+            Badge.objects.filter(name='bench_resp_badge').delete()
+            RunLog.objects.filter(user__in=[owner, joiner]).delete()
+
+        lookups = metrics['local_hits'] + metrics['shared_hits'] + metrics['misses']
+        hit_rate = (metrics['local_hits'] + metrics['shared_hits']) / lookups if lookups else 0.0
+        self.stdout.write('')
+        self.stdout.write(', '.join(f'{k}={v}' for k, v in metrics.items()) + f', hit rate {hit_rate:.1%}')
+        if failures:
+            raise CommandError(f'{failures} write(s) left a stale cached payload')
+        self.stdout.write(self.style.SUCCESS('✓ Response cache benchmark complete'))
+
+    def payloads(self):
+        return [self.client.get(url).content for url in self.urls]
+
+    def check_write(self, mutate):
+        """
+        Warm the cache, write, let the outbox catch up, then compare the
+        cached payloads with freshly computed ones.
+        """
+        self.payloads()
+        before = self.payloads()
+        mutate()
+        drain_until_empty()
+        after = self.payloads()
+        with override_settings(RESPONSE_CACHE_ENABLED=False):
+            fresh = self.payloads()
+        return after == fresh, after != before
+
+    def measure(self, label, enabled, n):
+        samples, queries = [], 0
+        with override_settings(RESPONSE_CACHE_ENABLED=enabled):
+            self.payloads()
+            for _ in range(n):
+                with CaptureQueriesContext(connection) as captured:
+                    t0 = time.perf_counter()
+                    self.payloads()
+                    samples.append((time.perf_counter() - t0) * 1000)
+                queries += len(captured)
+        stats = latency_stats(samples)
+        return [label, f"{stats['p50']:.2f}", f"{stats['p95']:.2f}", f'{queries / n:.1f}']
@@ -0,0 +1,122 @@
+import gzip
+import time
+from types import SimpleNamespace
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from app.common.bench import format_table
+from app.common.renderers import ORJSONRenderer
+from app.squads.models import Squad, SquadMessage
+from app.squads.serializers import SquadDetailSerializer, SquadMessageSerializer
+from app.squads.slim import squad_rows, message_rows, MESSAGE_FIELDS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare serialization time and bytes-on-wire of the ModelSerializer + JSONRenderer '
+        'path against the .values() + orjson path for the hot read endpoints'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--squads', type=int, default=40)
+        parser.add_argument('--members', type=int, default=25)
+        parser.add_argument('--messages', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--keep', action='store_true', help='keep the seeded benchmark data')
+
+    def handle(self, *args, **options):
+        viewer, squads = self.seed(options['squads'], options['members'], options['messages'])
+        request = SimpleNamespace(user=viewer)
+        squad = squads[0]
+        try:
+            endpoints = [
+                ('/squads/', lambda: self.legacy_squads(viewer.squads.all(), request),
+                 lambda: squad_rows(viewer.squads.all(), viewer)),
+                ('/squads/browse/', lambda: self.legacy_squads(Squad.objects.filter(is_private=False), request),
+                 lambda: squad_rows(Squad.objects.filter(is_private=False), viewer)),
+                (f'/squads/{squad.id}/messages/', lambda: self.legacy_messages(squad),
+                 lambda: message_rows(self.message_qs(squad).values(*MESSAGE_FIELDS)[:50])),
+                ('/leaderboard/global/', self.legacy_leaderboard, self.slim_leaderboard),
+            ]
+            rows = []
+            for name, legacy, slim in endpoints:
+                legacy_ms, legacy_body = self.measure(legacy, JSONRenderer(), options['repeat'])
+                slim_ms, slim_body = self.measure(slim, ORJSONRenderer(), options['repeat'])
+                if legacy_body != slim_body:
+                    self.stdout.write(self.style.WARNING(f'{name}: payloads differ'))
+                rows.append([
+                    name,
+                    f'{legacy_ms:.2f}',
+                    f'{slim_ms:.2f}',
+                    f'{legacy_ms / slim_ms:.1f}x' if slim_ms else '-',
+                    len(slim_body),
+                    len(gzip.compress(slim_body, mtime=0)),
+                    len(brotli.compress(slim_body, quality=4)) if brotli else '-',
+                ])
+        finally:
+            if not options['keep']:
+                Squad.objects.filter(name__startswith='bench_ser_').delete()
+                User.objects.filter(username__startswith='bench_ser_').delete()
+
+        self.stdout.write(format_table(
+            ['endpoint', 'legacy ms', 'slim ms', 'speedup', 'bytes', 'gzip', 'br'], rows,
+        ))
+
+    def measure(self, build, renderer, repeat):
+        body = renderer.render(build())
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            body = renderer.render(build())
+        return (time.perf_counter() - t0) * 1000 / repeat, body
+
+    def seed(self, n_squads, n_members, n_messages):
+        users = [
+            User.objects.get_or_create(username=f'bench_ser_{i}')[0]
+            for i in range(n_members)
+        ]
+        viewer = users[0]
+        squads = []
+        for i in range(n_squads):
+            squad, _ = Squad.objects.get_or_create(name=f'bench_ser_{i}', defaults={'owner': viewer})
+            squad.members.add(*users)
+            squads.append(squad)
+        if SquadMessage.objects.filter(squad=squads[0]).count() < n_messages:
+            SquadMessage.objects.bulk_create([
+                SquadMessage(squad=squads[0], sender=users[i % n_members], text=f'bench message {i}')
+                for i in range(n_messages)
+            ])
+        return viewer, squads
+
+    def message_qs(self, squad):
+        return SquadMessage.objects.filter(squad=squad).order_by('-timestamp')
+
+    # the pre-slim implementations, kept here as the comparison baseline
+
+    def legacy_squads(self, queryset, request):
+        qs = queryset.prefetch_related('members', 'owner')
+        return SquadDetailSerializer(qs, many=True, context={'request': request}).data
+
+    def legacy_messages(self, squad):
+        return SquadMessageSerializer(self.message_qs(squad)[:50], many=True).data
+
+    def legacy_leaderboard(self):
+        data = []
+        for u in User.objects.select_related('profile').all():
+            data.append({
+                'username': u.username,
+                'display_name': u.profile.display_name if hasattr(u, 'profile') else u.username,
+                'total_points': u.profile.total_points if hasattr(u, 'profile') else 0,
+            })
+        data.sort(key=lambda x: x['total_points'], reverse=True)
+        return {'global_top_10': data[:10]}
+
+    def slim_leaderboard(self):
+        from app.leaderboard.views import GlobalLeaderboardView
+        return GlobalLeaderboardView().get(SimpleNamespace(user=None)).data
@@ -0,0 +1,73 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from app.common.bench import format_table
+from app.squads.membership import add_member
+from app.squads.models import Squad, SquadMessage
+from app.sync.changes import stamp_until_empty
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'An app resume as five full list loads vs one /sync/ call, both idle and '
+        'after a burst of squad chat'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--squads', type=int, default=5)
+        parser.add_argument('--messages', type=int, default=50, help='messages posted between resumes')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='bench_sync_user')
+        friend, _ = User.objects.get_or_create(username='bench_sync_friend')
+        squads = []
+        for i in range(options['squads']):
+            squad, _ = Squad.objects.get_or_create(name=f'bench_sync_{i}', defaults={'owner': friend})
+            add_member(squad, friend.id)
+            add_member(squad, user.id)
+            squads.append(squad)
+        client = APIClient()
+        client.force_authenticate(user)
+        stamp_until_empty()
+
+        rows = []
+        try:
+            with override_settings(THROTTLE_ENABLED=False):
+                token = client.get('/api/sync/').json()['token']
+                rows.append(self.measure('five list loads', lambda: self.full_reload(client, squads[0])))
+                rows.append(self.measure('sync (idle)', lambda: client.get('/api/sync/', {'since': token}).content))
+
+                poster = APIClient()
+                poster.force_authenticate(friend)
+                for i in range(options['messages']):
+                    poster.post(f'/api/squads/{squads[i % len(squads)].id}/messages/', {'text': f'bench {i}'}, format='json')
+                stamp_until_empty()
+                rows.append(self.measure(
+                    f'sync ({options["messages"]} new messages)',
+                    lambda: client.get('/api/sync/', {'since': token}).content,
+                ))
+        finally:
+            SquadMessage.objects.filter(squad__in=squads).delete()
+
+        self.stdout.write(format_table(['resume', 'ms', 'queries', 'bytes'], rows))
+        self.stdout.write(self.style.SUCCESS('✓ Sync benchmark complete'))
+
+    def full_reload(self, client, squad):
+        size = 0
+        for url in ('/api/squads/', '/api/runs/weekly/', '/api/shop/my-badges/',
+                    f'/api/squads/{squad.id}/', f'/api/squads/{squad.id}/messages/'):
+            size += len(client.get(url).content)
+        return size
+
+    def measure(self, name, fn):
+        with CaptureQueriesContext(connection) as queries:
+            t0 = time.perf_counter()
+            body = fn()
+            elapsed = (time.perf_counter() - t0) * 1000
+        size = body if isinstance(body, int) else len(body)
+        return [name, f'{elapsed:.1f}', len(queries), size]
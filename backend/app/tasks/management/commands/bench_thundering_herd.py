@@ -0,0 +1,104 @@
+import threading
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from app.common.bench import latency_stats, format_table
+from app.leaderboard.views import GLOBAL_LEADERBOARD_KEY, global_top_10, leaderboard_row, top_users
+from django.contrib.auth import get_user_model
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Thundering herd on the global leaderboard: N callers hit an expired cache at the '
+        'same instant, with and without single-flight coalescing, counting DB queries. '
+        'Then one client polls in a tight loop to show the token bucket cutting it off.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--callers', type=int, default=100)
+        parser.add_argument('--rounds', type=int, default=3)
+        parser.add_argument('--polls', type=int, default=100, help='requests in the tight-loop client test')
+
+    def handle(self, *args, **options):
+        if not User.objects.exists():
+            User.objects.create(username='bench_herd_0')
+
+        direct = lambda: [leaderboard_row(r) for r in top_users(10)]
+        rows = []
+        for name, fn in (('direct', direct), ('coalesced', global_top_10)):
+            queries, samples = 0, []
+            for _ in range(options['rounds']):
+                cache.delete(GLOBAL_LEADERBOARD_KEY)
+                q, s = self.herd(fn, options['callers'])
+                queries += q
+                samples += s
+            stats = latency_stats(samples)
+            rows.append([
+                name, options['callers'], options['rounds'], queries,
+                f"{stats['p50']:.1f}", f"{stats['p95']:.1f}", f"{stats['max']:.1f}",
+            ])
+        self.stdout.write(format_table(
+            ['mode', 'callers', 'rounds', 'db queries', 'p50 ms', 'p95 ms', 'max ms'], rows,
+        ))
+
+        self.stdout.write('')
+        self.poll_loop(options['polls'])
+        self.stdout.write(self.style.SUCCESS('✓ Thundering herd benchmark complete'))
+
+    def herd(self, fn, callers):
+        """
+        Release `callers` threads at once on fn; returns (db queries, latencies).
+        """
+        barrier = threading.Barrier(callers)
+        lock = threading.Lock()
+        counts, samples = [0], []
+
+        def count(execute, sql, params, many, context):
+            with lock:
+                counts[0] += 1
+            return execute(sql, params, many, context)
+
+        def caller():
+            try:
+                with connection.execute_wrapper(count):
+                    barrier.wait()
+                    t0 = time.perf_counter()
+                    fn()
+                    elapsed = (time.perf_counter() - t0) * 1000
+                with lock:
+                    samples.append(elapsed)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=caller) for _ in range(callers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return counts[0], samples
+
+    def poll_loop(self, polls):
+        user, _ = User.objects.get_or_create(username='bench_herd_poller')
+        client = APIClient()
+        client.force_authenticate(user)
+        statuses = {}
+        counts = [0]
+
+        def count(execute, sql, params, many, context):
+            counts[0] += 1
+            return execute(sql, params, many, context)
+
+        cache.delete(GLOBAL_LEADERBOARD_KEY)
+        with override_settings(THROTTLE_ENABLED=True), connection.execute_wrapper(count):
+            for _ in range(polls):
+                status = client.get('/api/leaderboard/global/').status_code
+                statuses[status] = statuses.get(status, 0) + 1
+        self.stdout.write(format_table(
+            ['tight-loop requests', 'status counts', 'db queries'],
+            [[polls, ', '.join(f'{k}: {v}' for k, v in sorted(statuses.items())), counts[0]]],
+        ))
@@ -0,0 +1,56 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+from app.common.bench import time_call, format_table
+from app.runs import tracks
+
+
+class Command(BaseCommand):
+    help = (
+        'Time GPS track processing (decode, pack/unpack, haversine stats, '
+        'Douglas-Peucker per zoom level) over synthetic tracks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--points', type=int, nargs='+', default=[1000, 10000, 50000],
+            help='track sizes to generate (1 point per second)',
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        rows = []
+        for n in options['points']:
+            lat, lon, t = self.synthetic_track(rng, n)
+            polyline = tracks.encode_polyline(lat, lon)
+            blob = tracks.pack_track(lat, lon, t)
+
+            steps = [
+                ('decode polyline', lambda: tracks.decode_polyline(polyline)),
+                ('pack', lambda: tracks.pack_track(lat, lon, t)),
+                ('unpack', lambda: tracks.unpack_track(blob)),
+                ('stats', lambda: tracks.track_stats(lat, lon, t)),
+            ]
+            for zoom, tolerance in sorted(tracks.ZOOM_TOLERANCES_M.items()):
+                steps.append((f'simplify z{zoom}', lambda tol=tolerance: tracks.simplify(lat, lon, tol)))
+
+            for name, fn in steps:
+                stats = time_call(fn, repeat=options['repeat'])
+                rows.append([n, name, f"{stats['p50']:.2f}", f"{stats['p95']:.2f}"])
+            rows.append([n, 'stored bytes', len(blob), f'{len(blob) / n:.1f}/pt'])
+
+        self.stdout.write(format_table(['points', 'step', 'p50 ms', 'p95 ms'], rows))
+        self.stdout.write(self.style.SUCCESS('✓ Track benchmark complete'))
+
+    def synthetic_track(self, rng, n):
+        # a jittery run at ~3 m/s with a few stops, sampled every second
+        heading = np.cumsum(rng.normal(0, 0.05, n))
+        speed = np.clip(rng.normal(3.0, 0.4, n), 0, None)
+        speed[rng.random(n) < 0.02] = 0
+        north = np.cumsum(speed * np.cos(heading))
+        east = np.cumsum(speed * np.sin(heading))
+        lat = 37.77 + np.degrees(north / (tracks.EARTH_RADIUS_KM * 1000))
+        lon = -122.42 + np.degrees(east / (tracks.EARTH_RADIUS_KM * 1000 * np.cos(np.radians(37.77))))
+        t = 1_700_000_000_000 + np.arange(n, dtype=np.int64) * 1000
+        return lat, lon, t
@@ -0,0 +1,98 @@
+import random
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from app.common.bench import format_table, time_call
+from app.squads.membership import add_member
+from app.squads.models import Squad, SquadMessage, SquadReadCursor
+from app.squads.unread import mark_read, unread_counts
+
+User = get_user_model()
+
+MARK = 'bench_unread'
+
+
+class Command(BaseCommand):
+    help = (
+        'Time finding new chat messages across all of a user\'s squads: one unread count '
+        'query vs fetching page 1 of every squad\'s messages'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--squads', type=int, default=30)
+        parser.add_argument('--messages', type=int, default=5000, help='messages per squad')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rng = random.Random(50)
+        reader, _ = User.objects.get_or_create(username=f'{MARK}_reader')
+        sender, _ = User.objects.get_or_create(username=f'{MARK}_sender')
+        squads = self.seed(reader, sender, options['squads'], options['messages'])
+        # half the squads read up to somewhere in their history, half never opened
+        SquadReadCursor.objects.filter(user=reader).delete()
+        expected = {}
+        for squad in squads:
+            ids = list(SquadMessage.objects.filter(squad=squad).order_by('id').values_list('id', flat=True))
+            if rng.random() < 0.5:
+                cut = rng.randrange(len(ids))
+                mark_read(squad.id, reader.id, ids[cut])
+                expected[squad.id] = len(ids) - cut - 1
+            else:
+                expected[squad.id] = len(ids)
+
+        cap = settings.SQUAD_UNREAD_COUNT_CAP
+        got = unread_counts(reader.id)
+        wrong = [s for s, n in expected.items() if got.get(s) != min(n, cap)]
+        if wrong:
+            raise CommandError(f'unread counts are off for squads {wrong[:5]}')
+
+        client = APIClient()
+        client.force_authenticate(reader)
+        rows = []
+        with override_settings(THROTTLE_ENABLED=False):
+            cases = (
+                ('page 1 of every squad', len(squads), lambda: self.pages(client, squads)),
+                ('GET /squads/ (with unread_count)', 1, lambda: self.get(client, '/api/squads/')),
+                ('GET /sync/ (token + unread)', 1, lambda: self.get(client, '/api/sync/')),
+                ('unread_counts() alone', 0, lambda: unread_counts(reader.id)),
+            )
+            for label, requests, fn in cases:
+                counts = [0]
+
+                def count(execute, sql, params, many, context):
+                    counts[0] += 1
+                    return execute(sql, params, many, context)
+
+                with connection.execute_wrapper(count):
+                    fn()
+                stats = time_call(fn, repeat=options['repeat'])
+                rows.append([label, requests, counts[0], f"{stats['p50']:.2f}", f"{stats['p95']:.2f}"])
+        self.stdout.write(format_table(['app open', 'requests', 'queries', 'p50 ms', 'p95 ms'], rows))
+        self.stdout.write(self.style.SUCCESS('✓ Unread count benchmark complete'))
+
+    def seed(self, reader, sender, count, per_squad):
+        squads = []
+        for i in range(count):
+            squad, _ = Squad.objects.get_or_create(name=f'{MARK}_{i}', defaults={'owner': sender})
+            add_member(squad, sender.id)
+            add_member(squad, reader.id)
+            have = SquadMessage.objects.filter(squad=squad).count()
+            if have < per_squad:
+                SquadMessage.objects.bulk_create(
+                    [SquadMessage(squad=squad, sender=sender, text=f'message {n}') for n in range(have, per_squad)],
+                    batch_size=5000,
+                )
+            squads.append(squad)
+        return squads
+
+    def get(self, client, url):
+        resp = client.get(url)
+        if resp.status_code != 200:
+            raise CommandError(f'{url}: HTTP {resp.status_code}')
+
+    def pages(self, client, squads):
+        for squad in squads:
+            self.get(client, f'/api/squads/{squad.id}/messages/')
@@ -0,0 +1,134 @@
+import threading
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from app.common.bench import format_table
+from app.common.upsert import upsert
+from app.common.utils import get_current_week_start
+from app.squads.membership import add_member
+from app.squads.models import Squad, SquadMemberStats, SquadWeeklyGoal
+from django.contrib.auth import get_user_model
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Concurrent goal updates and joins against one squad, the old '
+        'get_or_create / members.all() paths vs the ON CONFLICT upserts. Reports '
+        'errors, double-counted joins and statements per request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--members', type=int, default=200, help='existing squad members')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        owner, _ = User.objects.get_or_create(username='bench_races_owner')
+        squad, _ = Squad.objects.get_or_create(name='bench_races_squad', defaults={'owner': owner})
+        existing = [
+            User.objects.get_or_create(username=f'bench_races_m{i}')[0].id
+            for i in range(options['members'])
+        ]
+        for user_id in existing:
+            add_member(squad, user_id)
+        # every joiner is sent twice at once, like a double-tapped button
+        joiners = [User.objects.get_or_create(username=f'bench_races_j{i}')[0].id for i in range(threads // 2)]
+        week = get_current_week_start(squad.timezone)
+
+        def old_goal(i):
+            goal, _ = SquadWeeklyGoal.objects.get_or_create(
+                squad=squad, week_start_date=week,
+                defaults={'target_distance_km': i, 'unit_entered': 'km'},
+            )
+            goal.target_distance_km = i
+            goal.unit_entered = 'km'
+            goal.save()
+
+        def new_goal(i):
+            upsert(
+                SquadWeeklyGoal,
+                {'squad_id': squad.id, 'week_start_date': week, 'target_distance_km': i, 'unit_entered': 'km'},
+                conflict=['squad', 'week_start_date'],
+                update=['target_distance_km', 'unit_entered'],
+            )
+
+        def old_join(i):
+            user = User.objects.get(pk=joiners[i % len(joiners)])
+            if user in squad.members.all():
+                return False
+            squad.members.add(user)
+            SquadMemberStats.objects.get_or_create(squad=squad, user=user)
+            return True
+
+        def new_join(i):
+            return add_member(squad, joiners[i % len(joiners)])
+
+        def reset_goal():
+            SquadWeeklyGoal.objects.filter(squad=squad, week_start_date=week).delete()
+
+        def reset_join():
+            Squad.members.through.objects.filter(squad=squad, user_id__in=joiners).delete()
+            SquadMemberStats.objects.filter(squad=squad, user_id__in=joiners).delete()
+
+        rows = []
+        for name, fn, reset in (
+            ('goal: get_or_create + save', old_goal, reset_goal),
+            ('goal: upsert', new_goal, reset_goal),
+            ('join: members.all() + add', old_join, reset_join),
+            ('join: add_member', new_join, reset_join),
+        ):
+            reset()
+            results, errors, statements = self.race(fn, threads)
+            double = sum(1 for r in results if r is True) - len(joiners) if name.startswith('join') else '-'
+            rows.append([name, threads, errors, double, f'{statements / threads:.1f}'])
+        reset_join()
+        reset_goal()
+
+        self.stdout.write(format_table(
+            ['path', 'requests', 'errors', 'double-counted joins', 'statements/request'], rows,
+        ))
+        self.stdout.write(self.style.SUCCESS('✓ Write race benchmark complete'))
+
+    def race(self, fn, threads):
+        """
+        Release all threads at once, each running fn(i) in its own
+        transaction. Returns (results, errors, statements executed).
+        """
+        barrier = threading.Barrier(threads)
+        lock = threading.Lock()
+        results, errors, counts = [], [0], [0]
+
+        def count(execute, sql, params, many, context):
+            # transaction bookkeeping (SAVEPOINT/RELEASE) is a round trip too
+            with lock:
+                counts[0] += 1
+            return execute(sql, params, many, context)
+
+        def worker(i):
+            try:
+                with connection.execute_wrapper(count):
+                    barrier.wait()
+                    while True:
+                        try:
+                            with transaction.atomic():
+                                result = fn(i)
+                            break
+                        except OperationalError:
+                            # SQLite "database is locked" under write contention
+                            continue
+                with lock:
+                    results.append(result)
+            except Exception as exc:
+                self.stderr.write(f'{type(exc).__name__}: {exc}')
+                with lock:
+                    errors[0] += 1
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return results, errors[0], counts[0]
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from datetime import timedelta
+from app.common.utils import get_current_week_start
+from app.squads.models import Squad
+from app.tasks.outbox import correct_squad_week, drain_until_empty, outbox_lag
+
+
+class Command(BaseCommand):
+    help = 'Catch up on the transactional outbox, optionally rebuilding squad rollups from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--max-batches', type=int, default=None)
+        parser.add_argument(
+            '--rebuild-weeks', type=int, default=0,
+            help='after draining, correct this many recent weeks of rollups against RunLog',
+        )
+
+    def handle(self, *args, **options):
+        lag = outbox_lag()
+        self.stdout.write(
+            f"Pending: {lag['pending']} events, oldest {lag['oldest_pending_age_seconds']:.1f}s"
+        )
+
+        drained = drain_until_empty(options['batch_size'], options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Drained {drained} events'))
+
+        if options['rebuild_weeks']:
+            count = corrected = 0
+            for squad in Squad.objects.all().iterator():
+                current = get_current_week_start(squad.timezone)
+                for i in range(options['rebuild_weeks']):
+                    if any(correct_squad_week(squad, current - timedelta(days=7 * i))):
+                        corrected += 1
+                count += 1
+            # the corrections are outbox events like any other
+            drain_until_empty(options['batch_size'], options['max_batches'])
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ Checked {options['rebuild_weeks']} week(s) of rollups for {count} squads, corrected {corrected}"
+            ))
+
+        lag = outbox_lag()
+        self.stdout.write(
+            f"Pending: {lag['pending']} events, oldest {lag['oldest_pending_age_seconds']:.1f}s"
+        )
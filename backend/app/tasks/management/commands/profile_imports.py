@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from app.common.bench import format_table
+
+# run in a fresh interpreter, like a lambda cold start: load the WSGI app,
+# then serve one request per path
+CHILD = """
+import json, sys, time
+from wsgiref.util import setup_testing_defaults
+t0 = time.perf_counter()
+from backend.wsgi import application
+startup = time.perf_counter() - t0
+requests = []
+for path in sys.argv[1:]:
+    environ = {"PATH_INFO": path, "wsgi.url_scheme": "https"}
+    setup_testing_defaults(environ)
+    status = []
+    t1 = time.perf_counter()
+    body = application(environ, lambda s, h, exc_info=None: status.append(s))
+    b"".join(body)
+    getattr(body, "close", lambda: None)()
+    requests.append([path, status[0], (time.perf_counter() - t1) * 1000])
+print(json.dumps({"startup_ms": startup * 1000, "requests": requests, "modules": sorted(sys.modules)}))
+"""
+
+
+def run_cold_start(paths, env, importtime=False):
+    """
+    Load the WSGI app and serve paths in a fresh interpreter. Returns the
+    completed process; its last stdout line is the child's JSON result
+    (startup_ms, [path, status, ms] per request, every module loaded).
+    """
+    flags = ['-X', 'importtime'] if importtime else []
+    proc = subprocess.run(
+        [sys.executable, *flags, '-c', CHILD, *paths],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode:
+        raise CommandError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'child failed')
+    return proc
+
+
+class Command(BaseCommand):
+    help = (
+        'Cold-start profile: import the WSGI app and serve one request per --path in a '
+        'fresh `python -X importtime` process, report the slowest top-level packages, and '
+        'fail if the cold start is over --budget-ms'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths', help='request path(s), default / and /api/squads/')
+        parser.add_argument('--serverless', choices=['0', '1'], help='force SERVERLESS for the child process')
+        parser.add_argument('--budget-ms', type=float, default=settings.COLD_START_BUDGET_MS)
+        parser.add_argument('--repeat', type=int, default=3, help='best of N runs, to ride out disk cache noise')
+        parser.add_argument('--top', type=int, default=15)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/', '/api/squads/']
+        env = dict(os.environ)
+        if options['serverless']:
+            env['SERVERLESS'] = options['serverless']
+
+        best = None
+        for _ in range(max(1, options['repeat'])):
+            result, imports = self.run_child(paths, env)
+            cold = result['startup_ms'] + sum(r[2] for r in result['requests'])
+            if best is None or cold < best[0]:
+                best = (cold, result, imports)
+        cold, result, imports = best
+
+        rows = sorted(imports.items(), key=lambda kv: kv[1][0], reverse=True)[:options['top']]
+        self.stdout.write(format_table(
+            ['package', 'self ms', 'modules'],
+            [[name, f'{us / 1000:.1f}', count] for name, (us, count) in rows],
+        ))
+        self.stdout.write('')
+        total_us = sum(us for us, _ in imports.values())
+        modules = sum(count for _, count in imports.values())
+        self.stdout.write(f"Imports: {modules} modules, {total_us / 1000:.0f} ms")
+        self.stdout.write(f"Startup (import backend.wsgi): {result['startup_ms']:.0f} ms")
+        for path, status, ms in result['requests']:
+            self.stdout.write(f'First GET {path}: {status}, {ms:.0f} ms')
+        self.stdout.write(f'Cold start: {cold:.0f} ms (budget {options["budget_ms"]:.0f} ms)')
+        if cold > options['budget_ms']:
+            raise CommandError(f'Cold start {cold:.0f} ms is over the {options["budget_ms"]:.0f} ms budget')
+        self.stdout.write(self.style.SUCCESS('✓ Cold start within budget'))
+
+    def run_child(self, paths, env):
+        """
+        Returns (child result, {top-level package: [self us, module count]}).
+        """
+        proc = run_cold_start(paths, env, importtime=True)
+        imports = defaultdict(lambda: [0, 0])
+        for line in proc.stderr.splitlines():
+            # "import time:  self [us] | cumulative | imported package"
+            if not line.startswith('import time:'):
+                continue
+            fields = line[len('import time:'):].split('|')
+            if len(fields) != 3 or not fields[0].strip().isdigit():
+                continue
+            package = fields[2].strip().split('.')[0]
+            imports[package][0] += int(fields[0])
+            imports[package][1] += 1
+        return json.loads(proc.stdout.strip().splitlines()[-1]), imports
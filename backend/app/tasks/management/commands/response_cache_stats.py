@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from app.common.response_cache import flush_metrics, reset_metrics, shared_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Response cache hit rate and staleness, summed over every process that has '
+        'flushed its counters (each does so every RESPONSE_CACHE_METRICS_EVERY lookups)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='zero the shared counters afterwards')
+
+    def handle(self, *args, **options):
+        flush_metrics()
+        m = shared_metrics()
+        lookups = m['local_hits'] + m['shared_hits'] + m['misses']
+        hits = m['local_hits'] + m['shared_hits']
+        self.stdout.write(f"Lookups: {lookups} ({m['local_hits']} local hits, {m['shared_hits']} shared hits, {m['misses']} misses)")
+        self.stdout.write(f"Hit rate: {hits / lookups:.1%}" if lookups else 'Hit rate: -')
+        self.stdout.write(f"Invalidations: {m['invalidations']}")
+        mean_lag = m['stale_lag_ms'] / m['stale'] if m['stale'] else 0
+        self.stdout.write(
+            f"Stale memoised tags noticed: {m['stale']} (mean {mean_lag:.0f} ms after the invalidation)"
+        )
+        if options['reset']:
+            reset_metrics()
+        self.stdout.write(self.style.SUCCESS('✓ Response cache stats'))
@@ -1,40 +1,102 @@
 from django.core.management.base import BaseCommand
-from django_celery_beat.models import PeriodicTask, CrontabSchedule
+from django_celery_beat.models import PeriodicTask, CrontabSchedule, IntervalSchedule
 import json
 
 
 class Command(BaseCommand):
-    help = 'Set up periodic tasks for weekly closeout'
+    help = 'Set up periodic tasks for weekly closeout, outbox drain, sync stamping, points compaction, chat archival, change log and outbox pruning'
 
     def handle(self, *args, **options):
-        # Create schedule: Every Monday at 00:00 UTC (Sunday 11:59:59 PM + 1 second)
+        # Closeout runs hourly; each run closes the squads whose local week
+        # has ended and is still open, so timezones spread the load over the
+        # day and a missed run is caught up by the next one
         schedule, created = CrontabSchedule.objects.get_or_create(
             minute='0',
-            hour='0',
-            day_of_week='1',  # Monday (0=Sunday, 1=Monday, etc.)
+            hour='*',
+            day_of_week='*',
             day_of_month='*',
             month_of_year='*',
         )
+        self.upsert_task('Hourly Squad Goal Closeout', 'app.tasks.tasks.run_bucketed_closeout', schedule)
+        self.stdout.write(self.style.SUCCESS(
+            f'Periodic task scheduled: Every hour, squads closed once their local week is over'
+        ))
+
+        # the single global Monday 00:00 UTC closeout is replaced by the above
+        disabled = PeriodicTask.objects.filter(name='Weekly Squad Goal Closeout').update(enabled=False)
+        if disabled:
+            self.stdout.write(self.style.SUCCESS('✓ Disabled legacy weekly closeout task'))
+
+        # Outbox backstop: drains are normally enqueued right after each commit
+        interval, created = IntervalSchedule.objects.get_or_create(every=30, period=IntervalSchedule.SECONDS)
+        self.upsert_task('Outbox Drain', 'app.tasks.tasks.run_outbox_drain', interval, schedule_field='interval')
+        self.stdout.write(self.style.SUCCESS(
+            f'Periodic task scheduled: Outbox drain every 30 seconds'
+        ))
+
+        # Sync change log backstop: entries are normally stamped right after each commit
+        self.upsert_task('Sync Change Stamp', 'app.tasks.tasks.run_change_stamp', interval, schedule_field='interval')
+        self.stdout.write(self.style.SUCCESS(
+            f'Periodic task scheduled: Sync change stamp every 30 seconds'
+        ))
+
+        # Fold sharded squad points back into Squad.total_points
+        interval, created = IntervalSchedule.objects.get_or_create(every=5, period=IntervalSchedule.MINUTES)
+        self.upsert_task('Squad Points Compaction', 'app.tasks.tasks.run_points_compaction', interval, schedule_field='interval')
+        self.stdout.write(self.style.SUCCESS(
+            f'Periodic task scheduled: Squad points compaction every 5 minutes'
+        ))
+
+        # Nightly chat archival, off-peak at 03:30 UTC
+        schedule, created = CrontabSchedule.objects.get_or_create(
+            minute='30',
+            hour='3',
+            day_of_week='*',
+            day_of_month='*',
+            month_of_year='*',
+        )
+        self.upsert_task('Nightly Squad Message Archival', 'app.tasks.tasks.run_message_archival', schedule)
+        self.stdout.write(self.style.SUCCESS(
+            f'Periodic task scheduled: Every day at 03:30 UTC'
+        ))
+        self.upsert_task('Nightly Sync Change Log Pruning', 'app.tasks.tasks.run_change_prune', schedule)
+        self.stdout.write(self.style.SUCCESS(
+            f'Periodic task scheduled: Sync change log pruning every day at 03:30 UTC'
+        ))
+        self.upsert_task('Nightly Outbox Pruning', 'app.tasks.tasks.run_outbox_prune', schedule)
+        self.stdout.write(self.style.SUCCESS(
+            f'Periodic task scheduled: Processed outbox event pruning every day at 03:30 UTC'
+        ))
 
+        # Nightly analytics snapshot, after the 03:30 jobs
+        schedule, created = CrontabSchedule.objects.get_or_create(
+            minute='0',
+            hour='4',
+            day_of_week='*',
+            day_of_month='*',
+            month_of_year='*',
+        )
+        self.upsert_task('Nightly Analytics Snapshot', 'app.tasks.tasks.run_analytics_snapshot', schedule)
+        self.stdout.write(self.style.SUCCESS(
+            f'Periodic task scheduled: Analytics snapshot every day at 04:00 UTC'
+        ))
+
+    def upsert_task(self, name, task_path, schedule, schedule_field='crontab'):
         # Create or update the periodic task
         task, task_created = PeriodicTask.objects.get_or_create(
-            name='Weekly Squad Goal Closeout',
+            name=name,
             defaults={
-                'task': 'app.tasks.tasks.run_weekly_closeout',
-                'crontab': schedule,
+                'task': task_path,
+                schedule_field: schedule,
                 'enabled': True,
             }
         )
 
         if not task_created:
-            task.task = 'app.tasks.tasks.run_weekly_closeout'
-            task.crontab = schedule
+            task.task = task_path
+            setattr(task, schedule_field, schedule)
             task.enabled = True
             task.save()
-            self.stdout.write(self.style.SUCCESS('✓ Updated existing periodic task'))
+            self.stdout.write(self.style.SUCCESS(f'✓ Updated existing periodic task: {name}'))
         else:
-            self.stdout.write(self.style.SUCCESS('✓ Created new periodic task'))
-
-        self.stdout.write(self.style.SUCCESS(
-            f'Periodic task scheduled: Every Monday at 00:00 UTC'
-        ))
+            self.stdout.write(self.style.SUCCESS(f'✓ Created new periodic task: {name}'))
@@ -0,0 +1,123 @@
+import time
+from datetime import date, timedelta
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+from app.common.bench import format_table
+from app.tasks.closeout import BASE_POINTS, HELD_GOAL_BONUS, MISSED_GOAL_POINTS, RAISED_GOAL_BONUS
+from app.tasks.simulator import (
+    PERCENTILES,
+    WeekHistory,
+    current_scoring,
+    linear_scoring,
+    last_closed_week,
+    load_history,
+    mismatches,
+    recorded_summary,
+    replay,
+    summarize,
+)
+from app.tasks.snapshot import Snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay past weekly closeouts under the current scoring and a proposed one, '
+        'without writing anything, and compare point and streak distributions'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=52)
+        parser.add_argument('--end', type=date.fromisoformat, help='last week start to replay (YYYY-MM-DD)')
+        parser.add_argument('--squad', type=int, action='append', dest='squads', help='limit to these squad ids')
+        parser.add_argument('--base', type=int, default=BASE_POINTS)
+        parser.add_argument('--raised-bonus', type=int, default=RAISED_GOAL_BONUS)
+        parser.add_argument('--held-bonus', type=int, default=HELD_GOAL_BONUS)
+        parser.add_argument('--missed', type=int, default=MISSED_GOAL_POINTS)
+        parser.add_argument(
+            '--scoring', help='dotted path to a scoring function (target, prev_target, progress) '
+                              '-> (points, achieved); overrides the constants above',
+        )
+        parser.add_argument(
+            '--synthetic', type=int, metavar='SQUADS',
+            help='replay a random history for this many squads instead of the database',
+        )
+        parser.add_argument('--seed', type=int, default=47)
+        parser.add_argument('--dir', help='snapshot directory (default ANALYTICS_SNAPSHOT_DIR)')
+        parser.add_argument(
+            '--db', action='store_true',
+            help='read goals from the database even when an analytics snapshot exists',
+        )
+
+    def handle(self, *args, **options):
+        t0 = time.perf_counter()
+        if options['synthetic']:
+            source = 'synthetic history'
+            history = self.synthetic_history(options['synthetic'], options['weeks'], options['seed'])
+        else:
+            # the nightly snapshot is already columnar; the database is
+            # current but has to be read row by row
+            snapshot = None if options['db'] else Snapshot(options['dir'])
+            if snapshot is not None and snapshot.manifest is None:
+                snapshot = None
+            source = f"snapshot of {snapshot.manifest['taken_at']}" if snapshot else 'database'
+            history = load_history(options['weeks'], end=options['end'], squad_ids=options['squads'], snapshot=snapshot)
+        load_ms = (time.perf_counter() - t0) * 1000
+        if not history.squad_ids.size:
+            raise CommandError('no squad goals in that window')
+
+        if options['scoring']:
+            proposed = import_string(options['scoring'])
+        else:
+            proposed = linear_scoring(options['base'], options['raised_bonus'], options['held_bonus'], options['missed'])
+
+        rows, timings, results = [], [], []
+        for label, scoring in (('current', current_scoring), ('proposed', proposed)):
+            t0 = time.perf_counter()
+            result = replay(history, scoring)
+            timings.append(f'{label} {(time.perf_counter() - t0) * 1000:.0f} ms')
+            results.append(result)
+            s = summarize(result)
+            rows.append(
+                [label, f"{s['hit_rate']:.1%}", f"{s['points_mean']:.0f}"]
+                + [f"{s[f'points_p{p}']:.0f}" for p in PERCENTILES]
+                + [f"{s['longest_streak_p50']:.0f}", f"{s['longest_streak_p95']:.0f}", s['longest_streak_max']]
+            )
+        recorded = recorded_summary(history)
+        if recorded['closed_weeks']:
+            rows.append(
+                ['recorded', '', f"{recorded['points_mean']:.0f}"]
+                + [f"{recorded[f'points_p{p}']:.0f}" for p in PERCENTILES]
+                + ['', '', '']
+            )
+
+        weeks = history.weeks
+        self.stdout.write(
+            f'{history.squad_ids.size:,} squads, {int(history.has_goal.sum()):,} squad-weeks '
+            f'({weeks[0]} .. {weeks[-1]}) from the {source}; load {load_ms:.0f} ms, replay {", ".join(timings)}'
+        )
+        self.stdout.write(format_table(
+            ['scoring', 'hit rate', 'mean pts']
+            + [f'p{p} pts' for p in PERCENTILES]
+            + ['squad streak p50', 'squad streak p95', 'squad streak max'],
+            rows,
+        ))
+        if recorded['closed_weeks']:
+            off = mismatches(results[0])
+            self.stdout.write(
+                f'current scoring reproduces {recorded["closed_weeks"] - off}/{recorded["closed_weeks"]} '
+                'closed-out weeks (the rest were re-scored by corrections or changed since)'
+            )
+        self.stdout.write(self.style.SUCCESS('✓ Closeout simulation complete (nothing written)'))
+
+    def synthetic_history(self, squads, weeks, seed):
+        # each squad has a typical goal it nudges up now and then, hits it
+        # about 60% of the time, and skips setting one ~10% of weeks
+        rng = np.random.default_rng(seed)
+        typical = rng.uniform(20, 150, squads)[:, None]
+        target = np.round(typical * np.cumprod(rng.choice([1.0, 1.1], (squads, weeks), p=[0.8, 0.2]), axis=1))
+        progress = target * rng.lognormal(0.08, 0.3, (squads, weeks))
+        target[rng.random((squads, weeks)) < 0.1] = np.nan
+        end = last_closed_week()
+        week_list = [end - timedelta(days=7 * (weeks - 1 - i)) for i in range(weeks)]
+        return WeekHistory.from_arrays(np.arange(1, squads + 1), week_list, target, progress)
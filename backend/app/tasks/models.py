@@ -1,3 +1,24 @@
 from django.db import models
+from django.db.models import Q
 
-# Create your models here.
+
+class OutboxEvent(models.Model):
+    """
+    Domain event written in the same transaction as the change that caused
+    it, then drained in batches by app.tasks.outbox.drain_outbox.
+    """
+    topic = models.CharField(max_length=50)
+    # plain ids: events must outlive the squad / user they describe
+    squad_id = models.BigIntegerField(null=True, blank=True)
+    user_id = models.BigIntegerField(null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["id"], condition=Q(processed_at__isnull=True), name="outbox_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.id}"
@@ -0,0 +1,290 @@
+"""
+Transactional outbox.
+
+Write paths call emit()/emit_many() inside their own transaction, so an
+event exists if and only if the change it describes was committed. The
+consumer (drain_outbox, run by celery right after commit and periodically
+as a backstop) folds batches of events into derived state:
+
+    run.created                  -> SquadWeeklyTotal / SquadWeeklyGoal progress
+    run.updated, run.deleted     -> same, old contribution out / new one in
+    run.excluded                 -> same, anomaly scorer took the run out
+    member.joined, member.left   -> same, for the member's runs this week
+    rollup.corrected             -> same, drift found by correct_squad_week
+    deltas into closed-out weeks -> app.tasks.corrections re-scores them
+                                    (run deltas only from members the
+                                    week was scored for)
+
+Every event carries its effect as "deltas": [[week_start_iso, km, runs], ...]
+for its squad. Deltas are summed per (squad, week) across the batch and
+applied once, and the batch is marked processed in the same transaction,
+so each event is applied exactly once and replays after a crash are safe.
+Processed events are kept OUTBOX_RETENTION_DAYS for debugging, then
+deleted by the nightly prune_outbox.
+"""
+import contextlib
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, Sum
+from django.db.transaction import TransactionManagementError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from app.common.db_router import use_primary
+from app.runs.models import RunLog
+from app.squads.models import Squad, SquadWeeklyTotal, WeeklyResultLog
+from app.common.utils import get_current_week_start, week_range
+from app.squads.rollups import apply_week_delta, membership_delta, membership_deltas
+from .corrections import apply_corrections, closed_week_members, closed_weeks
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# float noise below this is not drift worth an event
+KM_EPSILON = 1e-6
+
+def emit(topic, squad_id=None, user_id=None, **payload):
+    event = OutboxEvent.objects.create(topic=topic, squad_id=squad_id, user_id=user_id, payload=payload)
+    if settings.OUTBOX_DRAIN_ON_COMMIT:
+        transaction.on_commit(schedule_drain)
+    return event
+
+def emit_many(events):
+    """
+    events: iterable of (topic, squad_id, user_id, payload) in one INSERT.
+    """
+    rows = [
+        OutboxEvent(topic=topic, squad_id=squad_id, user_id=user_id, payload=payload)
+        for topic, squad_id, user_id, payload in events
+    ]
+    if rows:
+        OutboxEvent.objects.bulk_create(rows)
+        if settings.OUTBOX_DRAIN_ON_COMMIT:
+            transaction.on_commit(schedule_drain)
+    return rows
+
+def emit_run_deltas(topic, user_id, run_id, changes):
+    """
+    One event per squad the runner belongs to. changes is a list of
+    (timestamp, km, runs) contributions, bucketed into each squad's own
+    local week. Squads the runner has left still get the contributions
+    that fall in weeks they were scored in at closeout.
+    """
+    squads = dict(Squad.objects.filter(members=user_id).values_list("id", "timezone"))
+    days = [ts.date() for ts, _, _ in changes]
+    former = defaultdict(set)
+    timezones = {}
+    for squad_id, tz_name, week in (
+        WeeklyResultLog.objects.filter(
+            user_id=user_id,
+            week_start_date__gte=min(days) - timedelta(days=7),
+            week_start_date__lte=max(days) + timedelta(days=1),
+        ).exclude(squad_id__in=list(squads))
+        .values_list("squad_id", "squad__timezone", "week_start_date")
+    ):
+        former[squad_id].add(week)
+        timezones[squad_id] = tz_name
+
+    events = []
+    for squad_id, tz_name in {**timezones, **squads}.items():
+        deltas = [
+            [week.isoformat(), km, runs]
+            for week, km, runs in (
+                (get_current_week_start(tz_name, now=ts), km, runs) for ts, km, runs in changes
+            )
+            if squad_id in squads or week in former[squad_id]
+        ]
+        if deltas:
+            events.append((topic, squad_id, user_id, {"run_id": run_id, "deltas": deltas}))
+    return emit_many(events)
+
+def emit_membership(topic, squad, user_id, sign):
+    return emit(topic, squad_id=squad.id, user_id=user_id,
+                deltas=[membership_delta(user_id, squad.timezone, sign)])
+
+def emit_memberships(topic, squad, user_ids, sign):
+    deltas = membership_deltas(user_ids, squad.timezone, sign)
+    return emit_many(
+        (topic, squad.id, user_id, {"deltas": [deltas[user_id]]}) for user_id in user_ids
+    )
+
+def schedule_drain():
+    # best effort: if the broker is down the periodic drain picks it up
+    from .tasks import run_outbox_drain
+    try:
+        run_outbox_drain.apply_async(retry=False)
+    except Exception:
+        logger.warning("outbox: could not enqueue drain, leaving it to the periodic task")
+
+def is_run_event(event):
+    return event.topic.startswith("run.")
+
+def event_deltas(events):
+    """
+    {(squad_id, week_start_iso): [km, runs]} that events add up to.
+    """
+    contributions = [
+        (event, week, km, runs)
+        for event in events if event.squad_id is not None
+        for week, km, runs in event.payload.get("deltas", [])
+    ]
+    # run events target the runner's squads as of today; a closed week only
+    # takes runs from the members it was scored for at closeout
+    scored_for = closed_week_members(closed_weeks(
+        (event.squad_id, parse_date(week)) for event, week, _, _ in contributions if is_run_event(event)
+    ))
+    deltas = defaultdict(lambda: [0.0, 0])
+    for event, week, km, runs in contributions:
+        members = scored_for.get((event.squad_id, parse_date(week)))
+        if is_run_event(event) and members is not None and event.user_id not in members:
+            continue
+        acc = deltas[(event.squad_id, week)]
+        acc[0] += km
+        acc[1] += runs
+    return deltas
+
+def apply_events(events):
+    deltas = event_deltas(events)
+    # squads deleted since the event was written have nothing to update
+    live = set(Squad.objects.filter(id__in={sid for sid, _ in deltas}).values_list("id", flat=True))
+    touched = []
+    for (squad_id, week), (km, runs) in sorted(deltas.items()):
+        if squad_id in live and (km or runs):
+            week_start = parse_date(week)
+            apply_week_delta(squad_id, week_start, km, runs)
+            touched.append((squad_id, week_start))
+
+    # late arrivals into weeks closeout already scored: one re-score pass per batch
+    late = closed_weeks(touched)
+    if late:
+        apply_corrections(late)
+
+    # score this batch's new/edited runs; exclusions come back as run.excluded events
+    run_ids = [e.payload["run_id"] for e in events if e.topic in ("run.created", "run.updated")]
+    if run_ids:
+        # numpy: loaded by the drain, not by every view that emits events
+        from app.runs.anomaly import exclude_anomalous_runs
+        exclude_anomalous_runs(run_ids=run_ids)
+    return deltas
+
+def drain_outbox(batch_size=None):
+    """
+    Process one batch of pending events in id order. Returns the batch size.
+    Concurrent consumers skip each other's locked rows; deltas commute, so
+    batches may be applied in any order.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects
+            .select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by("id")[:batch_size]
+        )
+        if not events:
+            return 0
+        apply_events(events)
+        OutboxEvent.objects.filter(id__in=[e.id for e in events]).update(processed_at=timezone.now())
+    return len(events)
+
+@contextlib.contextmanager
+def consistent_snapshot():
+    """
+    A transaction whose reads all see the database as of one moment. On
+    Postgres that takes REPEATABLE READ, which has to be set before the
+    transaction's first query; SQLite transactions already read one snapshot.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    postgres = connection.vendor == "postgresql"
+    if postgres and connection.in_atomic_block:
+        raise TransactionManagementError("consistent_snapshot() must start its own transaction.")
+    with transaction.atomic():
+        if postgres:
+            with connection.cursor() as c:
+                c.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        yield
+
+@use_primary()
+def correct_squad_week(squad, week_start):
+    """
+    Bring one squad-week rollup back in line with RunLog without racing
+    writers or the consumer. Overwriting the rollup would count twice any
+    run whose event is still pending (and a run can commit at any moment),
+    so instead, from one snapshot: the runs, minus the rollup, minus every
+    delta still pending for the squad is the drift, and it is emitted as a
+    rollup.corrected event that the consumer applies like any other.
+    Returns the (km, runs) emitted.
+    """
+    week = week_start.isoformat()
+    with consistent_snapshot():
+        closed = closed_weeks([(squad.id, week_start)])
+        if closed:
+            # what the consumer counts for a closed week (see event_deltas)
+            user_ids = closed_week_members(closed)[(squad.id, week_start)]
+        else:
+            user_ids = squad.members.values_list("id", flat=True)
+        start_dt, end_dt = week_range(week_start, squad.timezone)
+        actual = RunLog.objects.filter(
+            user_id__in=user_ids, timestamp__gte=start_dt, timestamp__lt=end_dt, excluded=False,
+        ).aggregate(km=Sum("distance_km"), runs=Count("id"))
+        rollup = (
+            SquadWeeklyTotal.objects.filter(squad_id=squad.id, week_start_date=week_start)
+            .values_list("total_distance_km", "run_count").first()
+        ) or (0.0, 0)
+        pending = event_deltas(OutboxEvent.objects.filter(processed_at__isnull=True, squad_id=squad.id))
+        owed_km, owed_runs = pending.get((squad.id, week), (0.0, 0))
+        km = (actual["km"] or 0.0) - rollup[0] - owed_km
+        runs = actual["runs"] - rollup[1] - owed_runs
+        if abs(km) < KM_EPSILON:
+            km = 0.0
+        if km or runs:
+            emit("rollup.corrected", squad_id=squad.id, deltas=[[week, km, runs]])
+    return km, runs
+
+def drain_until_empty(batch_size=None, max_batches=None):
+    drained = batches = 0
+    while max_batches is None or batches < max_batches:
+        n = drain_outbox(batch_size)
+        if not n:
+            break
+        drained += n
+        batches += 1
+    return drained
+
+# rows per DELETE when pruning, so no single statement holds locks for long
+PRUNE_BATCH_SIZE = 5000
+
+def prune_outbox(now=None, batch_size=PRUNE_BATCH_SIZE):
+    """
+    Delete events processed more than OUTBOX_RETENTION_DAYS ago, oldest
+    first in short batches. Pending events are never touched. Returns the
+    number deleted.
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+    deleted = 0
+    while True:
+        # old processed events sit at the low end of the id index
+        ids = list(
+            OutboxEvent.objects.filter(processed_at__lt=cutoff)
+            .order_by("id").values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        n, _ = OutboxEvent.objects.filter(id__in=ids).delete()
+        deleted += n
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+def outbox_lag():
+    """
+    How far the consumer is behind: pending events and the age of the oldest.
+    """
+    pending = OutboxEvent.objects.filter(processed_at__isnull=True)
+    oldest = pending.order_by("id").values_list("created_at", flat=True).first()
+    return {
+        "pending": pending.count(),
+        "oldest_pending_age_seconds": (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+    }
@@ -0,0 +1,101 @@
+"""
+Standard reports, computed from the analytics snapshot only
+(app.tasks.snapshot), never from the live database.
+
+Weeks here are UTC Monday weeks for runs, and each squad's own
+week_start_date for goals and results; every report covers the `weeks`
+most recent weeks present in the snapshot.
+"""
+from datetime import timedelta
+import numpy as np
+from .snapshot import EPOCH, Snapshot
+
+SECONDS_PER_DAY = 86400
+# 1970-01-01 was a Thursday: shift so weeks start on Monday
+MONDAY_OFFSET = 3
+DISTANCE_BUCKETS_KM = (0, 3, 5, 8, 10, 15, 21.1, 30, 42.2)
+
+def week_label(day):
+    return (EPOCH + timedelta(days=int(day))).isoformat()
+
+def run_weeks(ts):
+    days = ts // SECONDS_PER_DAY
+    return days - (days + MONDAY_OFFSET) % 7
+
+def recent(weeks_column, weeks):
+    """
+    Mask of rows in the `weeks` most recent distinct weeks, and those weeks.
+    """
+    present = np.unique(weeks_column)[-weeks:]
+    return np.isin(weeks_column, present), present
+
+def weekly_active_runners(snapshot=None, weeks=12):
+    """
+    [(week, distinct runners, runs, km)] for counted (not excluded) runs.
+    """
+    runs = (snapshot or Snapshot()).load("runs")
+    counted = ~runs["excluded"]
+    week = run_weeks(runs["ts"][counted])
+    users, km = runs["user_id"][counted], runs["distance_km"][counted]
+    mask, present = recent(week, weeks)
+    week, users, km = week[mask], users[mask], km[mask]
+    rows = []
+    for w in present:
+        this = week == w
+        rows.append((week_label(w), int(np.unique(users[this]).size), int(this.sum()), float(km[this].sum())))
+    return rows
+
+def goal_hit_rates(snapshot=None, weeks=12):
+    """
+    [(week, closed-out goals, achieved share, median target km)].
+    """
+    goals = (snapshot or Snapshot()).load("goals")
+    closed = goals["closed_out"]
+    week, achieved, target = goals["week"][closed], goals["achieved"][closed], goals["target_km"][closed]
+    mask, present = recent(week, weeks)
+    rows = []
+    for w in present:
+        this = mask & (week == w)
+        n = int(this.sum())
+        rows.append((week_label(w), n, float(achieved[this].mean()) if n else 0.0,
+                     float(np.median(target[this])) if n else 0.0))
+    return rows
+
+def distance_distribution(snapshot=None, weeks=4):
+    """
+    (percentiles {p: km}, [(bucket label, runs)]) over the recent weeks'
+    counted runs.
+    """
+    runs = (snapshot or Snapshot()).load("runs")
+    counted = ~runs["excluded"]
+    km = runs["distance_km"][counted]
+    mask, _ = recent(run_weeks(runs["ts"][counted]), weeks)
+    km = km[mask]
+    percentiles = {p: float(np.percentile(km, p)) if km.size else 0.0 for p in (10, 25, 50, 75, 90, 99)}
+    edges = np.array(DISTANCE_BUCKETS_KM + (np.inf,))
+    counts, _ = np.histogram(km, bins=edges)
+    labels = [f"{lo:g}-{hi:g}" if np.isfinite(hi) else f"{lo:g}+" for lo, hi in zip(edges[:-1], edges[1:])]
+    return percentiles, list(zip(labels, counts.tolist()))
+
+def member_points(snapshot=None, weeks=12):
+    """
+    [(week, members scored, total points, share of members who gained)]
+    from the per-member closeout results.
+    """
+    results = (snapshot or Snapshot()).load("results")
+    mask, present = recent(results["week"], weeks)
+    rows = []
+    for w in present:
+        this = mask & (results["week"] == w)
+        points = results["points"][this]
+        rows.append((week_label(w), int(points.size), int(points.sum()),
+                     float((points > 0).mean()) if points.size else 0.0))
+    return rows
+
+def squad_sizes(snapshot=None):
+    """
+    {p: members} percentiles of squad size, and the number of squads.
+    """
+    members = (snapshot or Snapshot()).load("members")
+    _, sizes = np.unique(members["squad_id"], return_counts=True)
+    return {p: float(np.percentile(sizes, p)) if sizes.size else 0.0 for p in (50, 90, 99, 100)}, int(sizes.size)
@@ -0,0 +1,239 @@
+"""
+What-if replay of weekly closeouts, without writing anything.
+
+load_history() reads a window of SquadWeeklyGoal rows into (squads x
+weeks) arrays, from the analytics snapshot's goals table when one is
+given (app.tasks.snapshot, already numpy columns) or else in one raw
+query whose columns are all numbers, so a million rows go straight into
+an array with no model or date conversions per row. A goal's total_distance_km is the squad's
+SquadWeeklyTotal rollup mirrored onto it, then frozen at closeout and
+re-scored by corrections, so it is exactly the distance closeout scored.
+replay() then scores every squad-week with a vectorized scoring function
+and walks the weeks once to carry streaks, the same way closeout_week
+does: a week without a goal is skipped, an achieved week extends the
+streak, a missed one resets it.
+
+A scoring function takes (target, prev_target, progress) arrays and
+returns (points, achieved) arrays of the same shape; linear_scoring()
+builds ones shaped like compute_week_points with other constants.
+
+Streaks are squad-level and start at 0 at the beginning of the window.
+Membership is not modelled, so they are not member streaks: anyone who
+joined mid-window has a shorter one in SquadMemberStats.
+"""
+from datetime import timedelta
+import numpy as np
+from django.db import connections, router
+from django.utils import timezone
+from app.squads.models import SquadWeeklyGoal
+from .closeout import BASE_POINTS, HELD_GOAL_BONUS, MISSED_GOAL_POINTS, RAISED_GOAL_BONUS
+from .snapshot import day_number
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# squad_id, week (days since 1970-01-01, as in the snapshot), target km,
+# km, closed_out, points: numbers only
+HISTORY_SQL = """
+SELECT squad_id, {week}, target_distance_km, total_distance_km,
+       CASE WHEN closed_out THEN 1 ELSE 0 END, points_awarded_each_member
+FROM squads_squadweeklygoal
+WHERE week_start_date >= %s AND week_start_date <= %s {squads}
+"""
+DAY_NUMBER_SQL = {
+    "postgresql": "week_start_date - DATE '1970-01-01'",
+    "sqlite": "CAST(julianday(week_start_date) - 2440587.5 AS INTEGER)",
+}
+FETCH_ROWS = 50_000
+
+def linear_scoring(base=BASE_POINTS, raised_bonus=RAISED_GOAL_BONUS,
+                   held_bonus=HELD_GOAL_BONUS, missed=MISSED_GOAL_POINTS):
+    """
+    compute_week_points() over arrays, with its constants swappable.
+    """
+    def score(target, prev_target, progress):
+        achieved = progress >= target
+        points = np.where(
+            achieved,
+            base + np.where(target > prev_target, raised_bonus, held_bonus),
+            missed,
+        )
+        return points, achieved
+    return score
+
+current_scoring = linear_scoring()
+
+class WeekHistory:
+    """
+    Per-squad, per-week arrays, squads along axis 0 and weeks (oldest
+    first) along axis 1. target is NaN where the squad set no goal;
+    recorded holds the points closeout actually awarded (NaN where the
+    week is not closed out).
+    """
+    def __init__(self, squad_ids, weeks, target, prev_target, progress, recorded):
+        self.squad_ids = squad_ids
+        self.weeks = weeks
+        self.target = target
+        self.prev_target = prev_target
+        self.progress = progress
+        self.recorded = recorded
+
+    @property
+    def has_goal(self):
+        return ~np.isnan(self.target)
+
+    @classmethod
+    def from_arrays(cls, squad_ids, weeks, target, progress, recorded=None, prev_target=None):
+        """
+        prev_target defaults to target shifted one week (0 for the first
+        week and after weeks without a goal, as in closeout_week).
+        """
+        target = np.asarray(target, dtype=np.float64)
+        if prev_target is None:
+            prev_target = np.zeros_like(target)
+            prev_target[:, 1:] = target[:, :-1]
+        prev_target = np.nan_to_num(prev_target, nan=0.0)
+        if recorded is None:
+            recorded = np.full(target.shape, np.nan)
+        return cls(np.asarray(squad_ids), list(weeks), target, prev_target,
+                   np.asarray(progress, dtype=np.float64), recorded)
+
+def last_closed_week(today=None):
+    # the Monday of the last full week everywhere
+    today = today or timezone.now().date()
+    return today - timedelta(days=today.weekday() + 7)
+
+def load_history(weeks, end=None, squad_ids=None, snapshot=None):
+    """
+    The `weeks` weeks ending with the week starting `end` (default: the
+    last full week), for every squad that set a goal in them. Weeks that
+    are not closed out yet are scored on their distance so far. With a
+    Snapshot, reads its goals table instead of the database.
+    """
+    end = end or last_closed_week()
+    # one extra week in front for the first week's previous target
+    first = end - timedelta(days=7 * weeks)
+    week_list = [first + timedelta(days=7 * i) for i in range(weeks + 1)]
+    if snapshot is not None:
+        columns = _snapshot_columns(snapshot, first, end, squad_ids)
+    else:
+        columns = _db_columns(first, end, squad_ids)
+    squad_col, week_col, target_col, km_col, closed, awarded = columns
+    if not squad_col.size:
+        empty = np.zeros((0, weeks))
+        return WeekHistory.from_arrays(np.zeros(0, dtype=np.int64), week_list[1:], empty, empty)
+
+    squads = np.unique(squad_col)
+    shape = (squads.size, weeks + 1)
+    at = np.searchsorted(squads, squad_col)
+    cols = (week_col - day_number(first)) // 7
+
+    target = np.full(shape, np.nan)
+    target[at, cols] = target_col
+    progress = np.zeros(shape)
+    progress[at, cols] = km_col
+    recorded = np.full(shape, np.nan)
+    recorded[at[closed], cols[closed]] = awarded[closed]
+
+    prev_target = np.nan_to_num(target[:, :-1], nan=0.0)
+    return WeekHistory(squads, week_list[1:], target[:, 1:], prev_target, progress[:, 1:], recorded[:, 1:])
+
+def _snapshot_columns(snapshot, first, end, squad_ids):
+    goals = snapshot.load("goals")
+    keep = (goals["week"] >= day_number(first)) & (goals["week"] <= day_number(end))
+    if squad_ids is not None:
+        keep &= np.isin(goals["squad_id"], list(squad_ids))
+    return (goals["squad_id"][keep], goals["week"][keep].astype(np.int64), goals["target_km"][keep],
+            goals["total_km"][keep], goals["closed_out"][keep], goals["points"][keep])
+
+def _db_columns(first, end, squad_ids):
+    connection = connections[router.db_for_read(SquadWeeklyGoal)]
+    params = [first, end]
+    squads = ""
+    if squad_ids is not None:
+        squad_ids = list(squad_ids) or [0]
+        squads = "AND squad_id IN ({})".format(", ".join(["%s"] * len(squad_ids)))
+        params.extend(squad_ids)
+    sql = HISTORY_SQL.format(week=DAY_NUMBER_SQL[connection.vendor], squads=squads)
+    chunks = [np.zeros((0, 6))]
+    with connection.cursor() as c:
+        c.execute(sql, params)
+        while rows := c.fetchmany(FETCH_ROWS):
+            chunks.append(np.array(rows, dtype=np.float64))
+    data = np.concatenate(chunks)
+    return (data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2],
+            data[:, 3], data[:, 4].astype(bool), data[:, 5])
+
+class Replay:
+    def __init__(self, history, points, achieved, current_streak, longest_streak):
+        self.history = history
+        self.points = points
+        self.achieved = achieved
+        self.current_streak = current_streak
+        self.longest_streak = longest_streak
+
+    @property
+    def total_points(self):
+        return self.points.sum(axis=1)
+
+def replay(history, scoring=current_scoring):
+    """
+    Score every squad-week of history under `scoring` and carry streaks.
+    Nothing is written.
+    """
+    has_goal = history.has_goal
+    with np.errstate(invalid="ignore"):
+        points, achieved = scoring(history.target, history.prev_target, history.progress)
+    points = np.where(has_goal, points, 0).astype(np.int64)
+    achieved = achieved & has_goal
+
+    current = np.zeros(history.target.shape[0], dtype=np.int64)
+    longest = np.zeros_like(current)
+    for week in range(history.target.shape[1]):
+        current = np.where(has_goal[:, week], np.where(achieved[:, week], current + 1, 0), current)
+        np.maximum(longest, current, out=longest)
+    return Replay(history, points, achieved, current, longest)
+
+def summarize(result):
+    """
+    Point and streak distributions across squads, for reporting.
+    """
+    has_goal = result.history.has_goal
+    scored = int(has_goal.sum())
+    total = result.total_points
+    summary = {
+        "squads": int(total.size),
+        "squad_weeks": scored,
+        "hit_rate": float(result.achieved.sum() / scored) if scored else 0.0,
+        "points_mean": float(total.mean()) if total.size else 0.0,
+        "longest_streak_max": int(result.longest_streak.max()) if total.size else 0,
+    }
+    for pct in PERCENTILES:
+        summary[f"points_p{pct}"] = float(np.percentile(total, pct)) if total.size else 0.0
+    for pct in (50, 95):
+        summary[f"longest_streak_p{pct}"] = (
+            float(np.percentile(result.longest_streak, pct)) if total.size else 0.0
+        )
+    return summary
+
+def recorded_summary(history):
+    """
+    The same point distribution for what closeout actually awarded, and
+    how many closed-out weeks there are to compare against.
+    """
+    recorded = history.recorded
+    closed = ~np.isnan(recorded)
+    total = np.where(closed, recorded, 0).sum(axis=1)
+    summary = {"closed_weeks": int(closed.sum()),
+               "points_mean": float(total.mean()) if total.size else 0.0}
+    for pct in PERCENTILES:
+        summary[f"points_p{pct}"] = float(np.percentile(total, pct)) if total.size else 0.0
+    return summary
+
+def mismatches(result):
+    """
+    Closed-out weeks where the replayed points differ from the recorded
+    ones (a late correction, or scoring that differs from closeout's).
+    """
+    recorded = result.history.recorded
+    closed = ~np.isnan(recorded)
+    return int((closed & (result.points != np.nan_to_num(recorded))).sum())
@@ -0,0 +1,312 @@
+"""
+Nightly columnar snapshot of the reporting tables, so reports never touch
+the OLTP database.
+
+Tables (columns as numpy arrays, one compressed .npz per segment):
+
+    runs     RunLog: id, user_id, ts (unix seconds), distance_km,
+             duration_minutes, excluded                 group: id
+    goals    SquadWeeklyGoal: id, squad_id, week (days since 1970-01-01),
+             target_km, total_km, achieved, closed_out, points   group: id
+    results  WeeklyResultLog: user_id, squad_id, week, points
+                                                 group: (squad_id, week)
+    members  squad membership: squad_id, user_id    group: squad_id
+
+Each night appends one segment per table holding the current rows of
+every group that changed, plus the list of groups it replaces; a group in
+a newer segment supersedes that group in all older ones, so a replaced
+group with no rows is a delete. Reads merge the segments newest first;
+once a table has ANALYTICS_SNAPSHOT_MAX_SEGMENTS of them it is compacted
+into one.
+
+The watermark is the sync change log's seq (app.sync.changes): every
+write path already records its runs, goals and squads there in commit
+order. A goal change (closeout, corrections) also refreshes that week's
+results, a squad change its member list. With no snapshot yet, or one
+older than the change log keeps, the snapshot is rebuilt in full.
+
+Writes that bypass those paths never reach the change log: shell or raw
+SQL fixes, cascades from deleting a user, admin edits of goals and
+results. So a full rebuild also runs every ANALYTICS_SNAPSHOT_FULL_DAYS
+(manifest "full_at"), bounding how long such drift can last. The
+manifest is replaced last, so a crash leaves the previous snapshot
+intact and the next run redoes the work.
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from app.runs.models import RunLog
+from app.squads.membership import Membership
+from app.squads.models import SquadWeeklyGoal, WeeklyResultLog
+from app.sync.changes import GOAL, RUN, SQUAD, stamp_until_empty
+from app.sync.models import ChangeLogEntry, ChangeSequence
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+LOCK_KEY = "analytics-snapshot-lock"
+EPOCH = date(1970, 1, 1)
+# results are grouped by squad and week packed into one int64
+WEEK_BITS = 20
+# ids per IN (...) when extracting changed rows
+EXTRACT_CHUNK = 1000
+
+TABLES = {
+    "runs": (
+        ("id", np.int64), ("user_id", np.int64), ("ts", np.int64),
+        ("distance_km", np.float64), ("duration_minutes", np.float64), ("excluded", bool),
+    ),
+    "goals": (
+        ("id", np.int64), ("squad_id", np.int64), ("week", np.int32), ("target_km", np.float64),
+        ("total_km", np.float64), ("achieved", bool), ("closed_out", bool), ("points", np.int32),
+    ),
+    "results": (
+        ("user_id", np.int64), ("squad_id", np.int64), ("week", np.int32), ("points", np.int32),
+    ),
+    "members": (
+        ("squad_id", np.int64), ("user_id", np.int64),
+    ),
+}
+
+def day_number(d):
+    return (d - EPOCH).days
+
+def result_groups(squad_ids, weeks):
+    return (np.asarray(squad_ids, dtype=np.int64) << WEEK_BITS) | np.asarray(weeks, dtype=np.int64)
+
+def group_keys(name, columns):
+    if name in ("runs", "goals"):
+        return columns["id"]
+    if name == "results":
+        return result_groups(columns["squad_id"], columns["week"])
+    return columns["squad_id"]
+
+def to_columns(name, rows):
+    spec = TABLES[name]
+    if not rows:
+        return {col: np.zeros(0, dtype=dtype) for col, dtype in spec}
+    return {col: np.array(values, dtype=dtype) for (col, dtype), values in zip(spec, zip(*rows))}
+
+def chunks(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), EXTRACT_CHUNK):
+        yield ids[start:start + EXTRACT_CHUNK]
+
+# extraction: ids=None means every row
+
+def extract_runs(ids=None):
+    fields = ("id", "user_id", "timestamp", "distance_km", "duration_minutes", "excluded")
+    batches = [RunLog.objects.all()] if ids is None else (RunLog.objects.filter(id__in=c) for c in chunks(ids))
+    rows = []
+    for qs in batches:
+        rows.extend(
+            (i, u, int(ts.timestamp()), km, minutes, ex)
+            for i, u, ts, km, minutes, ex in qs.order_by().values_list(*fields).iterator(chunk_size=5000)
+        )
+    return to_columns("runs", rows)
+
+def extract_goals(ids=None):
+    fields = ("id", "squad_id", "week_start_date", "target_distance_km", "total_distance_km",
+              "achieved", "closed_out", "points_awarded_each_member")
+    qs_all = SquadWeeklyGoal.objects.all()
+    batches = [qs_all] if ids is None else (qs_all.filter(id__in=c) for c in chunks(ids))
+    rows = []
+    for qs in batches:
+        rows.extend(
+            (i, s, day_number(w), *rest)
+            for i, s, w, *rest in qs.order_by().values_list(*fields).iterator(chunk_size=5000)
+        )
+    return to_columns("goals", rows)
+
+def extract_results(squad_weeks=None):
+    qs_all = WeeklyResultLog.objects.all()
+    if squad_weeks is None:
+        batches = [qs_all]
+    else:
+        by_week = {}
+        for squad_id, week in squad_weeks:
+            by_week.setdefault(week, []).append(squad_id)
+        batches = (
+            qs_all.filter(week_start_date=EPOCH + timedelta(days=week), squad_id__in=c)
+            for week, squad_ids in by_week.items() for c in chunks(squad_ids)
+        )
+    rows = []
+    for qs in batches:
+        rows.extend(
+            (u, s, day_number(w), p)
+            for u, s, w, p in qs.order_by().values_list(
+                "user_id", "squad_id", "week_start_date", "points_change",
+            ).iterator(chunk_size=5000)
+        )
+    return to_columns("results", rows)
+
+def extract_members(squad_ids=None):
+    qs_all = Membership.objects.all()
+    batches = [qs_all] if squad_ids is None else (qs_all.filter(squad_id__in=c) for c in chunks(squad_ids))
+    rows = []
+    for qs in batches:
+        rows.extend(qs.order_by().values_list("squad_id", "user_id").iterator(chunk_size=5000))
+    return to_columns("members", rows)
+
+class Snapshot:
+    """
+    The snapshot directory: a manifest plus segment files per table.
+    """
+    def __init__(self, root=None):
+        self.root = Path(root or settings.ANALYTICS_SNAPSHOT_DIR)
+        self.manifest = self.read_manifest()
+
+    def read_manifest(self):
+        try:
+            with open(self.root / MANIFEST) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def segments(self, name):
+        return self.manifest["tables"][name] if self.manifest else []
+
+    def load(self, name):
+        """
+        The merged table: {column: array}.
+        """
+        segments = self.segments(name)
+        parts, superseded = [], np.zeros(0, dtype=np.int64)
+        for segment in reversed(segments):
+            with np.load(self.root / name / segment) as data:
+                columns = {col: data[col] for col, _ in TABLES[name]}
+                replaces = data["replaces"]
+            keep = ~np.isin(group_keys(name, columns), superseded)
+            parts.append({col: values[keep] for col, values in columns.items()})
+            superseded = np.union1d(superseded, replaces)
+        if not parts:
+            return to_columns(name, [])
+        parts.reverse()
+        return {col: np.concatenate([p[col] for p in parts]) for col, _ in TABLES[name]}
+
+    def write_segment(self, name, columns, replaces):
+        (self.root / name).mkdir(parents=True, exist_ok=True)
+        segment = f"{timezone.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.npz"
+        tmp = self.root / name / f".{segment}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, replaces=np.asarray(replaces, dtype=np.int64), **columns)
+        os.replace(tmp, self.root / name / segment)
+        return segment
+
+    def commit(self, manifest):
+        """
+        Swap in the new manifest, then delete segments it no longer lists.
+        """
+        tmp = self.root / f".{MANIFEST}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, self.root / MANIFEST)
+        self.manifest = manifest
+        for name in TABLES:
+            live = set(manifest["tables"][name])
+            for path in (self.root / name).glob("*.npz"):
+                if path.name not in live:
+                    path.unlink()
+
+def pending_changes(after_seq, head_seq):
+    """
+    Ids changed in (after_seq, head_seq] per entity, and the deleted squads.
+    """
+    changed = {RUN: set(), GOAL: set(), SQUAD: set()}
+    deleted_squads = set()
+    entries = ChangeLogEntry.objects.filter(
+        seq__gt=after_seq, seq__lte=head_seq, entity__in=list(changed),
+    ).values_list("entity", "entity_id", "deleted").iterator(chunk_size=5000)
+    for entity, entity_id, deleted in entries:
+        changed[entity].add(entity_id)
+        if entity == SQUAD and deleted:
+            deleted_squads.add(entity_id)
+    return changed, deleted_squads
+
+def needs_full_rebuild(manifest, now):
+    if manifest is None or "full_at" not in manifest:
+        return True
+    taken_at = datetime.fromisoformat(manifest["taken_at"])
+    # a day of slack before pruning could have removed entries we need
+    if now - taken_at > timedelta(days=settings.SYNC_RETENTION_DAYS - 1):
+        return True
+    every = settings.ANALYTICS_SNAPSHOT_FULL_DAYS
+    return bool(every) and now - datetime.fromisoformat(manifest["full_at"]) >= timedelta(days=every)
+
+def take_snapshot(full=False, root=None, now=None):
+    """
+    Bring the snapshot up to the current head of the change log. Returns
+    {table: rows written} plus "mode" ("full" or "delta") and "seq".
+    """
+    now = now or timezone.now()
+    if not cache.add(LOCK_KEY, 1, timeout=3600):
+        logger.info("snapshot: another run holds the lock")
+        return None
+    try:
+        return _take_snapshot(full, root, now)
+    finally:
+        cache.delete(LOCK_KEY)
+
+def _take_snapshot(full, root, now):
+    t0 = time.perf_counter()
+    stamp_until_empty()
+    head = ChangeSequence.objects.filter(pk=1).values_list("last_seq", flat=True).first() or 0
+    snapshot = Snapshot(root)
+    full = full or needs_full_rebuild(snapshot.manifest, now)
+    snapshot_full_at = None if full else snapshot.manifest["full_at"]
+    tables = {name: list(snapshot.segments(name)) for name in TABLES}
+    written = {}
+
+    if full:
+        extracted = {
+            "runs": extract_runs(), "goals": extract_goals(),
+            "results": extract_results(), "members": extract_members(),
+        }
+        for name, columns in extracted.items():
+            tables[name] = [snapshot.write_segment(name, columns, [])]
+            written[name] = len(next(iter(columns.values())))
+    else:
+        changed, deleted_squads = pending_changes(snapshot.manifest["seq"], head)
+        goals = extract_goals(changed[GOAL])
+        # a closeout or correction rewrites that squad-week's results
+        squad_weeks = sorted(set(zip(goals["squad_id"].tolist(), goals["week"].tolist())))
+        results = extract_results(squad_weeks)
+        goal_replaces = set(changed[GOAL])
+        result_replaces = set(result_groups([s for s, _ in squad_weeks], [w for _, w in squad_weeks]).tolist())
+        if deleted_squads:
+            # their goals and results went with them (cascade)
+            dropped = np.asarray(sorted(deleted_squads), dtype=np.int64)
+            old = snapshot.load("goals")
+            goal_replaces.update(old["id"][np.isin(old["squad_id"], dropped)].tolist())
+            old = snapshot.load("results")
+            gone = np.isin(old["squad_id"], dropped)
+            result_replaces.update(result_groups(old["squad_id"][gone], old["week"][gone]).tolist())
+        deltas = {
+            "runs": (extract_runs(changed[RUN]), changed[RUN]),
+            "goals": (goals, goal_replaces),
+            "results": (results, result_replaces),
+            "members": (extract_members(changed[SQUAD]), changed[SQUAD]),
+        }
+        for name, (columns, replaces) in deltas.items():
+            written[name] = len(next(iter(columns.values())))
+            if replaces:
+                tables[name].append(snapshot.write_segment(name, columns, sorted(replaces)))
+
+    snapshot.manifest = {"tables": tables}
+    for name in TABLES:
+        if len(tables[name]) > settings.ANALYTICS_SNAPSHOT_MAX_SEGMENTS:
+            tables[name] = [snapshot.write_segment(name, snapshot.load(name), [])]
+    full_at = now.isoformat() if full else snapshot_full_at
+    snapshot.commit({"seq": head, "taken_at": now.isoformat(), "full_at": full_at, "tables": tables})
+    written.update(mode="full" if full else "delta", seq=head)
+    logger.info("snapshot: %s up to seq %s in %.1fs: %s", written["mode"], head, time.perf_counter() - t0,
+                {name: written[name] for name in TABLES})
+    return written
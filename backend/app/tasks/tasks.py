@@ -1,6 +1,53 @@
+import logging
 from celery import shared_task
-from .closeout import closeout_week
+# the project app (with its broker settings) must exist before a task is sent
+import backend.celery_app  # noqa: F401
+from .closeout import closeout_week, closeout_timezone_bucket
+from app.squads.archive import archive_expired_messages
+from app.squads.points import compact_point_shards
+from app.sync.changes import prune_changes, stamp_until_empty
+from .outbox import drain_until_empty, outbox_lag, prune_outbox
+
+logger = logging.getLogger(__name__)
 
 @shared_task
 def run_weekly_closeout():
     closeout_week()
+
+@shared_task
+def run_bucketed_closeout():
+    return closeout_timezone_bucket()
+
+@shared_task
+def run_message_archival():
+    return archive_expired_messages()
+
+@shared_task(ignore_result=True)
+def run_outbox_drain():
+    drained = drain_until_empty(max_batches=20)
+    lag = outbox_lag()
+    logger.info("outbox: drained %s events, %s pending, oldest %.1fs",
+                drained, lag["pending"], lag["oldest_pending_age_seconds"])
+    return drained
+
+@shared_task
+def run_outbox_prune():
+    return prune_outbox()
+
+@shared_task(ignore_result=True)
+def run_points_compaction():
+    return compact_point_shards()
+
+@shared_task(ignore_result=True)
+def run_change_stamp():
+    return stamp_until_empty()
+
+@shared_task
+def run_change_prune():
+    return prune_changes()
+
+@shared_task
+def run_analytics_snapshot():
+    # imported here: numpy stays out of the web processes that import this module
+    from .snapshot import take_snapshot
+    return take_snapshot()
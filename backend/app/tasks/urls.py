@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import DebugCloseoutView
+from .views import DebugCloseoutView, OutboxLagView
 
 urlpatterns = [
     path("closeout-week/", DebugCloseoutView.as_view(), name="debug_closeout"),
+    path("outbox/", OutboxLagView.as_view(), name="debug_outbox"),
 ]
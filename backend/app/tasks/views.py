@@ -1,6 +1,7 @@
 from rest_framework import permissions, response
 from rest_framework.views import APIView
 from .closeout import closeout_week
+from .outbox import outbox_lag
 
 class DebugCloseoutView(APIView):
     """
@@ -31,3 +32,13 @@ class DebugCloseoutView(APIView):
                 "status": "error",
                 "message": str(e)
             }, status=500)
+
+
+class OutboxLagView(APIView):
+    """
+    Outbox consumer lag: pending events and age of the oldest one (staff only).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return response.Response(outbox_lag())
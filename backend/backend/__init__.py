@@ -1,3 +1,11 @@
-from .celery_app import app as celery_app
+# The Celery app loads on first use instead of with this package: celery
+# and kombu are a large share of a cold start, and a web process only
+# needs them to enqueue a task (app.tasks.tasks imports the app). Workers
+# and beat name it directly: celery -A backend.celery_app.
+def __getattr__(name):
+    if name == "celery_app":
+        from .celery_app import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = ("celery_app",)
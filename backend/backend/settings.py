@@ -17,6 +17,11 @@ if os.environ.get("VERCEL_ENV"):
         ".now.sh",
     ])
 
+# Serverless profile: API serving only, for lambda cold starts (applied
+# below REST_FRAMEWORK). On by default on Vercel; build.sh runs migrate
+# and collectstatic with SERVERLESS=0 so the full app set is migrated.
+SERVERLESS = os.environ.get("SERVERLESS", "1" if os.environ.get("VERCEL_ENV") else "0") == "1"
+
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
@@ -37,6 +42,7 @@ INSTALLED_APPS = [
     "app.leaderboard",
     "app.tasks",
     "app.shop",
+    "app.sync",
 ]
 
 AUTH_USER_MODEL = "authapp.User"
@@ -45,6 +51,7 @@ MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
 
     "django.middleware.security.SecurityMiddleware",
+    "app.common.middleware.CompressionMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -52,6 +59,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "app.common.db_router.ReplicaRoutingMiddleware",
 ]
 
 CORS_ALLOWED_ORIGINS = os.environ.get("CORS_ORIGIN", "http://localhost:5173").split(",")
@@ -83,6 +91,9 @@ TEMPLATES = [
 WSGI_APPLICATION = "backend.wsgi.application"
 ASGI_APPLICATION = "backend.asgi.application"
 
+# Serve the hot read endpoints from async views; enable when running under ASGI
+ASYNC_READ_VIEWS = os.environ.get("ASYNC_READ_VIEWS", "0") == "1"
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -102,6 +113,45 @@ if os.environ.get("DATABASE_URL"):
         conn_health_checks=True,
     )
 
+# Optional read replica: safe requests read from it (see app.common.db_router).
+# Locally any second database works, e.g.
+#   DATABASE_URL=sqlite:///primary.sqlite3 DATABASE_REPLICA_URL=sqlite:///replica.sqlite3 \
+#   REDIS_URL=redis://localhost:6379/0
+if os.environ.get("DATABASE_REPLICA_URL"):
+    DATABASES["replica"] = dj_database_url.parse(
+        os.environ["DATABASE_REPLICA_URL"],
+        conn_max_age=600,
+        conn_health_checks=True,
+    )
+elif os.environ.get("POSTGRES_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": os.environ["POSTGRES_REPLICA_HOST"],
+        "PORT": os.environ.get("POSTGRES_REPLICA_PORT", DATABASES["default"].get("PORT", "5432")),
+    }
+if "replica" in DATABASES:
+    # tests run against a single database
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+
+DATABASE_ROUTERS = ["app.common.db_router.PrimaryReplicaRouter"]
+
+# After a write, keep that session's reads on the primary for this long
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", "5"))
+
+# Shared cache (replica pinning, throttles, response cache); Redis when available
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+elif "replica" in DATABASES:
+    # a write pins the user in the cache; with the per-process default
+    # cache, the next request served by another worker reads the replica
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured("A read replica needs REDIS_URL: primary pinning must be shared across workers.")
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.MinimumLengthValidator",
@@ -173,7 +223,81 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "app.common.renderers.ORJSONRenderer",
+        # Accept: application/msgpack[; layout=columns] (JSON also takes layout=columns)
+        "app.common.renderers.MessagePackRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "app.common.renderers.ORJSONParser",
+        "app.common.renderers.MessagePackParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+    "DEFAULT_THROTTLE_CLASSES": [
+        "app.common.throttling.TokenBucketThrottle",
+    ],
+}
+
+if SERVERLESS:
+    # admin (and its autodiscovery of every admin.py), sessions, messages
+    # and celery beat's models are not needed to answer JWT API calls,
+    # nor is the browsable API with its templates
+    SERVERLESS_DROPPED_APPS = {
+        "django.contrib.admin",
+        "django.contrib.sessions",
+        "django.contrib.messages",
+        "rest_framework.authtoken",
+        "django_celery_beat",
+    }
+    INSTALLED_APPS = [a for a in INSTALLED_APPS if a not in SERVERLESS_DROPPED_APPS]
+    MIDDLEWARE = [
+        m for m in MIDDLEWARE
+        if m not in (
+            "django.contrib.sessions.middleware.SessionMiddleware",
+            "django.contrib.auth.middleware.AuthenticationMiddleware",
+            "django.contrib.messages.middleware.MessageMiddleware",
+        )
+    ]
+    TEMPLATES[0]["OPTIONS"]["context_processors"] = [
+        p for p in TEMPLATES[0]["OPTIONS"]["context_processors"] if "messages" not in p
+    ]
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = [
+        r for r in REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] if "BrowsableAPIRenderer" not in r
+    ]
+
+# Token buckets (app.common.throttling): scope -> (refill per second, burst).
+# "user" applies to every request; views add their own with throttle_scope.
+# THROTTLE_ENABLED=0 turns them off (load benchmarks).
+THROTTLE_ENABLED = os.environ.get("THROTTLE_ENABLED", "1") == "1"
+THROTTLE_BUCKETS = {
+    "user": (10.0, 60),
+    "squad_goal": (1.0, 10),
+    "leaderboard": (1.0, 10),
+    "autocomplete": (5.0, 20),
 }
+# per-process buckets kept without Redis; least recently used go first
+THROTTLE_LOCAL_BUCKETS = 10_000
+
+# Single-flight caching of hot reads (app.common.singleflight)
+SINGLE_FLIGHT_WAIT_SECONDS = 5
+LEADERBOARD_CACHE_SECONDS = 10
+
+# Tag-invalidated squad detail/goal payloads (app.common.response_cache):
+# shared-cache TTL, how long a process trusts its memoised tag versions
+# (the most another process's invalidation can lag), local LRU entries,
+# and how many lookups between metric flushes to the shared cache
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_SECONDS = int(os.environ.get("RESPONSE_CACHE_SECONDS", "300"))
+RESPONSE_CACHE_LOCAL_SECONDS = float(os.environ.get("RESPONSE_CACHE_LOCAL_SECONDS", "1"))
+RESPONSE_CACHE_LOCAL_SIZE = 1024
+RESPONSE_CACHE_METRICS_EVERY = 100
+
+# API response compression (app.common.middleware.CompressionMiddleware)
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+RESPONSE_COMPRESSION_GZIP_LEVEL = 6
+RESPONSE_COMPRESSION_BROTLI_QUALITY = 4
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
@@ -190,3 +314,64 @@ CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 
 # Celery Beat (periodic tasks live in DB via django_celery_beat)
+
+# Chat retention: messages older than this many days are moved into
+# SquadMessageArchive by the nightly archival job (per-squad override on
+# Squad). 0 keeps chat in the hot table forever, so archival is opt-in.
+SQUAD_MESSAGE_RETENTION_DAYS = int(os.environ.get("SQUAD_MESSAGE_RETENTION_DAYS", "0"))
+SQUAD_MESSAGE_ARCHIVE_BATCH_SIZE = int(os.environ.get("SQUAD_MESSAGE_ARCHIVE_BATCH_SIZE", "500"))
+# Chat search ranks only the newest this many matches in a squad, which
+# bounds the cost of common words in long histories (app.squads.search)
+MESSAGE_SEARCH_CANDIDATES = int(os.environ.get("MESSAGE_SEARCH_CANDIDATES", "1000"))
+
+# Unread chat counts stop at this many per squad, so a squad left unread
+# for months costs no more to count than a quiet one (app.squads.unread)
+SQUAD_UNREAD_COUNT_CAP = int(os.environ.get("SQUAD_UNREAD_COUNT_CAP", "100"))
+
+# Most usernames/emails one bulk invite may resolve, and most
+# username autocomplete suggestions per request
+SQUAD_BULK_INVITE_MAX = int(os.environ.get("SQUAD_BULK_INVITE_MAX", "500"))
+USER_SEARCH_MAX_RESULTS = 20
+
+# Transactional outbox consumer (app.tasks.outbox)
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "500"))
+# enqueue a drain right after each commit; with "0" only the periodic drain runs
+OUTBOX_DRAIN_ON_COMMIT = os.environ.get("OUTBOX_DRAIN_ON_COMMIT", "1") == "1"
+# processed events are deleted this many days after processing (nightly)
+OUTBOX_RETENTION_DAYS = int(os.environ.get("OUTBOX_RETENTION_DAYS", "7"))
+
+# Run edits/deletes allowed per user in any rolling 7 days
+RUN_EDITS_PER_WEEK = int(os.environ.get("RUN_EDITS_PER_WEEK", "10"))
+
+# GPS tracks (app.runs.tracks)
+TRACK_MAX_POINTS = int(os.environ.get("TRACK_MAX_POINTS", "200000"))
+TRACK_CACHE_SECONDS = int(os.environ.get("TRACK_CACHE_SECONDS", "86400"))
+
+# Run anomaly scoring (app.runs.anomaly): over a hard limit = excluded from
+# squad aggregates; modified z-score >= RUN_ANOMALY_Z vs own history = flagged
+RUN_MAX_SPEED_KMH = float(os.environ.get("RUN_MAX_SPEED_KMH", "30"))
+RUN_MAX_DISTANCE_KM = float(os.environ.get("RUN_MAX_DISTANCE_KM", "300"))
+RUN_ANOMALY_Z = float(os.environ.get("RUN_ANOMALY_Z", "3.5"))
+RUN_ANOMALY_MIN_HISTORY = int(os.environ.get("RUN_ANOMALY_MIN_HISTORY", "5"))
+
+# Delta sync change log (app.sync): stamp new entries right after each
+# commit; with "0" only the periodic stamp runs
+SYNC_STAMP_ON_COMMIT = os.environ.get("SYNC_STAMP_ON_COMMIT", "1") == "1"
+SYNC_STAMP_BATCH_SIZE = 1000
+SYNC_PAGE_SIZE = int(os.environ.get("SYNC_PAGE_SIZE", "500"))
+SYNC_RETENTION_DAYS = int(os.environ.get("SYNC_RETENTION_DAYS", "30"))
+
+# Nightly columnar snapshot for reports (app.tasks.snapshot): where the
+# segment files live, how many nightly segments a table collects before
+# it is compacted into one, and how many days between forced full
+# rebuilds that pick up writes the change log never saw (0 = never)
+ANALYTICS_SNAPSHOT_DIR = os.environ.get("ANALYTICS_SNAPSHOT_DIR", str(BASE_DIR / "snapshots"))
+ANALYTICS_SNAPSHOT_MAX_SEGMENTS = int(os.environ.get("ANALYTICS_SNAPSHOT_MAX_SEGMENTS", "30"))
+ANALYTICS_SNAPSHOT_FULL_DAYS = int(os.environ.get("ANALYTICS_SNAPSHOT_FULL_DAYS", "7"))
+
+# Cold start (import the WSGI app + first request) budget for profile_imports
+COLD_START_BUDGET_MS = float(os.environ.get("COLD_START_BUDGET_MS", "500"))
+
+# Admin changelists on big tables give up on an exact filtered COUNT(*)
+# after this long and show the planner's estimate (app.common.admin_utils)
+ADMIN_COUNT_TIMEOUT_MS = int(os.environ.get("ADMIN_COUNT_TIMEOUT_MS", "500"))
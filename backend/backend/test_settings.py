@@ -0,0 +1,13 @@
+"""
+Test settings: python manage.py test --settings=backend.test_settings
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+# a second connection to the same database, so the router and pinning
+# tests (app.common.tests) can tell replica reads from primary ones
+if "replica" not in DATABASES:
+    DATABASES["replica"] = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+
+# admin pages render without a collectstatic manifest
+STATICFILES_STORAGE = "django.contrib.staticfiles.storage.StaticFilesStorage"
@@ -1,7 +1,23 @@
-from django.contrib import admin
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path
 from django.http import JsonResponse
-from rest_framework_simplejwt.views import TokenRefreshView
+from django.views.decorators.csrf import csrf_exempt
+
+def lazy_include(module):
+    """
+    include() imports the module, and every view, serializer and model
+    module behind it, as soon as this URLconf loads. Given the dotted path
+    instead, the resolver imports it the first time a request matches the
+    prefix, so a cold start only pays for the app it is serving. Anything
+    that reverse()s a URL still loads them all.
+    """
+    return (module, None, None)
+
+@csrf_exempt
+def token_refresh(request, *args, **kwargs):
+    # simplejwt's views pull in its serializers and token backends
+    from rest_framework_simplejwt.views import TokenRefreshView
+    return TokenRefreshView.as_view()(request, *args, **kwargs)
 
 def api_root(request):
     return JsonResponse({
@@ -14,20 +30,26 @@ def api_root(request):
             "squads": "/api/squads/",
             "leaderboard": "/api/leaderboard/",
             "shop": "/api/shop/",
+            "sync": "/api/sync/",
             "admin": "/admin/"
         }
     })
 
 urlpatterns = [
     path("", api_root, name="api_root"),
-    path("admin/", admin.site.urls),
 
-    path("api/auth/", include("app.authapp.urls")),
-    path("api/runs/", include("app.runs.urls")),
-    path("api/squads/", include("app.squads.urls")),
-    path("api/", include("app.leaderboard.urls")),
-    path("api/debug/", include("app.tasks.urls")),
-    path("api/shop/", include("app.shop.urls")),
+    path("api/auth/", lazy_include("app.authapp.urls")),
+    path("api/runs/", lazy_include("app.runs.urls")),
+    path("api/squads/", lazy_include("app.squads.urls")),
+    path("api/debug/", lazy_include("app.tasks.urls")),
+    path("api/shop/", lazy_include("app.shop.urls")),
+    path("api/sync/", lazy_include("app.sync.urls")),
+    # after the other api/ prefixes, so their requests don't load it
+    path("api/", lazy_include("app.leaderboard.urls")),
 
-    path("api/auth/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("api/auth/token/refresh/", token_refresh, name="token_refresh"),
 ]
+
+if "django.contrib.admin" in settings.INSTALLED_APPS:
+    from django.contrib import admin
+    urlpatterns.insert(1, path("admin/", admin.site.urls))
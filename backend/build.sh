@@ -3,8 +3,11 @@
 # Install dependencies
 pip install -r requirements.txt
 
+# SERVERLESS=0: the serverless profile leaves out the admin and celery
+# beat, but their static files and tables are still needed
+
 # Collect static files
-python manage.py collectstatic --noinput
+SERVERLESS=0 python manage.py collectstatic --noinput
 
 # Run migrations
-python manage.py migrate --noinput
+SERVERLESS=0 python manage.py migrate --noinput
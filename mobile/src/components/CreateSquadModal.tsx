@@ -31,6 +31,8 @@ export default function CreateSquadModal({
         name,
         description,
         is_private: isPrivate,
+        // squad weeks run Monday-to-Monday in the creator's local timezone
+        timezone: Intl.DateTimeFormat().resolvedOptions().timeZone || "UTC",
       });
     },
     onSuccess: () => {
@@ -55,7 +55,7 @@ export default function SquadScreen({ route }: any) {
               {detailData?.squad?.name || squadName || "Squad"}
             </Text>
             <Text style={styles.sub}>
-              Members: {detailData?.squad?.members?.length || 0}
+              Members: {detailData?.squad?.member_count || 0}
             </Text>
           </View>
           <Text style={styles.owner}>